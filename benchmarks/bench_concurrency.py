@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Concurrent-connection benchmark for comparing WSGI and ASGI deployments.
+
+Opens N keep-alive connections that each hammer one URL for a fixed
+duration, then reports throughput, latency percentiles, load-shedding 503s
+and other errors. Install the servers (pip install -r mahitaji-dev.txt),
+start them with the per-process concurrency caps lifted (otherwise, at a few
+hundred connections, both modes mostly measure LoadSheddingMiddleware's
+fast 503s), then point this at each:
+
+    export CONCURRENCY_LIMITS_ENABLED=False
+    # WSGI (threaded workers)
+    gunicorn -w 4 --threads 8 -b 127.0.0.1:8000 marketplace_420.wsgi
+    # ASGI (event loop workers)
+    uvicorn --workers 4 --port 8001 marketplace_420.asgi:application
+
+    python benchmarks/bench_concurrency.py http://127.0.0.1:8000/store/api/client-info/ -c 50 100 500
+    python benchmarks/bench_concurrency.py http://127.0.0.1:8001/store/api/client-info/ -c 50 100 500
+
+Only the standard library is used, so it runs from any environment.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def _request(reader, writer, host, path, cookie):
+    headers = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n"
+    if cookie:
+        headers += f"Cookie: {cookie}\r\n"
+    writer.write((headers + "\r\n").encode())
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    version, status = status_line.split()[:2]
+    status = int(status)
+    length, set_cookie = 0, None
+    keep_alive = version == b'HTTP/1.1'
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'set-cookie' and value.strip().startswith('sessionid='):
+            set_cookie = value.strip().split(';', 1)[0]
+        elif name == 'connection':
+            keep_alive = value.strip().lower() == 'keep-alive' or (keep_alive and value.strip().lower() != 'close')
+    if length:
+        await reader.readexactly(length)
+    elif not keep_alive:
+        await reader.read()
+    return status, set_cookie, keep_alive
+
+
+async def _worker(url, deadline, latencies, shed, errors):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    path = parts.path + (f"?{parts.query}" if parts.query else '')
+    cookie = None
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            started = time.monotonic()
+            status, set_cookie, keep_alive = await _request(reader, writer, parts.netloc, path, cookie)
+            cookie = set_cookie or cookie  # behave like one returning visitor per connection
+            if not keep_alive:
+                writer.close()
+                reader = writer = None
+            if status == 503:
+                shed.append(status)
+            elif status >= 400:
+                errors.append(status)
+            else:
+                latencies.append(time.monotonic() - started)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            errors.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def run(url, concurrency, duration):
+    latencies, shed, errors = [], [], []
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(_worker(url, deadline, latencies, shed, errors) for _ in range(concurrency)))
+    return latencies, shed, errors
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1] if len(values) > 1 else values[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url')
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('-d', '--duration', type=float, default=10.0, help='Seconds per concurrency level')
+    args = parser.parse_args()
+
+    print(f"{'conns':>6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'503s':>7} {'errors':>7}")
+    for concurrency in args.concurrency:
+        latencies, shed, errors = asyncio.run(run(args.url, concurrency, args.duration))
+        # req/s and percentiles count served requests only; shed ones are the 503s column
+        print(
+            f"{concurrency:>6} {len(latencies) / args.duration:>9.1f} "
+            f"{_percentile(latencies, 50) * 1000:>8.1f} {_percentile(latencies, 99) * 1000:>8.1f} "
+            f"{len(shed):>7} {len(errors):>7}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Throughput benchmark for order message encryption (store.messaging).
+
+Encrypts N messages spread over a number of orders, then decrypts them the
+way the inbox does: one page per order through decrypt_many. Reports
+messages/sec for each, plus the cost of a cold per-order key derivation.
+
+    python benchmarks/bench_messages.py -n 20000 --orders 200 --size 280
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from store.messaging import MessageCipher  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--messages', type=int, default=20000)
+    parser.add_argument('--orders', type=int, default=200)
+    parser.add_argument('--size', type=int, default=280, help='Plaintext length in characters')
+    parser.add_argument('--page', type=int, default=50, help='Messages per decrypt_many call')
+    args = parser.parse_args()
+
+    cipher = MessageCipher(os.urandom(32), cache_size=max(args.orders, 1))
+    orders = [uuid.uuid4() for _ in range(args.orders)]
+    text = ('x' * args.size)
+
+    started = time.perf_counter()
+    for order_number in orders:
+        cipher.for_order(order_number)
+    derive = (time.perf_counter() - started) / len(orders)
+
+    started = time.perf_counter()
+    tokens = [
+        (orders[i % len(orders)], cipher.encrypt(orders[i % len(orders)], 'order_update', text))
+        for i in range(args.messages)
+    ]
+    encrypt = time.perf_counter() - started
+
+    by_order = {}
+    for order_number, token in tokens:
+        by_order.setdefault(order_number, []).append(('order_update', cipher.key_id, token))
+    started = time.perf_counter()
+    decrypted = 0
+    for order_number, rows in by_order.items():
+        for i in range(0, len(rows), args.page):
+            decrypted += sum(1 for content in cipher.decrypt_many(order_number, rows[i:i + args.page]) if content)
+    decrypt = time.perf_counter() - started
+    assert decrypted == args.messages
+
+    print(f"key derivation: {derive * 1e6:.1f} us/order (cached afterwards)")
+    print(f"encrypt: {args.messages / encrypt:,.0f} msg/s")
+    print(f"decrypt: {args.messages / decrypt:,.0f} msg/s (pages of {args.page})")
+
+
+if __name__ == '__main__':
+    main()
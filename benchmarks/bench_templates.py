@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Render benchmark for the storefront templates: Django engine vs Jinja2.
+
+Renders the product list and the cart with N in-memory products (no
+database involved) through both engines, checks that they produce the
+same HTML, and reports milliseconds per render for each.
+
+    python benchmarks/bench_templates.py -n 1000 --repeat 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'marketplace_420.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.template.utils import EngineHandler  # noqa: E402
+
+from core.context_processors import site_settings  # noqa: E402
+from store.models import CartItem, Product  # noqa: E402
+from store.money import sats_to_btc  # noqa: E402
+
+
+def make_products(count):
+    return [
+        Product(
+            pk=i, name=f'Product {i} "special" & <new>',
+            description=f'Description of product {i}, ' * 8,
+            price=Decimal(i) + Decimal('0.99'), price_sats=i * 1000,
+            max_per_order=5,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def time_render(template, context, repeat):
+    template.render(dict(context))  # warm up (and compile)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        template.render(dict(context))
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--products', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    engines = EngineHandler([settings.TEMPLATES[0], settings.JINJA2_TEMPLATE_ENGINE])
+    products = make_products(args.products)
+    items = [CartItem(product=product, quantity=2) for product in products]
+    pages = {
+        'store/product_list.html': {'products': products, 'cart_count': 3},
+        'store/cart.html': {
+            'cart_items': items,
+            'cart_total': sats_to_btc(sum(item.price_sats * item.quantity for item in items)),
+            'cart_count': len(items),
+        },
+    }
+
+    print(f"{'template':<28}{'django ms':>12}{'jinja2 ms':>12}{'speedup':>10}")
+    for name, context in pages.items():
+        context = {**site_settings(None), **context}
+        django_template = engines['django'].get_template(name)
+        jinja_template = engines['jinja2'].get_template(name)
+        if django_template.render(dict(context)) != jinja_template.render(dict(context)):
+            sys.exit(f"{name}: engines disagree, run the StorefrontTemplateParityTests")
+        django_ms = time_render(django_template, context, args.repeat)
+        jinja_ms = time_render(jinja_template, context, args.repeat)
+        print(f"{name:<28}{django_ms:>12.2f}{jinja_ms:>12.2f}{django_ms / jinja_ms:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
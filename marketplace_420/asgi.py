@@ -10,7 +10,13 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 import os
 
 from django.core.asgi import get_asgi_application
+from django.urls import get_resolver
+
+from marketplace_420.startup import startup_gc
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'marketplace_420.settings')
 
-application = get_asgi_application()
+with startup_gc():
+    application = get_asgi_application()
+    # Load the URLconf (views, admin) now rather than on a worker's first request
+    get_resolver().url_patterns
@@ -0,0 +1,34 @@
+# marketplace_420/jinja2.py
+from django.template import defaultfilters
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.formats import localize
+from django.utils.html import conditional_escape
+from django.utils.timezone import template_localtime
+from jinja2 import ChainableUndefined, Environment
+
+
+def url(viewname, *args, **kwargs):
+    return reverse(viewname, args=args or None, kwargs=kwargs or None)
+
+
+def finalize(value):
+    # Print values the way the Django engine does (local time, localized
+    # numbers, Django's escaping), so both engines emit the same bytes
+    return conditional_escape(localize(template_localtime(value)))
+
+
+def environment(**options):
+    """Jinja2 environment for the storefront templates in jinja2/ (mirrors of templates/)."""
+    # Missing attributes render as '' instead of raising, like Django variables
+    options['undefined'] = ChainableUndefined
+    env = Environment(keep_trailing_newline=True, finalize=finalize, **options)
+    env.globals.update(url=url, static=static)
+    # Django's semantics for the filters the storefront uses ('default' applies to any falsy value)
+    env.filters.update(
+        date=defaultfilters.date,
+        default=defaultfilters.default,
+        truncatechars=defaultfilters.truncatechars,
+        truncatewords=defaultfilters.truncatewords,
+    )
+    return env
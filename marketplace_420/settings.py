@@ -2,12 +2,12 @@ import os
 from pathlib import Path
 import environ
 
-# Initialize environment
-env = environ.Env()
-environ.Env.read_env()
-
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Initialize environment (explicit path: no stack inspection to find .env, same file from any cwd)
+env = environ.Env()
+environ.Env.read_env(BASE_DIR / '.env')
+
 SECRET_KEY = env('SECRET_KEY', default='insecure-default-key-change-me')
 DEBUG = env.bool('DEBUG', default=True)
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=['localhost', '127.0.0.1' , '172.29.119.43'])
@@ -28,6 +28,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'store.middleware.RateLimitMiddleware',
+    'store.middleware.LoadSheddingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,7 +58,24 @@ TEMPLATES = [
     },
 ]
 
+# Storefront pages can render with Jinja2 instead ('jinja2'; needs the Jinja2 package).
+# Its templates mirror templates/ under jinja2/; the admin always uses the Django engine.
+STOREFRONT_TEMPLATE_ENGINE = env('STOREFRONT_TEMPLATE_ENGINE', default='django')
+JINJA2_TEMPLATE_ENGINE = {
+    'BACKEND': 'django.template.backends.jinja2.Jinja2',
+    'DIRS': [os.path.join(BASE_DIR, 'jinja2')],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        'environment': 'marketplace_420.jinja2.environment',
+        'context_processors': TEMPLATES[0]['OPTIONS']['context_processors'],
+    },
+}
+if STOREFRONT_TEMPLATE_ENGINE == 'jinja2':
+    TEMPLATES.append(JINJA2_TEMPLATE_ENGINE)
+
 WSGI_APPLICATION = 'marketplace_420.wsgi.application'
+# ASGI mode: uvicorn/daphne marketplace_420.asgi:application
+ASGI_APPLICATION = 'marketplace_420.asgi.application'
 
 # Database
 DATABASES = {
@@ -66,6 +85,22 @@ DATABASES = {
     }
 }
 
+# Caches. 'default' is per process. 'shared' is seen by every worker and management
+# command: change stamps (catalog, stations, recommendations) live there, so a bump
+# anywhere invalidates what each process derived. The file cache covers one host;
+# point SHARED_CACHE_URL at Redis/memcached (redis://127.0.0.1:6379/1) for several.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+    'shared': env.cache('SHARED_CACHE_URL', default=f"filecache://{BASE_DIR / 'var' / 'cache'}"),
+}
+
+# Part of the catalog pages' ETags, so a deploy retires them (e.g. the release's git commit).
+# Empty: a hash of the code and template files' sizes and mtimes (store.versions).
+DEPLOY_VERSION = env('DEPLOY_VERSION', default='')
+
+# Runs the suite on per-process caches, away from the ones live processes share
+TEST_RUNNER = 'marketplace_420.test_runner.LocalCacheTestRunner'
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -80,11 +115,95 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Receiving address pool (pre-derived from a watch-only xpub by `manage.py refill_address_pool`)
+ADDRESS_POOL_XPUB = env('ADDRESS_POOL_XPUB', default='')
+ADDRESS_POOL_SIZE = env.int('ADDRESS_POOL_SIZE', default=500)
+ADDRESS_POOL_LOW_WATER = env.int('ADDRESS_POOL_LOW_WATER', default=100)
+ADDRESS_POOL_AUTO_REFILL = env.bool('ADDRESS_POOL_AUTO_REFILL', default=True)
+
+# Reverse DNS for client_info (store.resolver.StubResolver in tests). REVERSE_DNS_OPTIONS
+# holds extra constructor arguments, e.g. {'hosts': {ip: hostname}} for the stub.
+REVERSE_DNS_RESOLVER = env('REVERSE_DNS_RESOLVER', default='store.resolver.ReverseDNSResolver')
+REVERSE_DNS_OPTIONS = {}
+REVERSE_DNS_TIMEOUT = env.float('REVERSE_DNS_TIMEOUT', default=0.5)
+REVERSE_DNS_TTL = env.int('REVERSE_DNS_TTL', default=3600)
+REVERSE_DNS_NEGATIVE_TTL = env.int('REVERSE_DNS_NEGATIVE_TTL', default=300)
+
+# Sessions only carry client_session_id, so keep django_session off the request path:
+# cached_db reads from the cache and only writes when the session changes. Use
+# 'django.contrib.sessions.backends.signed_cookies' to drop the table entirely
+# (admin logouts then can't revoke a copied cookie). Purge with `manage.py purge_sessions`.
+# The session cache must be one every worker sees, or a logout/flush in one worker leaves
+# the others serving their stale copy until it expires: hence 'shared', not 'default'.
+SESSION_ENGINE = env('SESSION_ENGINE', default='django.contrib.sessions.backends.cached_db')
+SESSION_CACHE_ALIAS = env('SESSION_CACHE_ALIAS', default='shared')
+SESSION_SAVE_EVERY_REQUEST = False
+
+# Reverse proxies in front of the app that append to X-Forwarded-For. 0 (direct
+# exposure) means the client address is REMOTE_ADDR and the header is ignored.
+TRUSTED_PROXY_HOPS = env.int('TRUSTED_PROXY_HOPS', default=0)
+
+# Rate limits for the write-heavy JSON endpoints, per session and per IP ('count/s|m|h|d').
+# Loopback addresses get no IP bucket: on the .onion deployment every visitor arrives
+# from the local Tor daemon as 127.0.0.1, so only the session bucket applies there.
+# CacheBuckets keeps the buckets in the 'shared' cache, one limit across all workers.
+RATE_LIMIT_BACKEND = env('RATE_LIMIT_BACKEND', default='store.ratelimit.InMemoryBuckets')  # or CacheBuckets
+RATE_LIMITS = {
+    'add_to_cart': env('RATE_LIMIT_ADD_TO_CART', default='30/m'),
+    'remove_from_cart': env('RATE_LIMIT_REMOVE_FROM_CART', default='30/m'),
+    'batch': env('RATE_LIMIT_BATCH', default='20/m'),
+    'create_order': env('RATE_LIMIT_CREATE_ORDER', default='5/m'),
+    'send_message': env('RATE_LIMIT_SEND_MESSAGE', default='10/m'),
+}
+
+# Adaptive in-flight caps per endpoint class and worker process. 'limit' is the starting
+# cap, adapted between min_limit and max_limit to keep latency (EWMA, seconds) under
+# target_latency; excess requests queue up to queue_timeout seconds (at most max_queue
+# of them, default = limit), then get 503 + Retry-After. Drop a class to leave it uncapped.
+CONCURRENCY_LIMITS = {
+    'browse': {'limit': 32, 'max_limit': 128, 'target_latency': 0.3, 'queue_timeout': 0.5},
+    'poll': {'limit': 16, 'max_limit': 64, 'target_latency': 0.2, 'queue_timeout': 0.5},
+    'cart': {'limit': 16, 'max_limit': 64, 'target_latency': 0.5, 'queue_timeout': 1.0},
+    # One SQLite writer: a few concurrent checkouts beat many waiting on the lock
+    'checkout': {'limit': 4, 'max_limit': 16, 'target_latency': 1.0, 'queue_timeout': 2.0, 'max_queue': 32},
+    'admin': {'limit': 4, 'max_limit': 16, 'target_latency': 2.0, 'queue_timeout': 5.0},
+}
+# CONCURRENCY_LIMITS_ENABLED=False lifts every cap (e.g. for benchmarks/bench_concurrency.py)
+if not env.bool('CONCURRENCY_LIMITS_ENABLED', default=True):
+    CONCURRENCY_LIMITS = {}
+
+# Order messages: AES-GCM with per-order keys derived from this base64 32-byte key
+# (falls back to one derived from SECRET_KEY). Bump MESSAGE_KEY_ID when rotating.
+MESSAGE_ENCRYPTION_KEY = env('MESSAGE_ENCRYPTION_KEY', default='')
+MESSAGE_KEY_ID = env('MESSAGE_KEY_ID', default='v1')
+
+# Admin sales dashboard (reads the order rollups; cached this many seconds)
+DASHBOARD_CACHE_TTL = env.int('DASHBOARD_CACHE_TTL', default=60)
+
+# Pre-rendered catalog pages (`manage.py build_static_site`), kept current as products
+# change. Serve with nginx `try_files $uri/index.html @django;`. Unset disables it.
+# Changes are batched for STATIC_SITE_DEBOUNCE seconds and rendered off the request thread.
+STATIC_SITE_DIR = env('STATIC_SITE_DIR', default='')
+STATIC_SITE_DEBOUNCE = env.float('STATIC_SITE_DEBOUNCE', default=2.0)
+
+# Payment QR codes (content-addressed, LRU-evicted)
+QR_CACHE_DIR = env('QR_CACHE_DIR', default=os.path.join(MEDIA_ROOT, 'qr'))
+QR_CACHE_MAX_ENTRIES = env.int('QR_CACHE_MAX_ENTRIES', default=10000)
+
 # Custom settings
 BITCOIN_WALLET_ADDRESS = env('BITCOIN_WALLET_ADDRESS', default='12345')
 COMMISSION_RATE = env.float('COMMISSION_RATE', default=0.05)
 SITE_NAME = env('SITE_NAME', default='420')
 
+# BTC exchange rate (refreshed by `manage.py refresh_btc_rate`, never on the request path)
+BTC_RATE_PROVIDER = env('BTC_RATE_PROVIDER', default='store.rates.CoinbaseRateProvider')
+BTC_RATE_CURRENCY = env('BTC_RATE_CURRENCY', default='USD')
+BTC_RATE_TTL = env.int('BTC_RATE_TTL', default=300)
+BTC_RATE_TIMEOUT = env.float('BTC_RATE_TIMEOUT', default=5.0)
+BTC_RATE_URL = env('BTC_RATE_URL', default='')
+BTC_RATE_FILE = env('BTC_RATE_FILE', default=os.path.join(BASE_DIR, 'btc_rate.json'))
+BTC_RATE_STATIC = env('BTC_RATE_STATIC', default='')
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 SITE_ID = 1
@@ -162,6 +281,9 @@ JAZZMIN_SETTINGS = {
     # Custom menus
     "custom_links": {
         "store": [{
+            "name": "Sales dashboard",
+            "url": "admin:store_order_dashboard",
+            "icon": "fas fa-chart-line",
             "permissions": ["store.view_order"]
         }]
     },
@@ -0,0 +1,24 @@
+"""
+Test runner that keeps the suite out of the caches running processes use.
+"""
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+# 'shared' is a file cache other processes read: a test bumping the catalog
+# version or saving a session there would reach them. Tests needing a cache that
+# spans processes override CACHES themselves.
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+class LocalCacheTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.local_caches = override_settings(CACHES=LOCAL_CACHES)
+        self.local_caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.local_caches.disable()
+        super().teardown_test_environment(**kwargs)
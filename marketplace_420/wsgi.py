@@ -10,7 +10,13 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+
+from marketplace_420.startup import startup_gc
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'marketplace_420.settings')
 
-application = get_wsgi_application()
+with startup_gc():
+    application = get_wsgi_application()
+    # Load the URLconf (views, admin) now rather than on a worker's first request
+    get_resolver().url_patterns
@@ -0,0 +1,203 @@
+# store/addresses.py
+import hashlib
+import hmac
+import logging
+import random
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Max
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import ReceivingAddress
+
+logger = logging.getLogger(__name__)
+
+# Sent when the number of available addresses drops below ADDRESS_POOL_LOW_WATER.
+address_pool_low = Signal()
+
+# Extended public key version bytes -> (address type its wallets watch, network).
+# xpub/tpub are BIP44 keys (legacy P2PKH), zpub/vpub BIP84 (native segwit P2WPKH):
+# paying an address type the wallet doesn't scan for looks like a lost payment.
+XPUB_VERSIONS = {
+    bytes.fromhex('0488b21e'): ('p2pkh', 'main'),  # xpub
+    bytes.fromhex('04b24746'): ('p2wpkh', 'main'),  # zpub
+    bytes.fromhex('043587cf'): ('p2pkh', 'test'),  # tpub
+    bytes.fromhex('045f1cf6'): ('p2wpkh', 'test'),  # vpub
+}
+# Network -> (P2PKH base58 version byte, bech32 human-readable part)
+NETWORKS = {'main': (0x00, 'bc'), 'test': (0x6f, 'tb')}
+CLAIM_WINDOW = 8
+CLAIM_ATTEMPTS = 3
+
+
+class AddressPoolEmpty(Exception):
+    pass
+
+
+class AddressDerivationError(Exception):
+    pass
+
+
+# ----------------------------
+# BIP32 public derivation (watch-only: no private keys here)
+# ----------------------------
+class ExtendedPublicKey:
+    def __init__(self, key, chain_code, address_type, network):
+        self.key = key  # 33-byte compressed public key
+        self.chain_code = chain_code
+        self.address_type = address_type
+        self.network = network
+
+    @classmethod
+    def from_string(cls, xpub):
+        from bitcoin.base58 import decode
+
+        try:
+            raw = decode(xpub)
+        except Exception as e:
+            raise AddressDerivationError(f"Invalid extended public key: {e}")
+        if len(raw) != 82:
+            raise AddressDerivationError('Invalid extended public key length')
+        payload, checksum = raw[:78], raw[78:]
+        if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+            raise AddressDerivationError('Invalid extended public key checksum')
+        version = XPUB_VERSIONS.get(payload[:4])
+        if version is None:
+            raise AddressDerivationError('Unsupported extended key version (need xpub/zpub/tpub/vpub)')
+        return cls(payload[45:78], payload[13:45], *version)
+
+    @property
+    def fingerprint(self):
+        return hashlib.sha256(self.key + self.chain_code).hexdigest()[:16]
+
+    def child(self, index):
+        """CKDpub: derive non-hardened child ``index``."""
+        from ecdsa import SECP256k1, VerifyingKey
+
+        if index >= 0x80000000:
+            raise AddressDerivationError('Cannot derive hardened children from a public key')
+        digest = hmac.new(self.chain_code, self.key + index.to_bytes(4, 'big'), hashlib.sha512).digest()
+        tweak = int.from_bytes(digest[:32], 'big')
+        if tweak >= SECP256k1.order:
+            raise AddressDerivationError(f"Invalid child {index}")
+        parent = VerifyingKey.from_string(self.key, curve=SECP256k1).pubkey.point
+        point = SECP256k1.generator * tweak + parent
+        key = bytes([2 + (point.y() & 1)]) + point.x().to_bytes(32, 'big')
+        return ExtendedPublicKey(key, digest[32:], self.address_type, self.network)
+
+    def address(self):
+        """The key's address, of the type the key's version bytes call for."""
+        from bitcoin import segwit_addr
+        from bitcoin.base58 import CBase58Data
+        from bitcoin.core import Hash160
+
+        p2pkh_version, hrp = NETWORKS[self.network]
+        if self.address_type == 'p2wpkh':
+            return segwit_addr.encode(hrp, 0, Hash160(self.key))
+        return str(CBase58Data.from_bytes(Hash160(self.key), p2pkh_version))
+
+
+def derive_addresses(xpub, start, count):
+    """Yield (index, address) on the external chain (xpub/0/i)."""
+    external = ExtendedPublicKey.from_string(xpub).child(0)
+    for index in range(start, start + count):
+        yield index, external.child(index).address()
+
+
+# ----------------------------
+# Pool
+# ----------------------------
+def available_addresses():
+    return ReceivingAddress.objects.filter(status=ReceivingAddress.AVAILABLE)
+
+
+def refill_pool(xpub=None, target=None, batch_size=100):
+    """
+    Top the pool up to ``target`` available addresses. Returns how many this
+    call inserted (rows a concurrent refill inserted first aren't counted).
+    """
+    xpub = xpub or settings.ADDRESS_POOL_XPUB
+    if not xpub:
+        raise AddressDerivationError('ADDRESS_POOL_XPUB is not set')
+    target = target or settings.ADDRESS_POOL_SIZE
+    chain = ExtendedPublicKey.from_string(xpub).fingerprint
+    chain_addresses = ReceivingAddress.objects.filter(chain=chain)
+
+    added = 0
+    needed = target - available_addresses().count()
+    while needed > 0:
+        last = chain_addresses.aggregate(last=Max('derivation_index'))['last']
+        start = 0 if last is None else last + 1
+        count = min(batch_size, needed)
+        batch = chain_addresses.filter(derivation_index__gte=start, derivation_index__lt=start + count)
+        before = batch.count()
+        ReceivingAddress.objects.bulk_create(
+            [ReceivingAddress(address=address, chain=chain, derivation_index=index)
+             for index, address in derive_addresses(xpub, start, count)],
+            ignore_conflicts=True,
+        )
+        added += batch.count() - before
+        needed = target - available_addresses().count()
+    return added
+
+
+_refill_lock = threading.Lock()
+
+
+def _refill_in_background():
+    if not _refill_lock.acquire(blocking=False):
+        return  # a refill is already running in this process
+
+    def run():
+        try:
+            refill_pool()
+        except Exception:
+            logger.exception('Address pool refill failed')
+        finally:
+            # Threads get their own DB connections, which nothing else would close
+            connections.close_all()
+            _refill_lock.release()
+
+    threading.Thread(target=run, name='address-pool-refill', daemon=True).start()
+
+
+def check_low_water():
+    low_water = settings.ADDRESS_POOL_LOW_WATER
+    # Bounded count: never scans more than low_water index entries
+    remaining = available_addresses()[:low_water].count()
+    if remaining < low_water:
+        logger.warning('Receiving address pool low: %s available', remaining)
+        address_pool_low.send(sender=ReceivingAddress, remaining=remaining)
+        if settings.ADDRESS_POOL_AUTO_REFILL and settings.ADDRESS_POOL_XPUB:
+            _refill_in_background()
+    return remaining
+
+
+def claim_address():
+    """
+    Atomically take an available address for checkout and return it. Call
+    it inside the order's transaction, so the address goes back to the pool
+    if the order isn't created. Candidates come from the head of the
+    (status, derivation_index) index. Each one is claimed with a conditional
+    single-row UPDATE, so concurrent checkouts don't block each other. A
+    lost race just moves on to the next candidate.
+    """
+    for _ in range(CLAIM_ATTEMPTS):
+        candidates = list(available_addresses().order_by('derivation_index').only('address')[:CLAIM_WINDOW])
+        if not candidates:
+            break
+        random.shuffle(candidates)
+        for candidate in candidates:
+            claimed = ReceivingAddress.objects.filter(pk=candidate.pk, status=ReceivingAddress.AVAILABLE).update(
+                status=ReceivingAddress.ASSIGNED, assigned_at=timezone.now()
+            )
+            if claimed:
+                transaction.on_commit(check_low_water)
+                return candidate
+
+    # The caller's transaction rolls back, so don't wait for a commit
+    check_low_water()
+    raise AddressPoolEmpty('No receiving addresses available')
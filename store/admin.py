@@ -1,36 +1,207 @@
 # store/admin.py
-from django.contrib import admin
-from .models import Product, Order, OrderItem, DeliveryStation, BitcoinWallet
+import uuid
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ALL_VAR, ChangeList, ORDER_VAR, PAGE_VAR
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from .dashboard import DASHBOARD_WINDOWS, DEFAULT_WINDOW, get_dashboard
+from .events import record_status_change, save_order_status
+from .exports import stream_orders
+from .imports import IMPORT_FORMATS, import_products, read_upload
+from .models import Product, Order, OrderItem, DeliveryStation, BitcoinWallet, ReceivingAddress
+from .paginators import CursorPaginator
+
+CURSOR_VAR = 'cursor'
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ['product', 'quantity', 'price']
 
+def get_cursor(request):
+    """The ``?cursor=<pk>`` of a changelist request, when cursor paging applies."""
+    if ORDER_VAR in request.GET or ALL_VAR in request.GET:
+        return None
+    try:
+        return int(request.GET[CURSOR_VAR])
+    except (KeyError, ValueError):
+        return None
+
+class CursorChangeList(ChangeList):
+    """
+    Changelist that pages by primary key (``?cursor=<pk>``) instead of OFFSET,
+    so deep pages cost the same as the first one. Only used with the default
+    ``-pk`` ordering; sorting by a column falls back to normal paging. The
+    cursor itself is applied by CursorPaginator.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def uses_cursor(self, request):
+        return ORDER_VAR not in request.GET and not self.show_all
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.next_cursor = None
+        self.next_cursor_query = ''
+        if self.uses_cursor(request) and self.multi_page:
+            rows = list(self.result_list)
+            if len(rows) == self.list_per_page:
+                self.next_cursor = rows[-1].pk
+                self.next_cursor_query = self.get_query_string(
+                    {CURSOR_VAR: self.next_cursor}, [PAGE_VAR]
+                )
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['order_number', 'email', 'status', 'list_products', 'total_amount', 'created_at', 'payment_confirmed']  # Added list_products here
     list_filter = ['status', 'payment_confirmed', 'created_at']
-    search_fields = ['order_number', 'email', 'delivery_address']
-    readonly_fields = ['order_number', 'created_at', 'updated_at', 'total_amount']
+    search_fields = ['order_number', 'email']
+    search_help_text = 'Exact order number, exact email or email prefix'
+    readonly_fields = ['order_number', 'created_at', 'updated_at', 'total_amount', 'receiving_address']
     inlines = [OrderItemInline]
+    ordering = ['-pk']
+    paginator = CursorPaginator
+    show_full_result_count = False
+    actions = ['export_csv', 'export_jsonl']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+        )
+
+    def get_changelist(self, request, **kwargs):
+        return CursorChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, cursor=get_cursor(request))
+
+    def get_urls(self):
+        return [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard_view), name='store_order_dashboard'),
+        ] + super().get_urls()
+
+    def dashboard_view(self, request):
+        if not self.has_view_permission(request):
+            return redirect('admin:index')
+
+        window = request.GET.get('window')
+        if window not in DASHBOARD_WINDOWS:
+            window = DEFAULT_WINDOW
+        dashboard = get_dashboard(window, refresh='refresh' in request.GET)
 
-    # Fixed method - uses the correct related name 'items'
+        return TemplateResponse(request, 'admin/store/order/dashboard.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Sales dashboard',
+            'dashboard': dashboard,
+            'windows': DASHBOARD_WINDOWS,
+            'age_seconds': int((timezone.now() - dashboard['computed_at']).total_seconds()),
+        })
+
+    def get_search_results(self, request, queryset, search_term):
+        # Only indexed lookups: order_number (unique) and email (db_index).
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        try:
+            return queryset.filter(order_number=uuid.UUID(search_term)), False
+        except ValueError:
+            pass
+        if '@' in search_term:
+            return queryset.filter(email=search_term), False
+        return queryset.filter(email__startswith=search_term), False
+
+    def _export(self, queryset, export_format, content_type):
+        response = StreamingHttpResponse(
+            stream_orders(queryset, export_format), content_type=content_type
+        )
+        filename = f"orders-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.action(description='Export selected orders (CSV)')
+    def export_csv(self, request, queryset):
+        return self._export(queryset, 'csv', 'text/csv')
+
+    @admin.action(description='Export selected orders (JSONL)')
+    def export_jsonl(self, request, queryset):
+        return self._export(queryset, 'jsonl', 'application/x-ndjson')
+
+    def save_model(self, request, obj, form, change):
+        # Status edits go through the event log like any other status change
+        if not change:
+            super().save_model(request, obj, form, change)
+            record_status_change(obj, '')
+        elif 'status' in form.changed_data:
+            save_order_status(obj, form.initial.get('status'))
+        else:
+            super().save_model(request, obj, form, change)
+
+    # Fixed method - uses the correct related name 'items' (prefetched in get_queryset)
     def list_products(self, obj):
         return ", ".join([f"{item.quantity}x {item.product.name}" for item in obj.items.all()])
     list_products.short_description = 'Products'
 
+class ProductImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV with a header row, or JSONL; rows are matched on sku')
+    format = forms.ChoiceField(choices=[(f, f.upper()) for f in IMPORT_FORMATS])
+    dry_run = forms.BooleanField(required=False, help_text='Report what would change without writing')
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'price', 'quantity', 'is_available']
+    list_display = ['sku', 'name', 'price', 'quantity', 'is_available']
     list_editable = ['price', 'quantity', 'is_available']
-    search_fields = ['name']
+    search_fields = ['sku', 'name']
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='store_product_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_change_permission(request) or not self.has_add_permission(request):
+            return redirect('admin:store_product_changelist')
+
+        form = ProductImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            result = import_products(
+                read_upload(form.cleaned_data['file'], form.cleaned_data['format']),
+                dry_run=form.cleaned_data['dry_run'],
+            )
+            for line_no, error in result.errors[:10]:
+                messages.warning(request, f"Line {line_no}: {error}")
+            messages.success(request, result.summary())
+            return redirect('admin:store_product_changelist')
+
+        return TemplateResponse(request, 'admin/store/product/import.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': 'Import products',
+        })
 
 @admin.register(DeliveryStation)
 class DeliveryStationAdmin(admin.ModelAdmin):
-    list_display = ['name', 'location', 'is_active']
+    list_display = ['name', 'location', 'latitude', 'longitude', 'is_active']
 
 @admin.register(BitcoinWallet)
 class BitcoinWalletAdmin(admin.ModelAdmin):
     list_display = ['address', 'balance', 'last_checked']
     readonly_fields = ['last_checked']
+
+@admin.register(ReceivingAddress)
+class ReceivingAddressAdmin(admin.ModelAdmin):
+    list_display = ['address', 'derivation_index', 'status', 'assigned_at']
+    list_filter = ['status']
+    search_fields = ['=address']
+    readonly_fields = ['address', 'chain', 'derivation_index', 'created_at', 'assigned_at']
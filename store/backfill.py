@@ -0,0 +1,177 @@
+# store/backfill.py
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+
+@dataclass
+class BackfillResult:
+    chunks: int = 0
+    rows_processed: int = 0
+    rows_changed: int = 0
+    last_pk: int = 0
+    elapsed: float = 0.0
+    dry_run: bool = False
+    resumed_from: int = 0
+
+    def summary(self):
+        prefix = '[dry run] ' if self.dry_run else ''
+        resumed = f" (resumed after pk {self.resumed_from})" if self.resumed_from else ''
+        return (
+            f"{prefix}{self.rows_changed} of {self.rows_processed} rows changed in "
+            f"{self.chunks} chunks, {self.elapsed:.2f}s{resumed}"
+        )
+
+
+class Backfill(ABC):
+    """
+    Walk ``get_queryset()`` in primary-key order, ``chunk_size`` rows at a
+    time, each chunk in its own short transaction. Progress is stored in
+    BackfillCheckpoint so an interrupted run resumes after the last finished
+    chunk.
+
+    Subclass UpdateBackfill or TransformBackfill, or implement
+    ``process_chunk(queryset)`` directly and return the number of rows
+    changed.
+    """
+    model = None
+    name = None
+    chunk_size = 1000
+    throttle = 0.0  # seconds to sleep between chunks, releases locks for other writers
+
+    def __init__(self, model=None, chunk_size=None, throttle=None, checkpoint=True):
+        # Data migrations pass the historical model and checkpoint=False.
+        if model is not None:
+            self.model = model
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        if throttle is not None:
+            self.throttle = throttle
+        self.checkpoint = checkpoint
+        self.name = self.name or f"{type(self).__module__}.{type(self).__qualname__}"
+
+    def get_queryset(self):
+        return self.model._default_manager.all()
+
+    @abstractmethod
+    def process_chunk(self, queryset):
+        """Change the rows of one chunk and return how many changed."""
+
+    def _load_checkpoint(self, restart):
+        from .models import BackfillCheckpoint
+
+        checkpoint, _ = BackfillCheckpoint.objects.get_or_create(name=self.name)
+        if restart or checkpoint.completed_at:
+            checkpoint.last_pk = 0
+            checkpoint.rows_processed = checkpoint.rows_changed = 0
+            checkpoint.completed_at = None
+            checkpoint.save()
+        return checkpoint
+
+    def run(self, dry_run=False, restart=False, max_chunks=None, progress=None):
+        """
+        Process the remaining chunks. A dry run executes each chunk and rolls it
+        back, so counts are exact but nothing is written, checkpoint included.
+        """
+        checkpoint = None
+        if self.checkpoint and not dry_run:
+            checkpoint = self._load_checkpoint(restart)
+        last_pk = checkpoint.last_pk if checkpoint else 0
+        result = BackfillResult(dry_run=dry_run, resumed_from=last_pk, last_pk=last_pk)
+        started = time.monotonic()
+        base = self.get_queryset().order_by('pk')
+
+        while max_chunks is None or result.chunks < max_chunks:
+            pks = list(base.filter(pk__gt=last_pk).values_list('pk', flat=True)[:self.chunk_size])
+            if not pks:
+                if checkpoint:
+                    checkpoint.completed_at = timezone.now()
+                    checkpoint.save(update_fields=['completed_at', 'updated_at'])
+                break
+
+            with transaction.atomic():
+                changed = self.process_chunk(base.filter(pk__in=pks))
+                if dry_run:
+                    transaction.set_rollback(True)
+                elif checkpoint:
+                    checkpoint.last_pk = pks[-1]
+                    checkpoint.rows_processed += len(pks)
+                    checkpoint.rows_changed += changed
+                    checkpoint.save(update_fields=['last_pk', 'rows_processed', 'rows_changed', 'updated_at'])
+
+            last_pk = pks[-1]
+            result.chunks += 1
+            result.rows_processed += len(pks)
+            result.rows_changed += changed
+            result.last_pk = last_pk
+            if progress:
+                progress(result)
+            if self.throttle:
+                time.sleep(self.throttle)
+
+        result.elapsed = time.monotonic() - started
+        return result
+
+
+class UpdateBackfill(Backfill):
+    """
+    Applies ``get_update_values()`` with a single ``queryset.update()`` per
+    chunk. The values may contain F()/expressions.
+    """
+
+    @abstractmethod
+    def get_update_values(self):
+        """{field: value or expression} to set on every row."""
+
+    def process_chunk(self, queryset):
+        return queryset.update(**self.get_update_values())
+
+
+class TransformBackfill(Backfill):
+    """
+    Calls ``transform(obj)`` on every row and writes the objects it changed
+    with ``bulk_update`` of ``update_fields``.
+    """
+    update_fields = None
+
+    @abstractmethod
+    def transform(self, obj):
+        """Change ``obj`` in place; return True when it changed."""
+
+    def process_chunk(self, queryset):
+        changed = [obj for obj in queryset if self.transform(obj)]
+        if changed:
+            self.model._default_manager.bulk_update(changed, self.update_fields)
+        return len(changed)
+
+
+class BackfillCommand(BaseCommand):
+    """Management command wrapper: set ``backfill_class`` on the subclass."""
+    backfill_class = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Run every chunk and roll it back')
+        parser.add_argument('--restart', action='store_true', help='Ignore the saved checkpoint')
+        parser.add_argument('--chunk-size', type=int)
+        parser.add_argument('--throttle', type=float, help='Seconds to sleep between chunks')
+        parser.add_argument('--max-chunks', type=int, help='Stop after this many chunks (resume later)')
+
+    def handle(self, *args, **options):
+        backfill = self.backfill_class(chunk_size=options['chunk_size'], throttle=options['throttle'])
+        verbose = options['verbosity'] > 1
+
+        def progress(result):
+            if verbose:
+                self.stdout.write(f"  chunk {result.chunks}: up to pk {result.last_pk}, {result.rows_changed} changed")
+
+        result = backfill.run(
+            dry_run=options['dry_run'],
+            restart=options['restart'],
+            max_chunks=options['max_chunks'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(result.summary()))
@@ -0,0 +1,14 @@
+# store/catalog.py
+from .versions import bump_version, get_version
+
+CATALOG_VERSION_KEY = 'store:catalog_version'
+
+
+def get_catalog_version():
+    """Opaque stamp that changes whenever the product catalog changes."""
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """Invalidate everything derived from the catalog, in every process (call once per batch)."""
+    return bump_version(CATALOG_VERSION_KEY)
@@ -0,0 +1,182 @@
+# store/concurrency.py
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+# Endpoint class of each URL name; anything else is 'browse' (admin goes by namespace).
+# 'poll' is the read-only JSON the pages fetch on load or on a timer: it must not queue
+# behind checkouts, and shedding it only delays a refresh.
+ENDPOINT_CLASSES = {
+    'cart_view': 'cart',
+    'add_to_cart': 'cart',
+    'remove_from_cart': 'cart',
+    'batch': 'cart',
+    'create_order': 'checkout',
+    'send_message': 'checkout',
+    'cart_summary': 'poll',
+    'order_status': 'poll',
+    'order_history': 'poll',
+    'order_messages': 'poll',
+    'nearest_stations': 'poll',
+    'client_info': 'poll',
+}
+# Classes serving pages to browsers (503 as HTML); the others answer fetch() calls (JSON)
+HTML_CLASSES = frozenset({'browse', 'admin'})
+BACKOFF = 0.9  # multiplicative decrease when latency is over target
+SMOOTHING = 0.2  # weight of the newest sample in the latency EWMA
+
+
+class _Waiter:
+    __slots__ = ('loop', 'future', 'granted')
+
+    def __init__(self, loop, future):
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+
+class AdaptiveLimiter:
+    """
+    Caps in-flight requests for one endpoint class. Requests over the limit
+    wait up to ``queue_timeout`` in a queue of at most ``max_queue``;
+    anything beyond that is refused at once. The limit adapts AIMD-style to
+    the smoothed latency: it grows by about one per ``limit`` completions
+    while requests are being held back and latency is under
+    ``target_latency``, and is cut by BACKOFF (at most once per target
+    interval) when latency goes over. Works for threads and event loops.
+    """
+
+    def __init__(self, name, limit, max_limit=None, min_limit=1, target_latency=0.5, queue_timeout=1.0,
+                 max_queue=None):
+        self.name = name
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit or limit
+        self.target_latency = target_latency
+        self.queue_timeout = queue_timeout
+        self.max_queue = limit if max_queue is None else max_queue
+        self.in_flight = 0
+        self.queued = 0
+        self.latency = None  # EWMA, seconds
+        self._last_decrease = 0.0
+        self._cond = threading.Condition(threading.Lock())
+        self._waiters = deque()  # async waiters, FIFO
+
+    def _has_room(self):
+        return self.in_flight < int(self.limit)
+
+    def acquire(self):
+        """Take a slot, waiting up to queue_timeout; False means shed the request."""
+        with self._cond:
+            if self._has_room() and not self.queued:
+                self.in_flight += 1
+                return True
+            if self.queued >= self.max_queue:
+                return False
+            self.queued += 1
+            try:
+                if not self._cond.wait_for(self._has_room, self.queue_timeout):
+                    return False
+                self.in_flight += 1
+                return True
+            finally:
+                self.queued -= 1
+
+    async def aacquire(self):
+        with self._cond:
+            if self._has_room() and not self.queued:
+                self.in_flight += 1
+                return True
+            if self.queued >= self.max_queue:
+                return False
+            loop = asyncio.get_running_loop()
+            waiter = _Waiter(loop, loop.create_future())
+            self._waiters.append(waiter)
+            self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            with self._cond:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                    if isinstance(exc, asyncio.CancelledError):
+                        raise
+                    return False
+            # Handed a slot just as we gave up
+            if isinstance(exc, asyncio.CancelledError):
+                self.release()
+                raise
+            return True
+        finally:
+            with self._cond:
+                self.queued -= 1
+
+    def release(self, latency=None):
+        """Give the slot back and feed the request's latency (if it ran) into the limit."""
+        with self._cond:
+            self.in_flight -= 1
+            if latency is not None:
+                self._adapt(latency)
+            # Hand freed slots to async waiters in order; threads wake on notify
+            while self._waiters and self._has_room():
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                self.in_flight += 1
+                waiter.loop.call_soon_threadsafe(_grant, waiter.future)
+            self._cond.notify(max(0, int(self.limit) - self.in_flight))
+
+    def _adapt(self, latency):
+        self.latency = latency if self.latency is None else self.latency + SMOOTHING * (latency - self.latency)
+        if self.latency > self.target_latency:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.target_latency:
+                self.limit = max(self.min_limit, self.limit * BACKOFF)
+                self._last_decrease = now
+        elif self.queued or self.in_flight + 1 >= int(self.limit):
+            # Only grow when the limit is what's holding requests back
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def retry_after(self):
+        """Seconds until the queue ahead would likely have drained."""
+        latency = self.latency or self.target_latency
+        return max(1, math.ceil(latency * (self.queued + 1) / max(1, int(self.limit))))
+
+
+def _grant(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class ConcurrencyLimits:
+    """CONCURRENCY_LIMITS ({endpoint class: options}) as one AdaptiveLimiter per class."""
+
+    def __init__(self, limits):
+        self.limiters = {name: AdaptiveLimiter(name, **options) for name, options in limits.items()}
+
+    def endpoint_class(self, request):
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'browse'
+        if 'admin' in match.namespaces:
+            return 'admin'
+        return ENDPOINT_CLASSES.get(match.url_name, 'browse')
+
+    def limiter_for(self, request):
+        return self.limiters.get(self.endpoint_class(request))
+
+
+_limits = None
+
+
+def get_concurrency_limits():
+    global _limits
+    if _limits is None:
+        _limits = ConcurrencyLimits(settings.CONCURRENCY_LIMITS)
+    return _limits
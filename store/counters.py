@@ -0,0 +1,46 @@
+# store/counters.py
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .backfill import UpdateBackfill
+from .models import AnonymousClient, Cart, CartItem, Order
+
+
+def count_of(model, fk):
+    """Correlated COUNT(*) of ``model`` rows pointing at the outer row through ``fk``."""
+    counts = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+class CounterBackfill(UpdateBackfill):
+    """Rewrites a counter column only on rows where it has drifted."""
+    counter_field = None
+    child_model = None
+    child_fk = None
+
+    def get_queryset(self):
+        return self.model.objects.alias(actual=count_of(self.child_model, self.child_fk)).exclude(
+            **{self.counter_field: F('actual')}
+        )
+
+    def get_update_values(self):
+        return {self.counter_field: count_of(self.child_model, self.child_fk)}
+
+
+class CartItemCountBackfill(CounterBackfill):
+    model = Cart
+    name = 'reconcile_counters.cart_item_count'
+    counter_field = 'item_count'
+    child_model = CartItem
+    child_fk = 'cart'
+
+
+class ClientOrderCountBackfill(CounterBackfill):
+    model = AnonymousClient
+    name = 'reconcile_counters.client_order_count'
+    counter_field = 'order_count'
+    child_model = Order
+    child_fk = 'client'
+
+
+COUNTER_BACKFILLS = [CartItemCountBackfill, ClientOrderCountBackfill]
@@ -0,0 +1,89 @@
+# store/dashboard.py
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .events import PAID_STATUS, bucket_start
+from .models import OrderEvent, OrderRollup, Product, ProductSalesRollup
+from .money import sats_to_btc
+
+DASHBOARD_CACHE_KEY = 'store:dashboard:{window}'
+
+
+@dataclass(frozen=True)
+class Window:
+    label: str
+    period: str  # rollup granularity to read
+    span: timedelta
+
+
+DASHBOARD_WINDOWS = {
+    '24h': Window('Last 24 hours', 'hour', timedelta(hours=24)),
+    '7d': Window('Last 7 days', 'day', timedelta(days=7)),
+    '30d': Window('Last 30 days', 'day', timedelta(days=30)),
+    '90d': Window('Last 90 days', 'day', timedelta(days=90)),
+}
+DEFAULT_WINDOW = '7d'
+TOP_PRODUCTS = 10
+LOW_STOCK = 10
+
+
+def build_dashboard(window_key):
+    """
+    Dashboard figures for one window, read only from the rollup tables and
+    the catalog. Never touches Order or OrderItem.
+    """
+    window = DASHBOARD_WINDOWS[window_key]
+    now = timezone.now()
+    start = bucket_start(now - window.span, window.period)
+
+    by_status = {
+        row['status']: row
+        for row in OrderRollup.objects.filter(period=window.period, bucket__gte=start)
+        .values('status').annotate(orders=Sum('orders'), revenue_sats=Sum('revenue_sats')).order_by()
+    }
+    paid = by_status.get(PAID_STATUS, {'orders': 0, 'revenue_sats': 0})
+
+    top_products = list(
+        ProductSalesRollup.objects.filter(period=window.period, bucket__gte=start)
+        .values('product_id', 'product__name')
+        .annotate(units=Sum('units'), revenue_sats=Sum('revenue_sats'))
+        .order_by('-units')[:TOP_PRODUCTS]
+    )
+    low_stock = list(
+        Product.objects.filter(is_active=True)
+        .order_by('stock_quantity', 'pk')
+        .values('pk', 'name', 'stock_quantity')[:LOW_STOCK]
+    )
+    last_event = OrderEvent.objects.order_by('-created_at').values_list('created_at', flat=True).first()
+
+    return {
+        'window': window_key,
+        'label': window.label,
+        'start': start,
+        'computed_at': now,
+        'last_event_at': last_event,
+        'revenue_sats': paid['revenue_sats'],
+        'revenue_btc': sats_to_btc(paid['revenue_sats']),
+        'paid_orders': paid['orders'],
+        'orders_by_status': sorted(
+            ({'status': status, 'orders': row['orders']} for status, row in by_status.items()),
+            key=lambda row: -row['orders'],
+        ),
+        'top_products': top_products,
+        'low_stock': low_stock,
+    }
+
+
+def get_dashboard(window_key, refresh=False):
+    """Cached dashboard for a window; ``refresh`` recomputes it (still from rollups)."""
+    key = DASHBOARD_CACHE_KEY.format(window=window_key)
+    data = None if refresh else cache.get(key)
+    if data is None:
+        data = build_dashboard(window_key)
+        cache.set(key, data, settings.DASHBOARD_CACHE_TTL)
+    return data
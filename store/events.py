@@ -0,0 +1,141 @@
+# store/events.py
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncDay, TruncHour
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Order, OrderEvent, OrderItem, OrderRollup, ProductSalesRollup
+
+PAID_STATUS = 'paid'  # revenue and units are counted when an order enters this status
+
+# Sent inside the transaction of every recorded status change, with from_status.
+# Receivers doing more than bookkeeping should defer it with transaction.on_commit.
+order_status_changed = Signal()
+TRUNCATE = {'hour': TruncHour, 'day': TruncDay}
+
+
+def bucket_start(when, period):
+    when = timezone.localtime(when).replace(minute=0, second=0, microsecond=0)
+    return when.replace(hour=0) if period == 'day' else when
+
+
+def upsert_increment(model, lookup, **deltas):
+    """Add ``deltas`` to the rollup row for ``lookup``, creating it on first use."""
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Another transaction created the row first
+        model.objects.filter(**lookup).update(**updates)
+
+
+def paid_items(order_id):
+    return list(OrderItem.objects.filter(order_id=order_id).values_list('product_id', 'quantity', 'price_sats'))
+
+
+def apply_event(event, items=None):
+    """Fold one event into the hourly and daily rollups."""
+    if items is None and event.to_status == PAID_STATUS:
+        items = paid_items(event.order_id)
+    for period in TRUNCATE:
+        bucket = bucket_start(event.created_at, period)
+        upsert_increment(
+            OrderRollup, {'period': period, 'bucket': bucket, 'status': event.to_status},
+            orders=1, revenue_sats=event.amount_sats,
+        )
+        if event.to_status == PAID_STATUS:
+            for product_id, quantity, price_sats in items:
+                upsert_increment(
+                    ProductSalesRollup, {'period': period, 'bucket': bucket, 'product_id': product_id},
+                    units=quantity, revenue_sats=price_sats * quantity,
+                )
+
+
+def record_status_change(order, from_status, items=None):
+    """
+    Append the event for ``order`` having moved from ``from_status`` to its
+    current status and update the rollups. Call inside the transaction that
+    saved the order, so the log and the reports can't drift from it.
+    """
+    with transaction.atomic():
+        event = OrderEvent.objects.create(
+            order=order,
+            from_status=from_status or '',
+            to_status=order.status,
+            amount_sats=order.amount_sats or 0,
+        )
+        apply_event(event, items)
+        order_status_changed.send(sender=Order, order=order, from_status=event.from_status)
+    return event
+
+
+def save_order_status(order, from_status, **save_kwargs):
+    """Save ``order`` and record its status change in one transaction."""
+    with transaction.atomic():
+        order.save(**save_kwargs)
+        if order.status != from_status:
+            record_status_change(order, from_status)
+
+
+# ----------------------------
+# Rebuilding from the log
+# ----------------------------
+def seed_events(chunk_size=1000):
+    """Give orders that predate the event log one event for their current status."""
+    created = 0
+    orders = Order.objects.filter(events__isnull=True).order_by('pk').values_list('pk', 'status', 'amount_sats', 'created_at')
+    while True:
+        chunk = list(orders[:chunk_size])
+        if not chunk:
+            return created
+        OrderEvent.objects.bulk_create([
+            OrderEvent(order_id=pk, to_status=status, amount_sats=amount_sats or 0, created_at=created_at)
+            for pk, status, amount_sats, created_at in chunk
+        ])
+        created += len(chunk)
+
+
+def rebuild_rollups(since=None):
+    """
+    Recompute the rollups from the event log with grouped queries, for all
+    time or from the bucket containing ``since``. Run after seeding or to
+    repair drift; day-to-day they are maintained by record_status_change.
+    """
+    with transaction.atomic():
+        for period, truncate in TRUNCATE.items():
+            events = OrderEvent.objects.all()
+            rollups = OrderRollup.objects.filter(period=period)
+            product_rollups = ProductSalesRollup.objects.filter(period=period)
+            if since is not None:
+                start = bucket_start(since, period)
+                events = events.filter(created_at__gte=start)
+                rollups = rollups.filter(bucket__gte=start)
+                product_rollups = product_rollups.filter(bucket__gte=start)
+            rollups.delete()
+            product_rollups.delete()
+
+            OrderRollup.objects.bulk_create([
+                OrderRollup(period=period, bucket=row['bucket'], status=row['to_status'],
+                            orders=row['orders'], revenue_sats=row['revenue_sats'])
+                for row in events.annotate(bucket=truncate('created_at')).values('bucket', 'to_status').annotate(
+                    orders=Count('pk'), revenue_sats=Coalesce(Sum('amount_sats'), 0)
+                ).order_by()
+            ], batch_size=1000)
+
+            # Integer prices, so units and revenue aggregate exactly in the database
+            paid_lines = {'order__events__to_status': PAID_STATUS}
+            if since is not None:
+                paid_lines['order__events__created_at__gte'] = start
+            ProductSalesRollup.objects.bulk_create([
+                ProductSalesRollup(period=period, bucket=row['bucket'], product_id=row['product_id'],
+                                   units=row['units'], revenue_sats=row['revenue_sats'])
+                for row in OrderItem.objects.filter(**paid_lines)
+                .annotate(bucket=truncate('order__events__created_at'))
+                .values('bucket', 'product_id')
+                .annotate(units=Sum('quantity'), revenue_sats=Sum(F('quantity') * F('price_sats')))
+                .order_by()
+            ], batch_size=1000)
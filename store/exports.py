@@ -0,0 +1,108 @@
+# store/exports.py
+import csv
+import json
+
+from django.db.models import Prefetch
+
+from .models import Order, OrderItem
+from .money import format_btc
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 500
+
+CSV_HEADER = [
+    'order_number', 'created_at', 'status', 'email', 'delivery_option',
+    'total_amount', 'bitcoin_amount', 'amount_sats', 'payment_confirmed',
+    'product_id', 'product_name', 'quantity', 'price', 'price_btc',
+]
+
+
+class Echo:
+    """File-like object whose write() just hands the line back to csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def filter_orders(queryset=None, status=None, since=None, until=None):
+    queryset = Order.objects.all() if queryset is None else queryset
+    if status:
+        queryset = queryset.filter(status=status)
+    if since:
+        queryset = queryset.filter(created_at__gte=since)
+    if until:
+        queryset = queryset.filter(created_at__lt=until)
+    return queryset
+
+
+def iter_orders(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Iterate orders with their items in chunks. Uses a server-side cursor
+    where the backend supports one; items/products are prefetched per chunk,
+    so memory stays bounded by chunk_size.
+    """
+    queryset = queryset.order_by('pk').prefetch_related(None).prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+    )
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def _decimal(value):
+    return '' if value is None else str(value)
+
+
+def order_to_dict(order):
+    return {
+        'order_number': str(order.order_number),
+        'created_at': order.created_at.isoformat(),
+        'status': order.status,
+        'email': order.email,
+        'delivery_option': order.delivery_option,
+        'total_amount': _decimal(order.total_amount),
+        'bitcoin_amount': _decimal(order.bitcoin_amount),
+        'amount_sats': order.amount_sats,
+        'payment_confirmed': order.payment_confirmed,
+        'items': [
+            {
+                'product_id': item.product_id,
+                'product_name': item.product.name,
+                'quantity': item.quantity,
+                'price': _decimal(item.price),
+                'price_btc': format_btc(item.price_sats),
+            }
+            for item in order.items.all()
+        ],
+    }
+
+
+def csv_rows(orders):
+    """One row per order item; orders without items get a single row."""
+    for order in orders:
+        data = order_to_dict(order)
+        head = [data[key] for key in CSV_HEADER[:9]]
+        if not data['items']:
+            yield head + [''] * 5
+        for item in data['items']:
+            yield head + [item['product_id'], item['product_name'], item['quantity'],
+                          item['price'], item['price_btc']]
+
+
+def stream_csv(orders):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in csv_rows(orders):
+        yield writer.writerow(row)
+
+
+def stream_jsonl(orders):
+    for order in orders:
+        yield json.dumps(order_to_dict(order)) + '\n'
+
+
+def stream_orders(queryset, export_format='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    orders = iter_orders(queryset, chunk_size=chunk_size)
+    if export_format == 'jsonl':
+        return stream_jsonl(orders)
+    return stream_csv(orders)
@@ -0,0 +1,210 @@
+# store/imports.py
+import csv
+import io
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from decimal import InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+
+from .catalog import bump_catalog_version
+from .models import Product
+from .money import btc_to_sats
+from .prerender import schedule_regeneration
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 1000
+
+# Columns an import may set; "sku" is the key rows are matched on. A price_btc
+# column is still accepted and stored as price_sats.
+IMPORT_FIELDS = [
+    'name', 'description', 'price', 'price_sats', 'quantity', 'is_available',
+    'is_active', 'stock_quantity', 'max_per_order',
+]
+REQUIRED_FOR_CREATE = ['name', 'price']
+# Files are decoded with errors='surrogateescape', so bytes that aren't UTF-8 show up
+# as lone surrogates and only fail their own row
+UNDECODABLE = re.compile('[\udc80-\udcff]')
+
+
+class BadRow:
+    """Stands in for a line that couldn't be parsed, so it's reported like any invalid row."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    errors: list = field(default_factory=list)
+    elapsed: float = 0.0
+    dry_run: bool = False
+
+    @property
+    def rows(self):
+        return self.created + self.updated + self.unchanged + len(self.errors)
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        prefix = '[dry run] ' if self.dry_run else ''
+        return (
+            f"{prefix}{self.rows} rows: {self.created} created, {self.updated} updated, "
+            f"{self.unchanged} unchanged, {len(self.errors)} errors "
+            f"in {self.elapsed:.2f}s ({self.rows_per_sec:,.0f} rows/sec)"
+        )
+
+
+def read_rows(fh, import_format='csv'):
+    """
+    Yield dicts from a text file handle containing CSV (with header) or JSONL.
+    Lines that aren't valid UTF-8 or JSON come out as BadRow.
+    """
+    if import_format not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown import format: {import_format}")
+    if import_format == 'csv':
+        for row in csv.DictReader(fh):
+            if any(isinstance(value, str) and UNDECODABLE.search(value) for value in row.values()):
+                yield BadRow('not valid UTF-8')
+            else:
+                yield row
+        return
+    for line in fh:
+        line = line.strip()
+        if not line:
+            continue
+        if UNDECODABLE.search(line):
+            yield BadRow('not valid UTF-8')
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield BadRow(f"invalid JSON: {e}")
+
+
+def open_rows(path):
+    """Open ``path`` for read_rows() (UTF-8, optional BOM)."""
+    return open(path, newline='', encoding='utf-8-sig', errors='surrogateescape')
+
+
+def read_upload(uploaded_file, import_format='csv'):
+    """Same as read_rows() for a Django UploadedFile (binary)."""
+    return read_rows(
+        io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', errors='surrogateescape', newline=''), import_format
+    )
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _clean(row):
+    """Convert raw strings to field values; blank cells mean "leave unchanged"."""
+    values = {}
+    for name in IMPORT_FIELDS:
+        if name not in row or row[name] in ('', None):
+            continue
+        model_field = Product._meta.get_field(name)
+        value = row[name]
+        if isinstance(model_field, models.BooleanField) and isinstance(value, str):
+            value = value.strip().lower() in ('1', 'true', 't', 'yes', 'y')
+        values[name] = model_field.clean(value, None)
+    if 'price_sats' not in values and row.get('price_btc') not in ('', None):
+        try:
+            values['price_sats'] = btc_to_sats(row['price_btc'])
+        except InvalidOperation:
+            raise ValidationError('price_btc must be a number')
+    return values
+
+
+def _row_sku(row):
+    if isinstance(row, BadRow):
+        raise ValidationError(row.error)
+    if not isinstance(row, dict):
+        raise ValidationError('expected an object')
+    sku = row.get('sku')
+    if sku is not None and not isinstance(sku, str):
+        raise ValidationError('sku must be a string')
+    sku = (sku or '').strip()
+    if not sku:
+        raise ValidationError('missing sku')
+    return sku
+
+
+def _apply_chunk(rows, result, dry_run, seen):
+    """``seen`` maps every sku of earlier rows to its line, so a repeated sku is an error."""
+    parsed = {}
+    for line_no, row in rows:
+        try:
+            sku = _row_sku(row)
+            if sku in seen:
+                raise ValidationError(f"duplicate sku {sku} (first on line {seen[sku]})")
+            seen[sku] = line_no
+            parsed[sku] = (line_no, _clean(row))
+        except ValidationError as e:
+            result.errors.append((line_no, '; '.join(e.messages)))
+
+    existing = Product.objects.in_bulk(list(parsed), field_name='sku')
+    to_create, to_update, changed_fields = [], [], set()
+
+    for sku, (line_no, values) in parsed.items():
+        product = existing.get(sku)
+        if product is None:
+            missing = [name for name in REQUIRED_FOR_CREATE if name not in values]
+            if missing:
+                result.errors.append((line_no, f"new sku needs {', '.join(missing)}"))
+                continue
+            to_create.append(Product(sku=sku, **values))
+            continue
+        diff = {name for name, value in values.items() if getattr(product, name) != value}
+        if not diff:
+            result.unchanged += 1
+            continue
+        for name in diff:
+            setattr(product, name, values[name])
+        changed_fields |= diff
+        to_update.append(product)
+
+    if not dry_run:
+        with transaction.atomic():
+            if to_create:
+                Product.objects.bulk_create(to_create)
+            if to_update:
+                Product.objects.bulk_update(to_update, sorted(changed_fields))
+            # Bulk writes skip the post_save signal; the queue coalesces chunks
+            schedule_regeneration(product.pk for product in to_create + to_update)
+    result.created += len(to_create)
+    result.updated += len(to_update)
+
+
+def import_products(rows, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+    """
+    Upsert products keyed by sku. Each chunk is diffed against the existing
+    rows with one SELECT and written with bulk_create/bulk_update in its own
+    transaction. Caches are invalidated once at the end.
+    """
+    result = ImportResult(dry_run=dry_run)
+    started = time.monotonic()
+    numbered = enumerate(rows, start=1)
+    seen = {}
+    for chunk in _chunks(numbered, chunk_size):
+        _apply_chunk(chunk, result, dry_run, seen)
+    result.elapsed = time.monotonic() - started
+    if not dry_run and (result.created or result.updated):
+        bump_catalog_version()
+    return result
@@ -0,0 +1,17 @@
+# store/management/commands/build_recommendations.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.recommendations import TOP_K, build_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the co-purchase matrix and top-k recommendations from all purchased orders'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        products = build_recommendations()
+        self.stdout.write(self.style.SUCCESS(
+            f"Top {TOP_K} recommendations for {products} products in {time.monotonic() - started:.2f}s"
+        ))
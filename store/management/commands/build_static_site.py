@@ -0,0 +1,30 @@
+# store/management/commands/build_static_site.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.prerender import StaticSite, get_static_site
+
+
+class Command(BaseCommand):
+    help = 'Pre-render the catalog pages to static HTML for nginx/CDN serving'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Directory to write to (default: STATIC_SITE_DIR)')
+        parser.add_argument('--product', type=int, action='append', dest='products',
+                            help='Only regenerate the pages showing this product (repeatable)')
+
+    def handle(self, *args, **options):
+        site = StaticSite(options['output']) if options['output'] else get_static_site()
+        if site is None:
+            raise CommandError('Set STATIC_SITE_DIR or pass --output')
+        started = time.monotonic()
+        if options['products']:
+            changed = site.regenerate_products(options['products'])
+        else:
+            changed = site.build()
+        for url in changed:
+            self.stdout.write(url)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(changed)} pages changed in {site.directory} ({time.monotonic() - started:.2f}s)"
+        ))
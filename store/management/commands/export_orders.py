@@ -0,0 +1,47 @@
+# store/management/commands/export_orders.py
+import argparse
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from store.exports import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, filter_orders, stream_orders
+
+
+def parse_when(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise argparse.ArgumentTypeError(f"invalid date: {value!r}")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Stream orders with their items to CSV or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--status', help='Only export orders with this status')
+        parser.add_argument('--since', type=parse_when, help='Created at or after (YYYY-MM-DD or ISO datetime)')
+        parser.add_argument('--until', type=parse_when, help='Created before (YYYY-MM-DD or ISO datetime)')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        queryset = filter_orders(
+            status=options['status'], since=options['since'], until=options['until']
+        )
+        chunks = stream_orders(queryset, options['format'], chunk_size=options['chunk_size'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as fh:
+                fh.writelines(chunks)
+            self.stderr.write(self.style.SUCCESS(f"Exported orders to {options['output']}"))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,23 @@
+# store/management/commands/fix_order_relations.py
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+
+from store.backfill import BackfillCommand, UpdateBackfill
+from store.models import Order
+
+
+class OrderSessionIdBackfill(UpdateBackfill):
+    model = Order
+    name = 'fix_order_relations'
+
+    def get_queryset(self):
+        return Order.objects.filter(session_id='')
+
+    def get_update_values(self):
+        # Generate a session ID for orders that don't have one: anon_<id>
+        return {'session_id': Concat(Value('anon_'), Cast('id', CharField()))}
+
+
+class Command(BackfillCommand):
+    help = 'Fix order relationships by ensuring all orders have session_id'
+    backfill_class = OrderSessionIdBackfill
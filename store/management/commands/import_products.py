@@ -0,0 +1,41 @@
+# store/management/commands/import_products.py
+from django.core.management.base import BaseCommand, CommandError
+
+from store.imports import DEFAULT_CHUNK_SIZE, IMPORT_FORMATS, import_products, open_rows, read_rows
+from store.prerender import regenerate_pending
+
+
+class Command(BaseCommand):
+    help = 'Create or update products from a CSV/JSONL file keyed by sku'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help='Defaults to the file extension (.csv or .jsonl)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Diff only, write nothing')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        try:
+            fh = open_rows(path)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        with fh:
+            result = import_products(
+                read_rows(fh, import_format),
+                chunk_size=options['chunk_size'],
+                dry_run=options['dry_run'],
+            )
+
+        # The queue's worker thread would die with this process
+        regenerate_pending()
+
+        for line_no, error in result.errors[:20]:
+            self.stderr.write(f"line {line_no}: {error}")
+        if len(result.errors) > 20:
+            self.stderr.write(f"... and {len(result.errors) - 20} more errors")
+        style = self.style.WARNING if result.errors else self.style.SUCCESS
+        self.stdout.write(style(result.summary()))
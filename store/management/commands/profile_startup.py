@@ -0,0 +1,99 @@
+# store/management/commands/profile_startup.py
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a cold process does before it can serve a request or run a command
+TARGETS = {
+    'setup': 'import django; django.setup()',
+    'wsgi': 'import marketplace_420.wsgi',
+    'asgi': 'import marketplace_420.asgi',
+    'urls': 'import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns',
+    'command': f'import runpy, sys; sys.argv = ["manage.py", "check"]; '
+               f'runpy.run_path({str(settings.BASE_DIR / "manage.py")!r}, run_name="__main__")',
+}
+
+# Runs in the child interpreter. -X importtime can't be used: it only sees
+# `import` statements, not importlib.import_module(), which is how Django loads
+# settings, apps, models and admin modules. Every import goes through
+# _find_and_load, so timing that catches both.
+TRACER = """
+import importlib._bootstrap as bootstrap, json, sys, time
+rows, stack = [], []
+find_and_load = bootstrap._find_and_load
+def traced(name, import_):
+    started = time.perf_counter()
+    stack.append(0.0)
+    try:
+        return find_and_load(name, import_)
+    finally:
+        elapsed = time.perf_counter() - started
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        rows.append((name, elapsed - children, elapsed, len(stack)))
+bootstrap._find_and_load = traced
+started = time.perf_counter()
+{target}
+elapsed = time.perf_counter() - started
+bootstrap._find_and_load = find_and_load
+with open({output!r}, 'w') as fh:
+    json.dump({{'elapsed': elapsed, 'rows': rows}}, fh)
+"""
+
+
+class Command(BaseCommand):
+    help = 'Start fresh interpreters and report cold-start time and import cost per module and package'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=TARGETS, default='wsgi')
+        parser.add_argument('--limit', type=int, default=25, help='Modules to list')
+        parser.add_argument('--sort', choices=['cumulative', 'self'], default='cumulative')
+        parser.add_argument('--package', help='Only list modules under this top-level package')
+        parser.add_argument('--runs', type=int, default=5, help='Cold starts to time (median is reported)')
+
+    def run_once(self, target):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'marketplace_420.settings')
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            script = TRACER.format(target=TARGETS[target], output=output.name)
+            proc = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, env=env)
+            if proc.returncode:
+                lines = proc.stderr.strip().splitlines()
+                raise CommandError(lines[-1] if lines else 'Startup failed')
+            result = json.load(output)
+        return result['elapsed'], result['rows']
+
+    def handle(self, *args, **options):
+        timings, rows = [], []
+        for _ in range(max(1, options['runs'])):
+            elapsed, rows = self.run_once(options['target'])
+            timings.append(elapsed)
+
+        by_package = defaultdict(int)
+        for module, self_s, _, _ in rows:
+            by_package[module.split('.', 1)[0]] += self_s
+        total_s = sum(by_package.values())
+
+        self.stdout.write(
+            f"{options['target']}: median {statistics.median(timings) * 1000:.1f} ms over {len(timings)} cold starts "
+            f"({total_s * 1000:.1f} ms in imports, {len(rows)} modules)\n"
+        )
+        self.stdout.write(f"{'package':<40} {'self ms':>9} {'share':>6}")
+        for package, self_s in sorted(by_package.items(), key=lambda item: -item[1])[:options['limit']]:
+            self.stdout.write(f"{package:<40} {self_s * 1000:>9.1f} {self_s / total_s:>6.1%}")
+
+        modules = rows
+        if options['package']:
+            modules = [row for row in rows if row[0].split('.', 1)[0] == options['package']]
+        key = 2 if options['sort'] == 'cumulative' else 1
+        self.stdout.write(f"\n{'module':<55} {'self ms':>9} {'cumul ms':>9}")
+        for module, self_s, cumulative_s, _ in sorted(modules, key=lambda row: -row[key])[:options['limit']]:
+            self.stdout.write(f"{module:<55} {self_s * 1000:>9.1f} {cumulative_s * 1000:>9.1f}")
@@ -0,0 +1,43 @@
+# store/management/commands/purge_sessions.py
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired sessions in small chunks (run from cron). Unlike clearsessions, '
+        'no single DELETE holds the database write lock for long.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--throttle', type=float, default=0.0, help='Seconds to sleep between chunks')
+
+    def handle(self, *args, **options):
+        engine = import_module(settings.SESSION_ENGINE)
+        get_model_class = getattr(engine.SessionStore, 'get_model_class', None)
+        if get_model_class is None:
+            # signed_cookies / cache: expiry is handled by the cookie or the cache itself
+            engine.SessionStore.clear_expired()
+            self.stdout.write(f"{settings.SESSION_ENGINE} keeps no session table; nothing to purge")
+            return
+
+        sessions = get_model_class().objects
+        now = timezone.now()
+        deleted = 0
+        started = time.monotonic()
+        while True:
+            # expire_date is indexed, so each chunk is a range scan, not a table scan
+            keys = list(sessions.filter(expire_date__lt=now).values_list('pk', flat=True)[:options['chunk_size']])
+            if not keys:
+                break
+            deleted += sessions.filter(pk__in=keys).delete()[0]
+            if options['throttle']:
+                time.sleep(options['throttle'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} expired sessions in {time.monotonic() - started:.2f}s"
+        ))
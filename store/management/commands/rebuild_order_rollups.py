@@ -0,0 +1,19 @@
+# store/management/commands/rebuild_order_rollups.py
+from django.core.management.base import BaseCommand
+
+from store.events import rebuild_rollups, seed_events
+from store.management.commands.export_orders import parse_when
+
+
+class Command(BaseCommand):
+    help = 'Recompute the hourly/daily order rollups from the order event log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=parse_when, help='Only rebuild buckets from this date (YYYY-MM-DD or ISO datetime)')
+        parser.add_argument('--seed', action='store_true', help='First log the current status of orders that have no events')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.stdout.write(f"Seeded {seed_events()} events for orders without history")
+        rebuild_rollups(since=options['since'])
+        self.stdout.write(self.style.SUCCESS('Rollups rebuilt'))
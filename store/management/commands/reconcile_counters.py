@@ -0,0 +1,13 @@
+# store/management/commands/reconcile_counters.py
+from store.backfill import BackfillCommand
+from store.counters import COUNTER_BACKFILLS
+
+
+class Command(BackfillCommand):
+    help = 'Fix drift in Cart.item_count and AnonymousClient.order_count in bulk'
+
+    def handle(self, *args, **options):
+        for backfill_class in COUNTER_BACKFILLS:
+            self.backfill_class = backfill_class
+            self.stdout.write(f"{backfill_class.counter_field} on {backfill_class.model.__name__}:")
+            super().handle(*args, **options)
@@ -0,0 +1,22 @@
+# store/management/commands/refill_address_pool.py
+from django.core.management.base import BaseCommand, CommandError
+
+from store.addresses import AddressDerivationError, available_addresses, refill_pool
+
+
+class Command(BaseCommand):
+    help = 'Pre-derive receiving addresses from ADDRESS_POOL_XPUB into the pool (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--xpub', help='Overrides settings.ADDRESS_POOL_XPUB')
+        parser.add_argument('--target', type=int, help='Available addresses to keep (default ADDRESS_POOL_SIZE)')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        try:
+            added = refill_pool(xpub=options['xpub'], target=options['target'], batch_size=options['batch_size'])
+        except AddressDerivationError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {added} addresses; {available_addresses().count()} available"
+        ))
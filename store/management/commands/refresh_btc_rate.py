@@ -0,0 +1,32 @@
+# store/management/commands/refresh_btc_rate.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from store.prerender import regenerate_pending
+from store.rates import RateError, refresh_rate
+
+
+class Command(BaseCommand):
+    help = 'Fetch the fiat/BTC rate, cache it and reprice the catalog (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', help='Dotted path overriding settings.BTC_RATE_PROVIDER')
+        parser.add_argument('--currency', help='Overrides settings.BTC_RATE_CURRENCY')
+        parser.add_argument('--no-reprice', action='store_true', help='Only record the rate; prices and the rate orders record stay as they are')
+
+    def handle(self, *args, **options):
+        provider = import_string(options['provider'])() if options['provider'] else None
+        try:
+            snapshot, repriced = refresh_rate(
+                provider=provider, currency=options['currency'], reprice=not options['no_reprice']
+            )
+        except RateError as e:
+            raise CommandError(str(e))
+
+        # The queue's worker thread would die with this process
+        regenerate_pending()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"1 BTC = {snapshot.fiat_per_btc} {snapshot.currency} ({snapshot.source}); "
+            f"repriced {repriced} products"
+        ))
@@ -0,0 +1,115 @@
+# store/messaging.py
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+NONCE_SIZE = 12
+
+
+class MessageDecryptionError(Exception):
+    pass
+
+
+class MessageCipher:
+    """
+    AES-256-GCM for order messages. Each order gets its own key, derived from
+    the master key with HKDF (info = order UUID), so one leaked order key
+    exposes one conversation. Derived keys are cached in a small LRU: HKDF
+    runs once per order per process, not once per message.
+
+    Tokens are base64(nonce || ciphertext || tag). The order UUID and message
+    type are bound in as associated data, so a token can't be replayed onto
+    another order or relabelled.
+    """
+
+    def __init__(self, master_key, key_id='v1', cache_size=1024):
+        self.master_key = master_key
+        self.key_id = key_id
+        self.cache_size = cache_size
+        self._keys = OrderedDict()  # order UUID -> AESGCM
+        self._lock = threading.Lock()
+
+    def _derive(self, order_number):
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+        key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'order-message:' + order_number.bytes)
+        return AESGCM(key.derive(self.master_key))
+
+    def for_order(self, order_number):
+        with self._lock:
+            aead = self._keys.get(order_number)
+            if aead is not None:
+                self._keys.move_to_end(order_number)
+                return aead
+        aead = self._derive(order_number)
+        with self._lock:
+            self._keys[order_number] = aead
+            while len(self._keys) > self.cache_size:
+                self._keys.popitem(last=False)
+        return aead
+
+    @staticmethod
+    def _aad(order_number, message_type):
+        return order_number.bytes + message_type.encode()
+
+    def encrypt(self, order_number, message_type, plaintext):
+        nonce = os.urandom(NONCE_SIZE)
+        sealed = self.for_order(order_number).encrypt(nonce, plaintext.encode(), self._aad(order_number, message_type))
+        return base64.b64encode(nonce + sealed).decode()
+
+    def decrypt(self, order_number, message_type, token):
+        from cryptography.exceptions import InvalidTag
+
+        try:
+            raw = base64.b64decode(token, validate=True)
+            plaintext = self.for_order(order_number).decrypt(
+                raw[:NONCE_SIZE], raw[NONCE_SIZE:], self._aad(order_number, message_type)
+            )
+        except (InvalidTag, ValueError) as e:
+            raise MessageDecryptionError(str(e) or type(e).__name__)
+        return plaintext.decode()
+
+    def decrypt_many(self, order_number, rows):
+        """
+        Decrypt a page of (message_type, key_id, token) for one order with a
+        single key lookup. Rows from another key or the old placeholder
+        format come back as None.
+        """
+        from cryptography.exceptions import InvalidTag
+
+        aead = self.for_order(order_number)
+        results = []
+        for message_type, key_id, token in rows:
+            if key_id != self.key_id:
+                results.append(None)
+                continue
+            try:
+                raw = base64.b64decode(token, validate=True)
+                results.append(aead.decrypt(
+                    raw[:NONCE_SIZE], raw[NONCE_SIZE:], self._aad(order_number, message_type)
+                ).decode())
+            except (InvalidTag, ValueError):
+                results.append(None)
+        return results
+
+
+_cipher = None
+
+
+def get_message_cipher():
+    global _cipher
+    if _cipher is None:
+        master_key = settings.MESSAGE_ENCRYPTION_KEY
+        if master_key:
+            master_key = base64.b64decode(master_key)
+        else:
+            # Stable per deployment, but rotating SECRET_KEY then makes old messages unreadable
+            master_key = hashlib.sha256(b'store.messaging:' + settings.SECRET_KEY.encode()).digest()
+        _cipher = MessageCipher(master_key, key_id=settings.MESSAGE_KEY_ID)
+    return _cipher
@@ -1,13 +1,29 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from django.utils import timezone
+from .concurrency import HTML_CLASSES, get_concurrency_limits
 from .models import AnonymousClient, Cart
+from .ratelimit import RateLimits, get_buckets
+import time
 import uuid
 import hashlib
 
 class AnonymousSessionMiddleware:
+    # Runs natively under both WSGI and ASGI, so async views never hop to a thread for it
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
         # Create or get session ID
         if 'client_session_id' not in request.session:
             request.session['client_session_id'] = str(uuid.uuid4())
@@ -18,18 +34,7 @@ class AnonymousSessionMiddleware:
         try:
             client = AnonymousClient.objects.get(session_id=session_id)
         except AnonymousClient.DoesNotExist:
-            # Get client IP
-            ip_address = self.get_client_ip(request)
-            ip_hash = hashlib.sha256(ip_address.encode()).hexdigest()
-
-            # Create new client
-            client = AnonymousClient.objects.create(
-                session_id=session_id,
-                ip_hash=ip_hash,
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                created_at=timezone.now(),
-                last_active=timezone.now()
-            )
+            client = AnonymousClient.objects.create(**self.new_client_fields(request, session_id))
 
         # Update last_active (safe, does not touch unique fields)
         client.last_active = timezone.now()
@@ -48,10 +53,162 @@ class AnonymousSessionMiddleware:
 
         return self.get_response(request)
 
+    async def __acall__(self, request):
+        # Same steps as __call__, using the async session and ORM APIs
+        session_id = await request.session.aget('client_session_id')
+        if session_id is None:
+            session_id = str(uuid.uuid4())
+            await request.session.aset('client_session_id', session_id)
+
+        try:
+            client = await AnonymousClient.objects.aget(session_id=session_id)
+        except AnonymousClient.DoesNotExist:
+            client = await AnonymousClient.objects.acreate(**self.new_client_fields(request, session_id))
+
+        client.last_active = timezone.now()
+        await client.asave(update_fields=['last_active'])
+
+        request.anonymous_client = client
+        request.client_ip = self.get_client_ip(request)
+
+        cart, _ = await Cart.objects.aget_or_create(
+            client=client,
+            is_active=True
+        )
+        request.cart = cart
+
+        return await self.get_response(request)
+
+    def new_client_fields(self, request, session_id):
+        # Get client IP
+        ip_address = self.get_client_ip(request)
+        ip_hash = hashlib.sha256(ip_address.encode()).hexdigest()
+
+        return {
+            'session_id': session_id,
+            'ip_hash': ip_hash,
+            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+            'created_at': timezone.now(),
+            'last_active': timezone.now(),
+        }
+
     def get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
+        return get_client_ip(request)
+
+
+def get_client_ip(request):
+    """
+    REMOTE_ADDR, unless TRUSTED_PROXY_HOPS reverse proxies sit in front: then
+    the address the outermost one saw, counted from the right of
+    X-Forwarded-For. Anything further left is whatever the client sent.
+    """
+    ip = request.META.get('REMOTE_ADDR') or '0.0.0.0'
+    hops = settings.TRUSTED_PROXY_HOPS
+    if hops:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        forwarded = [part for part in forwarded if part]
+        if forwarded:
+            ip = forwarded[-min(hops, len(forwarded))]
+    return ip
+
+
+class RateLimitMiddleware:
+    """
+    Token-bucket limits on the write-heavy JSON endpoints, per session cookie
+    and per hashed IP. Sits before the session and AnonymousSession
+    middleware so a rejected request costs no database work at all.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self._limits = None
+
+    @property
+    def limits(self):
+        # Built on first use: the URLconf isn't loaded yet when middleware is
+        if self._limits is None:
+            self._limits = RateLimits(settings.RATE_LIMITS)
+        return self._limits
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        wait = self.limits.check(request, get_client_ip(request), get_buckets())
+        if wait:
+            return self.too_many_requests(wait)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        wait = self.limits.check(request, get_client_ip(request), get_buckets())
+        if wait:
+            return self.too_many_requests(wait)
+        return await self.get_response(request)
+
+    def too_many_requests(self, wait):
+        response = JsonResponse({'success': False, 'error': 'Too many requests'}, status=429)
+        response['Retry-After'] = str(max(1, round(wait)))
+        return response
+
+
+# Static on purpose: shedding must stay cheaper than serving (no templates, no queries)
+SERVICE_UNAVAILABLE_PAGE = (
+    '<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>Busy - 420 Marketplace</title></head>'
+    '<body><h1>Server busy</h1><p>Too many requests right now. Please try again in a moment.</p></body></html>'
+)
+
+
+class LoadSheddingMiddleware:
+    """
+    Caps in-flight requests per endpoint class (browse, poll, cart,
+    checkout, admin) with adaptive limits from store.concurrency. Over the limit a
+    request queues briefly; past the deadline, or with the queue full, it
+    gets a fast 503 + Retry-After instead of piling onto SQLite's lock.
+    Limits are per worker process.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        limiter = get_concurrency_limits().limiter_for(request)
+        if limiter is None:
+            return self.get_response(request)
+        if not limiter.acquire():
+            return self.service_unavailable(limiter)
+        started = time.monotonic()
+        try:
+            return self.get_response(request)
+        finally:
+            limiter.release(time.monotonic() - started)
+
+    async def __acall__(self, request):
+        limiter = get_concurrency_limits().limiter_for(request)
+        if limiter is None:
+            return await self.get_response(request)
+        if not await limiter.aacquire():
+            return self.service_unavailable(limiter)
+        started = time.monotonic()
+        try:
+            return await self.get_response(request)
+        finally:
+            limiter.release(time.monotonic() - started)
+
+    def service_unavailable(self, limiter):
+        if limiter.name in HTML_CLASSES:
+            response = HttpResponse(SERVICE_UNAVAILABLE_PAGE, status=503)
         else:
-            ip = request.META.get('REMOTE_ADDR', '0.0.0.0')
-        return ip
+            response = JsonResponse({'success': False, 'error': 'Server busy, try again shortly'}, status=503)
+        response['Retry-After'] = str(limiter.retry_after())
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0032_alter_encryptedmessage_expires_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='email',
+            field=models.EmailField(blank=True, db_index=True, default='', max_length=254),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-19 13:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0034_product_sku'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('last_pk', models.BigIntegerField(default=0)),
+                ('rows_processed', models.BigIntegerField(default=0)),
+                ('rows_changed', models.BigIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
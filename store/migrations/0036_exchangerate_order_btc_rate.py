@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-19 13:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0035_backfillcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='btc_rate',
+            field=models.DecimalField(blank=True, decimal_places=8, max_digits=20, null=True),
+        ),
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(default='USD', max_length=10)),
+                ('fiat_per_btc', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('source', models.CharField(blank=True, default='', max_length=100)),
+                ('fetched_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['currency', '-fetched_at'], name='store_excha_currenc_1c9c6c_idx')],
+            },
+        ),
+    ]
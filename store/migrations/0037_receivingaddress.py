@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-19 13:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0036_exchangerate_order_btc_rate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceivingAddress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=100, unique=True)),
+                ('chain', models.CharField(max_length=16)),
+                ('derivation_index', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('available', 'Available'), ('assigned', 'Assigned')], default='available', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('assigned_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'derivation_index'], name='store_recei_status_7dff87_idx')],
+                'constraints': [models.UniqueConstraint(fields=('chain', 'derivation_index'), name='unique_chain_derivation_index')],
+            },
+        ),
+    ]
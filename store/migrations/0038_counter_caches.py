@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-19 13:51
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Cart = apps.get_model('store', 'Cart')
+    CartItem = apps.get_model('store', 'CartItem')
+    AnonymousClient = apps.get_model('store', 'AnonymousClient')
+    Order = apps.get_model('store', 'Order')
+
+    def count_of(model, fk):
+        counts = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(n=Count('pk')).values('n')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    Cart.objects.update(item_count=count_of(CartItem, 'cart'))
+    AnonymousClient.objects.update(order_count=count_of(Order, 'client'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0037_receivingaddress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anonymousclient',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0038_counter_caches'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['client', 'created_at'], name='store_order_client__e48650_idx'),
+        ),
+    ]
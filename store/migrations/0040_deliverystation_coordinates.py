@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0039_order_client_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliverystation',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliverystation',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
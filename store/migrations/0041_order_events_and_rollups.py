@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0040_deliverystation_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, default='', max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('amount_sats', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='store.order')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('status', models.CharField(max_length=20)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('revenue_sats', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'status'), name='unique_order_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue_sats', models.BigIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='store.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'product'), name='unique_product_sales_rollup')],
+            },
+        ),
+    ]
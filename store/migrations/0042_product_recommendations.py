@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0041_order_events_and_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPairCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'other'), name='unique_product_pair')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='store.product')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+            ],
+            options={
+                'ordering': ['product', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='unique_product_recommendation_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:16
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import BigIntegerField, DecimalField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Round
+
+
+def to_sats(field):
+    return Cast(Round(F(field) * Value(100_000_000)), BigIntegerField())
+
+
+def to_btc(field):
+    return F(field) * Value(Decimal('0.00000001'), output_field=DecimalField(max_digits=15, decimal_places=8))
+
+
+def fill_sats(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    CartItem = apps.get_model('store', 'CartItem')
+    OrderItem = apps.get_model('store', 'OrderItem')
+
+    Product.objects.filter(price_btc__isnull=False).update(price_sats=to_sats('price_btc'))
+    OrderItem.objects.filter(price_btc__isnull=False).update(price_sats=to_sats('price_btc'))
+    CartItem.objects.update(unit_price_sats=Coalesce(
+        Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price_sats')), Value(0)
+    ))
+
+
+def fill_btc(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    OrderItem = apps.get_model('store', 'OrderItem')
+
+    Product.objects.filter(price_sats__isnull=False).update(price_btc=to_btc('price_sats'))
+    OrderItem.objects.update(price_btc=to_btc('price_sats'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0042_product_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='unit_price_sats',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='price_sats',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='price_sats',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_sats, fill_btc),
+        migrations.RemoveField(
+            model_name='orderitem',
+            name='price_btc',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='price_btc',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:31
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_repriced(apps, schema_editor):
+    # Until now every stored rate counted as the current one, --no-reprice or not
+    ExchangeRate = apps.get_model('store', 'ExchangeRate')
+    ExchangeRate.objects.update(repriced_at=F('fetched_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0043_integer_sats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exchangerate',
+            name='repriced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_existing_repriced, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def link_assigned_addresses(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    ReceivingAddress = apps.get_model('store', 'ReceivingAddress')
+    assigned = ReceivingAddress.objects.filter(status='assigned')
+    Order.objects.filter(bitcoin_address__in=assigned.values('address')).update(
+        receiving_address=Subquery(assigned.filter(address=OuterRef('bitcoin_address')).values('pk')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0044_exchangerate_repriced_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='receiving_address',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='order', to='store.receivingaddress'),
+        ),
+        migrations.RunPython(link_assigned_addresses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0045_order_receiving_address'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='anonymousclient',
+            name='ip_hash',
+            field=models.CharField(db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:42
+
+import store.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0046_anonymousclient_ip_hash_not_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='encryptedmessage',
+            name='expires_at',
+            field=models.DateTimeField(default=store.models.default_message_expiry),
+        ),
+    ]
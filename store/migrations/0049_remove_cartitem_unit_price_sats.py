@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:01
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0048_order_status_paid'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='cartitem',
+            name='unit_price_sats',
+        ),
+    ]
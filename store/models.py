@@ -1,9 +1,13 @@
 # store/models.py
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.urls import reverse
 import uuid
-import hashlib
 from django.utils import timezone
 from datetime import timedelta
+from .messaging import get_message_cipher
+from .money import format_btc, sats_to_btc
+from .qr import get_qr_cache
 
 # ----------------------------
 # Helper functions
@@ -14,14 +18,19 @@ def generate_client_session_id():
 def generate_cart_session_id():
     return f"cart_{uuid.uuid4().hex[:8]}"
 
+def default_message_expiry():
+    return timezone.now() + timedelta(days=7)
+
 # ----------------------------
 # Product Model
 # ----------------------------
 class Product(models.Model):
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=200)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    price_btc = models.DecimalField(max_digits=15, decimal_places=8, null=True, blank=True)
+    # BTC price in integer satoshis (null until priced); converted to BTC only for display
+    price_sats = models.BigIntegerField(null=True, blank=True)
     image = models.ImageField(upload_to='products/', null=True, blank=True)
     quantity = models.PositiveIntegerField(default=0)
     is_available = models.BooleanField(default=True)
@@ -29,6 +38,10 @@ class Product(models.Model):
     stock_quantity = models.PositiveIntegerField(default=100)
     max_per_order = models.PositiveIntegerField(default=5)
 
+    @property
+    def price_btc(self):
+        return sats_to_btc(self.price_sats)
+
     def __str__(self):
         return self.name
 
@@ -38,6 +51,7 @@ class Product(models.Model):
 class Order(models.Model):
     ORDER_STATUS = (
         ('pending', 'Pending'),
+        ('paid', 'Paid'),
         ('confirmed', 'Confirmed'),
         ('shipped', 'Shipped'),
         ('delivered', 'Delivered'),
@@ -48,7 +62,7 @@ class Order(models.Model):
     order_number = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
 
     client = models.ForeignKey('AnonymousClient', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
-    email = models.EmailField(blank=True, default='')
+    email = models.EmailField(blank=True, default='', db_index=True)
     phone = models.CharField(max_length=20, blank=True, default='')
     delivery_address = models.TextField(blank=True, default='')
     delivery_instructions = models.TextField(blank=True, default='')
@@ -60,10 +74,29 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     bitcoin_amount = models.DecimalField(max_digits=15, decimal_places=8, null=True, blank=True)
     amount_sats = models.BigIntegerField(null=True, blank=True)
+    btc_rate = models.DecimalField(max_digits=20, decimal_places=8, null=True, blank=True)
+    # Pool address claimed at checkout (None with the placeholder address)
+    receiving_address = models.OneToOneField(
+        'ReceivingAddress', null=True, blank=True, on_delete=models.PROTECT, related_name='order'
+    )
     bitcoin_address = models.CharField(max_length=100, blank=True, default='')
     payment_confirmed = models.BooleanField(default=False)
     ip_hash = models.CharField(max_length=64, blank=True, null=True)
 
+    class Meta:
+        # Order history: newest first per client, keyset-paginated on (created_at, id)
+        indexes = [models.Index(fields=['client', 'created_at'])]
+
+    @property
+    def payment_uri(self):
+        amount = format_btc(self.amount_sats) if self.amount_sats is not None else self.bitcoin_amount
+        return f"bitcoin:{self.bitcoin_address}?amount={amount}"
+
+    def generate_qr_code(self, fmt='svg'):
+        # Encoded once per payment URI; later calls only check the cache
+        digest = get_qr_cache().ensure(self.payment_uri, fmt)
+        return reverse('order_qr', kwargs={'digest': digest, 'fmt': fmt})
+
     def __str__(self):
         return f"Order #{self.order_number}"
 
@@ -75,13 +108,20 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    price_btc = models.DecimalField(max_digits=15, decimal_places=8, null=True, blank=True)
+    price_sats = models.BigIntegerField(default=0)
+
+    @property
+    def price_btc(self):
+        return sats_to_btc(self.price_sats)
 
     def total_price(self):
         return self.price * self.quantity
 
+    def total_sats(self):
+        return self.price_sats * self.quantity
+
     def total_price_btc(self):
-        return (self.price_btc or 0) * self.quantity
+        return sats_to_btc(self.total_sats())
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
@@ -92,12 +132,60 @@ class OrderItem(models.Model):
 class DeliveryStation(models.Model):
     name = models.CharField(max_length=100)
     location = models.CharField(max_length=200)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     instructions = models.TextField(blank=True, default='')
     is_active = models.BooleanField(default=True)
 
     def __str__(self):
         return self.name
 
+# ----------------------------
+# Exchange Rates
+# ----------------------------
+class ExchangeRate(models.Model):
+    currency = models.CharField(max_length=10, default='USD')
+    fiat_per_btc = models.DecimalField(max_digits=20, decimal_places=8)
+    source = models.CharField(max_length=100, blank=True, default='')
+    fetched_at = models.DateTimeField(default=timezone.now)
+    # Set when the catalog's BTC prices were recomputed with this rate
+    repriced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['currency', '-fetched_at'])]
+
+    def __str__(self):
+        return f"1 BTC = {self.fiat_per_btc} {self.currency}"
+
+# ----------------------------
+# Receiving Address Pool
+# ----------------------------
+class ReceivingAddress(models.Model):
+    AVAILABLE = 'available'
+    ASSIGNED = 'assigned'
+    STATUS_CHOICES = (
+        (AVAILABLE, 'Available'),
+        (ASSIGNED, 'Assigned'),
+    )
+
+    address = models.CharField(max_length=100, unique=True)
+    chain = models.CharField(max_length=16)
+    derivation_index = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=AVAILABLE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    assigned_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chain', 'derivation_index'], name='unique_chain_derivation_index'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'derivation_index']),
+        ]
+
+    def __str__(self):
+        return self.address
+
 # ----------------------------
 # Bitcoin Wallet
 # ----------------------------
@@ -113,11 +201,18 @@ class BitcoinWallet(models.Model):
 # Anonymous Client & Cart
 # ----------------------------
 class AnonymousClient(models.Model):
-    ip_hash = models.CharField(max_length=64, unique=True)
+    # Not unique: clients behind one NAT or proxy share an address
+    ip_hash = models.CharField(max_length=64, db_index=True)
     user_agent = models.TextField(blank=True, null=True)
     session_id = models.CharField(max_length=100, default=generate_client_session_id, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     last_active = models.DateTimeField(auto_now=True)
+    # Counter cache, maintained by create_order (fix drift: manage.py reconcile_counters)
+    order_count = models.PositiveIntegerField(default=0)
+
+    def increment_order_count(self):
+        self.order_count += 1
+        AnonymousClient.objects.filter(pk=self.pk).update(order_count=models.F('order_count') + 1)
 
     def get_anonymous_identifier(self):
         return f"client_{self.id}_{self.ip_hash[:8]}"
@@ -137,15 +232,40 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # Counter cache of distinct CartItems, maintained through touch()
+    item_count = models.PositiveIntegerField(default=0)
 
     def get_item_count(self):
-        return self.items.count()
+        return self.item_count
+
+    def _touch_values(self, item_delta):
+        # Bumps updated_at (the cart's ETag version stamp) and the item counter in one UPDATE
+        self.updated_at = timezone.now()
+        self.item_count += item_delta
+        values = {'updated_at': self.updated_at}
+        if item_delta:
+            values['item_count'] = models.F('item_count') + item_delta
+        return values
+
+    def touch(self, item_delta=0):
+        Cart.objects.filter(pk=self.pk).update(**self._touch_values(item_delta))
 
     def get_total_fiat(self):
         return sum(item.product.price * item.quantity for item in self.items.all())
 
+    def _total_sats_aggregate(self):
+        price_sats = Coalesce(models.F('product__price_sats'), 0)
+        return {'total': Coalesce(models.Sum(models.F('quantity') * price_sats), 0)}
+
+    def get_total_sats(self):
+        # Exact integer sum in the database at current catalog prices (what checkout charges)
+        return self.items.aggregate(**self._total_sats_aggregate())['total']
+
+    async def aget_total_sats(self):
+        return (await self.items.aaggregate(**self._total_sats_aggregate()))['total']
+
     def get_total_btc(self):
-        return sum((item.product.price_btc or 0) * item.quantity for item in self.items.all())
+        return sats_to_btc(self.get_total_sats())
 
     def __str__(self):
         return f"Cart {self.session_id} - {self.client}"
@@ -155,6 +275,19 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    @property
+    def price_sats(self):
+        """Current catalog price (select_related('product') when listing items)."""
+        return self.product.price_sats or 0
+
+    @property
+    def unit_price_btc(self):
+        return sats_to_btc(self.price_sats)
+
+    @property
+    def total_btc(self):
+        return sats_to_btc(self.price_sats * self.quantity)
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
@@ -172,13 +305,108 @@ class EncryptedMessage(models.Model):
     )
     message_type = models.CharField(max_length=50, default='order_update')
     encrypted_content = models.TextField()
-    encryption_key = models.CharField(max_length=255)
+    encryption_key = models.CharField(max_length=255)  # id of the master key, never key material
     created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField(default=timezone.now() + timedelta(days=7))
+    expires_at = models.DateTimeField(default=default_message_expiry)
 
     def encrypt_message(self, content):
-        self.encrypted_content = f"encrypted_{content}_{self.created_at.timestamp()}"
-        self.encryption_key = f"key_{hashlib.sha256(content.encode()).hexdigest()[:32]}"
+        cipher = get_message_cipher()
+        self.encrypted_content = cipher.encrypt(self.order.order_number, self.message_type, content)
+        self.encryption_key = cipher.key_id
+
+    def decrypt_message(self):
+        return get_message_cipher().decrypt(self.order.order_number, self.message_type, self.encrypted_content)
 
     def __str__(self):
         return f"Message for Order #{self.order.order_number}"
+
+# ----------------------------
+# Backfill Checkpoints
+# ----------------------------
+class BackfillCheckpoint(models.Model):
+    name = models.CharField(max_length=200, unique=True)
+    last_pk = models.BigIntegerField(default=0)
+    rows_processed = models.BigIntegerField(default=0)
+    rows_changed = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_pk}"
+
+# ----------------------------
+# Order events and reporting rollups
+# ----------------------------
+class OrderEvent(models.Model):
+    """Append-only: one row per status change, written in the same transaction."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    from_status = models.CharField(max_length=20, blank=True, default='')
+    to_status = models.CharField(max_length=20)
+    amount_sats = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.order_id}: {self.from_status or '-'} -> {self.to_status}"
+
+
+ROLLUP_PERIODS = (
+    ('hour', 'Hour'),
+    ('day', 'Day'),
+)
+
+
+class OrderRollup(models.Model):
+    """Orders entering each status per hour/day, with their value in sats."""
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIODS)
+    bucket = models.DateTimeField()
+    status = models.CharField(max_length=20)
+    orders = models.PositiveIntegerField(default=0)
+    revenue_sats = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'status'], name='unique_order_rollup'),
+        ]
+
+
+class ProductSalesRollup(models.Model):
+    """Units and sats per product per hour/day, counted when an order is paid."""
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIODS)
+    bucket = models.DateTimeField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_rollups')
+    units = models.PositiveIntegerField(default=0)
+    revenue_sats = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'product'], name='unique_product_sales_rollup'),
+        ]
+
+# ----------------------------
+# Recommendations
+# ----------------------------
+class ProductPairCount(models.Model):
+    """Sparse co-purchase matrix: paid orders containing both products (stored both ways)."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='unique_product_pair'),
+        ]
+
+
+class ProductRecommendation(models.Model):
+    """Top-k "frequently bought together" per product, read with one indexed query."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_product_recommendation_rank'),
+        ]
@@ -0,0 +1,27 @@
+# store/money.py
+from decimal import ROUND_HALF_UP, Decimal
+
+# BTC amounts are stored and summed as integer satoshis; these convert at the edges.
+SATS_PER_BTC = 100_000_000
+
+
+def btc_to_sats(value):
+    """A BTC amount (Decimal, str or int) as integer satoshis, rounded half up."""
+    if value is None:
+        return None
+    return int((Decimal(str(value)) * SATS_PER_BTC).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def sats_to_btc(sats):
+    """Satoshis as a Decimal BTC amount with exactly 8 places, for display."""
+    if sats is None:
+        return None
+    return Decimal(sats).scaleb(-8)
+
+
+def format_btc(sats):
+    """Satoshis as a fixed-point BTC string ('0.00012000'), for JSON and exports."""
+    if sats is None:
+        return None
+    whole, fraction = divmod(abs(sats), SATS_PER_BTC)
+    return f"{'-' if sats < 0 else ''}{whole}.{fraction:08d}"
@@ -0,0 +1,71 @@
+# store/paginators.py
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+# Below this many rows an exact COUNT(*) is cheap and estimates are noisy.
+EXACT_COUNT_THRESHOLD = 10_000
+
+
+def estimated_row_count(model, using='default'):
+    """Return the planner's row estimate for a model's table, or None."""
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+                row = cursor.fetchone()
+                return int(row[0]) if row and row[0] >= 0 else None
+            if connection.vendor == 'sqlite':
+                # Populated by ANALYZE; first number of "stat" is the row count.
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                return int(row[0].split()[0]) if row else None
+            if connection.vendor == 'mysql':
+                cursor.execute(
+                    'SELECT table_rows FROM information_schema.tables '
+                    'WHERE table_schema = DATABASE() AND table_name = %s', [table]
+                )
+                row = cursor.fetchone()
+                return int(row[0]) if row and row[0] is not None else None
+    except DatabaseError:
+        return None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses the database's table statistics instead of COUNT(*)
+    when the queryset is unfiltered and the table is large.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_row_count(queryset.model, using=queryset.db)
+            if estimate is not None and estimate > EXACT_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class CursorPaginator(EstimatedCountPaginator):
+    """
+    EstimatedCountPaginator that can also page by primary key: given a
+    ``cursor`` (the last pk of the previous page, on a ``-pk`` ordered
+    queryset) page 1 is the rows below it, so deep pages skip OFFSET. The
+    cursor isn't part of object_list, so counts still cover the whole
+    (filtered) queryset and unfiltered ones keep using the estimate.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, cursor=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.cursor = cursor
+
+    def page(self, number):
+        page = super().page(number)
+        if self.cursor is not None:
+            page.object_list = self.object_list.filter(pk__lt=self.cursor)[:self.per_page]
+        return page
@@ -0,0 +1,238 @@
+# store/prerender.py
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from core.context_processors import site_settings
+from .models import Product, ProductRecommendation
+
+FEATURED_PRODUCTS = 3  # matches core.views.home
+
+logger = logging.getLogger(__name__)
+
+
+class StaticSite:
+    """
+    Pre-rendered copies of the catalog pages (home, about, product list and
+    product detail), written as <url>/index.html under ``directory`` so
+    nginx or a CDN can serve them with ``try_files $uri/index.html``. Pages
+    render without a request: the only per-visitor part, the cart badge, is
+    filled in by the browser from the cart_summary endpoint.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, url):
+        return os.path.join(self.directory, url.strip('/'), 'index.html')
+
+    def render(self, template, context):
+        return render_to_string(
+            template, {**site_settings(None), **context, 'static_page': True},
+            using=settings.STOREFRONT_TEMPLATE_ENGINE,
+        )
+
+    def write(self, url, content):
+        """Atomically replace the page at ``url``; untouched if the content is the same."""
+        path = self.path(url)
+        data = content.encode()
+        try:
+            with open(path, 'rb') as fh:
+                if fh.read() == data:
+                    return False
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+        return True
+
+    def remove(self, url):
+        try:
+            os.remove(self.path(url))
+        except FileNotFoundError:
+            return False
+        return True
+
+    # ----------------------------
+    # Pages
+    # ----------------------------
+    def write_home(self):
+        featured = Product.objects.filter(is_active=True)[:FEATURED_PRODUCTS]
+        return self.write(reverse('home'), self.render('core/home.html', {'featured_products': featured}))
+
+    def write_about(self):
+        return self.write(reverse('about'), self.render('core/about.html', {}))
+
+    def write_product_list(self):
+        products = Product.objects.filter(is_active=True)
+        return self.write(reverse('product_list'), self.render('store/product_list.html', {'products': products}))
+
+    def write_product_details(self, product_ids):
+        """Render the detail pages of ``product_ids``; remove those no longer for sale."""
+        changed = []
+        recommendations = {}
+        for rec in ProductRecommendation.objects.filter(
+            product_id__in=product_ids, recommended__is_active=True
+        ).select_related('recommended').order_by('product', 'rank'):
+            recommendations.setdefault(rec.product_id, []).append(rec.recommended)
+        live = set()
+        for product in Product.objects.filter(pk__in=product_ids, is_active=True):
+            live.add(product.pk)
+            url = reverse('product_detail', args=[product.pk])
+            if self.write(url, self.render('store/product_detail.html', {
+                'product': product,
+                'recommendations': recommendations.get(product.pk, []),
+            })):
+                changed.append(url)
+        for pk in set(product_ids) - live:
+            url = reverse('product_detail', args=[pk])
+            if self.remove(url):
+                changed.append(url)
+        return changed
+
+    def build(self, chunk_size=500):
+        """Render every catalog page and drop detail pages of retired products. Returns changed URLs."""
+        changed = [url for url, written in (
+            (reverse('home'), self.write_home()),
+            (reverse('about'), self.write_about()),
+            (reverse('product_list'), self.write_product_list()),
+        ) if written]
+        product_ids = list(Product.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(product_ids), chunk_size):
+            changed += self.write_product_details(product_ids[start:start + chunk_size])
+
+        # Detail pages on disk for products that are gone or inactive
+        detail_root = os.path.dirname(os.path.dirname(self.path(reverse('product_detail', args=[0]))))
+        live = set(map(str, product_ids))
+        if os.path.isdir(detail_root):
+            for name in os.listdir(detail_root):
+                if name.isdigit() and name not in live:
+                    url = reverse('product_detail', args=[int(name)])
+                    if self.remove(url):
+                        changed.append(url)
+        return changed
+
+    def regenerate_products(self, product_ids, listings=True):
+        """
+        Rewrite only the pages that show ``product_ids``: their own detail
+        pages, the pages recommending them and, with ``listings``, the list
+        and home pages. Pages whose output is unchanged keep their file, so
+        their CDN entries survive.
+        """
+        product_ids = set(product_ids)
+        if not product_ids:
+            return []
+        if not listings:
+            return self.write_product_details(sorted(product_ids))
+        changed = []
+        if self.write_home():
+            changed.append(reverse('home'))
+        if self.write_product_list():
+            changed.append(reverse('product_list'))
+        recommending = set(
+            ProductRecommendation.objects.filter(recommended_id__in=product_ids).values_list('product_id', flat=True)
+        )
+        changed += self.write_product_details(sorted(product_ids | recommending))
+        return changed
+
+
+def get_static_site():
+    """The configured export, or None when STATIC_SITE_DIR is unset."""
+    directory = settings.STATIC_SITE_DIR
+    return StaticSite(directory) if directory else None
+
+
+class RegenerationQueue:
+    """
+    Page regeneration, coalesced and off the request thread. Changes queue
+    up for STATIC_SITE_DEBOUNCE seconds, then one background pass renders
+    the listings once and each affected detail page once, however many
+    saves arrived meanwhile. ``run()`` drains the queue in the calling
+    thread (management commands call it before exiting).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # guards the queue
+        self._render_lock = threading.Lock()  # one pass renders at a time
+        self._reset()
+        self._worker_running = False
+
+    def _reset(self):
+        self.products = set()  # detail pages plus listings and pages recommending them
+        self.details = set()  # detail pages only
+        self.full_build = False
+
+    def add(self, product_ids=(), listings=True, full_build=False):
+        with self._lock:
+            (self.products if listings else self.details).update(product_ids)
+            self.full_build = self.full_build or full_build
+            start = not self._worker_running
+            self._worker_running = True
+        if start:
+            threading.Thread(target=self._work, name='static-site', daemon=True).start()
+
+    def _take(self):
+        with self._lock:
+            work = (self.products, self.details - self.products, self.full_build)
+            self._reset()
+        return work
+
+    def run(self, site=None):
+        """Render everything queued so far. Returns the changed URLs."""
+        site = site or get_static_site()
+        with self._render_lock:
+            products, details, full_build = self._take()
+            if site is None:
+                return []
+            if full_build:
+                return site.build()
+            return site.regenerate_products(products) + site.regenerate_products(details, listings=False)
+
+    def _work(self):
+        try:
+            while True:
+                time.sleep(settings.STATIC_SITE_DEBOUNCE)
+                try:
+                    self.run()
+                except Exception:
+                    logger.exception('Regenerating the static site failed')
+                with self._lock:
+                    if not (self.products or self.details or self.full_build):
+                        self._worker_running = False
+                        return
+        finally:
+            # Threads get their own DB connections, which nothing else would close
+            connections.close_all()
+
+
+regeneration_queue = RegenerationQueue()
+
+
+def schedule_regeneration(product_ids, listings=True):
+    """Queue the affected pages for regeneration once the current transaction commits."""
+    if not settings.STATIC_SITE_DIR:
+        return
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: regeneration_queue.add(product_ids, listings=listings))
+
+
+def schedule_build():
+    """Queue a full build once the current transaction commits (after bulk changes like repricing)."""
+    if not settings.STATIC_SITE_DIR:
+        return
+    transaction.on_commit(lambda: regeneration_queue.add(full_build=True))
+
+
+def regenerate_pending():
+    """Render queued pages now, in this thread; for processes about to exit."""
+    return regeneration_queue.run()
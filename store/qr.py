@@ -0,0 +1,131 @@
+# store/qr.py
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+QR_FORMATS = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+}
+
+
+def render_qr(data, fmt='svg'):
+    """Encode ``data`` as a QR image. SVG needs no Pillow; PNG does."""
+    import qrcode
+
+    buf = io.BytesIO()
+    if fmt == 'svg':
+        import qrcode.image.svg
+        qrcode.make(data, image_factory=qrcode.image.svg.SvgPathImage).save(buf)
+    elif fmt == 'png':
+        qrcode.make(data).save(buf)
+    else:
+        raise ValueError(f"Unsupported QR format: {fmt}")
+    return buf.getvalue()
+
+
+def qr_digest(data, fmt):
+    return hashlib.sha256(f"{fmt}:{data}".encode()).hexdigest()
+
+
+class QRCache:
+    """
+    Content-addressed QR store: files are named by sha256(format + payload),
+    so the same payload is only ever encoded once. The directory is kept to
+    ``max_entries`` files by evicting the least recently used (by mtime,
+    which is bumped on every hit); the directory is only scanned every
+    ``evict_every`` new files, so it may briefly hold that many more. A
+    small in-process LRU sits in front of it.
+    """
+
+    def __init__(self, directory, max_entries=10_000, memory_entries=256, evict_every=64):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.evict_every = evict_every
+        self._memory = OrderedDict()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, digest, fmt):
+        return os.path.join(self.directory, f"{digest}.{fmt}")
+
+    def _remember(self, key, content):
+        with self._lock:
+            self._memory[key] = content
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, digest, fmt):
+        """Return cached bytes or None. Never renders."""
+        key = (digest, fmt)
+        with self._lock:
+            content = self._memory.get(key)
+            if content is not None:
+                self._memory.move_to_end(key)
+                return content
+        path = self._path(digest, fmt)
+        try:
+            with open(path, 'rb') as fh:
+                content = fh.read()
+            os.utime(path)
+        except OSError:
+            return None
+        self._remember(key, content)
+        return content
+
+    def ensure(self, data, fmt='svg'):
+        """Make sure ``data`` is rendered and cached; return its digest."""
+        digest = qr_digest(data, fmt)
+        path = self._path(digest, fmt)
+        with self._lock:
+            cached = (digest, fmt) in self._memory
+        if cached or os.path.exists(path):
+            return digest
+
+        content = render_qr(data, fmt)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as fh:
+            fh.write(content)
+        os.replace(tmp_path, path)
+        self._remember((digest, fmt), content)
+        with self._lock:
+            self._writes += 1
+            due = self._writes >= self.evict_every
+            if due:
+                self._writes = 0
+        if due:
+            self.evict()
+        return digest
+
+    def evict(self):
+        try:
+            entries = [e for e in os.scandir(self.directory) if not e.name.endswith('.tmp')]
+        except OSError:
+            return 0
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return 0
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:excess]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        return excess
+
+
+_cache = None
+
+
+def get_qr_cache():
+    global _cache
+    if _cache is None:
+        _cache = QRCache(settings.QR_CACHE_DIR, settings.QR_CACHE_MAX_ENTRIES)
+    return _cache
@@ -0,0 +1,149 @@
+# store/ratelimit.py
+import hashlib
+import ipaddress
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import NoReverseMatch, reverse
+from django.utils.module_loading import import_string
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'30/m' -> (capacity, tokens per second). The bucket holds one period's worth."""
+    count, _, period = rate.partition('/')
+    count = int(count)
+    seconds = PERIODS[period[:1]] if period else 1
+    return count, count / seconds
+
+
+def refill(bucket, capacity, refill_rate, now):
+    """Tokens in a stored (tokens, updated_at) bucket as of ``now``; a missing bucket is full."""
+    if bucket is None:
+        return capacity
+    tokens, updated_at = bucket
+    return min(capacity, tokens + (now - updated_at) * refill_rate)
+
+
+def wait_for(levels, refill_rate):
+    """Seconds until every bucket holds a whole token (0 if they all do now)."""
+    lowest = min(levels, default=1)
+    return 0 if lowest >= 1 else (1 - lowest) / refill_rate
+
+
+class InMemoryBuckets:
+    """
+    Token buckets in a per-process dict. One lock, no I/O, so a check costs a
+    few microseconds. The least recently used buckets are dropped past
+    ``max_entries``; a dropped bucket just starts full again.
+    """
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, keys, capacity, refill_rate, now=None):
+        """
+        Take one token from each of ``keys``, or from none of them: return 0
+        if allowed, else seconds until every bucket has a token.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            levels = {key: refill(self._buckets.get(key), capacity, refill_rate, now) for key in keys}
+            wait = wait_for(levels.values(), refill_rate)
+            for key, tokens in levels.items():
+                self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class CacheBuckets:
+    """
+    Token buckets in a Django cache, shared by every worker using it (the
+    'shared' alias; 'default' is per process, which would give N workers N
+    times the limit). The read-modify-write isn't atomic, so concurrent
+    requests can occasionally both spend the last token; that slack is fine
+    for abuse control.
+    """
+
+    def __init__(self, alias='shared'):
+        self.cache = caches[alias]
+
+    def take(self, keys, capacity, refill_rate, now=None):
+        now = time.time() if now is None else now
+        cache_keys = {f"ratelimit:{key}": key for key in keys}
+        stored = self.cache.get_many(cache_keys)
+        levels = {
+            cache_key: refill(stored.get(cache_key), capacity, refill_rate, now) for cache_key in cache_keys
+        }
+        wait = wait_for(levels.values(), refill_rate)
+        # Expire once the bucket would be full again anyway
+        timeout = math.ceil(capacity / refill_rate) + 1
+        self.cache.set_many(
+            {cache_key: (tokens - 1 if not wait else tokens, now) for cache_key, tokens in levels.items()}, timeout
+        )
+        return wait
+
+
+_buckets = None
+
+
+def get_buckets():
+    global _buckets
+    if _buckets is None:
+        _buckets = import_string(settings.RATE_LIMIT_BACKEND)()
+    return _buckets
+
+
+def is_loopback(ip):
+    try:
+        return ipaddress.ip_address(ip).is_loopback
+    except ValueError:
+        return False
+
+
+def client_keys(request, ip):
+    """
+    Bucket keys for a request: its session cookie (if any) and its hashed IP.
+    A loopback address is no key: behind a local Tor daemon (or a proxy not
+    counted in TRUSTED_PROXY_HOPS) every visitor has it, so its bucket would
+    be one limit for the whole site.
+    """
+    keys = [] if is_loopback(ip) else ['ip:' + hashlib.sha256(ip.encode()).hexdigest()]
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session_key:
+        keys.append('session:' + session_key)
+    return keys
+
+
+class RateLimits:
+    """RATE_LIMITS ({url name: '30/m'}) resolved to {path: (name, capacity, refill_rate)}."""
+
+    def __init__(self, limits):
+        self.by_path = {}
+        for name, rate in limits.items():
+            try:
+                path = reverse(name)
+            except NoReverseMatch:
+                continue  # only argument-less endpoints can be limited by path
+            self.by_path[path] = (name,) + parse_rate(rate)
+
+    def check(self, request, ip, buckets):
+        """Return 0 if the request may proceed, else the Retry-After in seconds."""
+        limit = self.by_path.get(request.path_info)
+        if limit is None:
+            return 0
+        name, capacity, refill_rate = limit
+        keys = client_keys(request, ip)
+        if not keys:
+            return 0
+        # All or nothing: a request one bucket rejects doesn't drain the other
+        return buckets.take([f"{name}:{key}" for key in keys], capacity, refill_rate)
@@ -0,0 +1,196 @@
+# store/rates.py
+import json
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import BigIntegerField, DecimalField, F, Value
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .catalog import bump_catalog_version
+from .models import ExchangeRate, Product
+from .money import SATS_PER_BTC
+from .prerender import schedule_build
+
+RATE_CACHE_KEY = 'store:btc_rate:{currency}'
+# Shared, so workers see a refresh from the cron process straight away
+RATE_CACHE = 'shared'
+
+
+class RateError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class RateSnapshot:
+    currency: str
+    fiat_per_btc: Decimal
+    fetched_at: datetime
+    source: str = ''
+
+    def to_btc(self, fiat_amount):
+        return (Decimal(fiat_amount) / self.fiat_per_btc).quantize(Decimal('0.00000001'))
+
+    @property
+    def age(self):
+        return timezone.now() - self.fetched_at
+
+
+# ----------------------------
+# Providers
+# ----------------------------
+class RateProvider(ABC):
+    name = 'base'
+
+    @abstractmethod
+    def fetch(self, currency):
+        """Return how many units of ``currency`` one BTC costs, as a Decimal."""
+
+
+class StaticRateProvider(RateProvider):
+    """Fixed rate from settings.BTC_RATE_STATIC; for development and tests."""
+    name = 'static'
+
+    def __init__(self, rate=None):
+        self.rate = rate if rate is not None else settings.BTC_RATE_STATIC
+
+    def fetch(self, currency):
+        if self.rate in (None, ''):
+            raise RateError('BTC_RATE_STATIC is not set')
+        return _to_decimal(self.rate)
+
+
+class StubRateProvider(RateProvider):
+    """Hands out the given rates in order (the last one repeats) and counts calls; for tests."""
+    name = 'stub'
+
+    def __init__(self, *rates, error=None):
+        self.rates = list(rates)
+        self.error = error
+        self.calls = 0
+
+    def fetch(self, currency):
+        self.calls += 1
+        if self.error is not None:
+            raise RateError(self.error)
+        rate = self.rates.pop(0) if len(self.rates) > 1 else self.rates[0]
+        return _to_decimal(rate)
+
+
+class FileRateProvider(RateProvider):
+    """Reads {"USD": "65000.00", ...} from settings.BTC_RATE_FILE."""
+    name = 'file'
+
+    def __init__(self, path=None):
+        self.path = path or settings.BTC_RATE_FILE
+
+    def fetch(self, currency):
+        try:
+            with open(self.path, encoding='utf-8') as fh:
+                return _to_decimal(json.load(fh)[currency])
+        except (OSError, ValueError, KeyError) as e:
+            raise RateError(f"Cannot read {currency} rate from {self.path}: {e}")
+
+
+class CoinbaseRateProvider(RateProvider):
+    name = 'coinbase'
+    url = 'https://api.coinbase.com/v2/exchange-rates?currency=BTC'
+
+    def fetch(self, currency):
+        import requests
+
+        try:
+            response = requests.get(settings.BTC_RATE_URL or self.url, timeout=settings.BTC_RATE_TIMEOUT)
+            response.raise_for_status()
+            return _to_decimal(response.json()['data']['rates'][currency])
+        except (requests.RequestException, ValueError, KeyError) as e:
+            raise RateError(f"Coinbase rate lookup failed: {e}")
+
+
+def _to_decimal(value):
+    try:
+        rate = Decimal(str(value))
+    except InvalidOperation:
+        raise RateError(f"Invalid rate: {value!r}")
+    if rate <= 0:
+        raise RateError(f"Invalid rate: {value!r}")
+    return rate
+
+
+def get_provider():
+    return import_string(settings.BTC_RATE_PROVIDER)()
+
+
+# ----------------------------
+# Snapshots
+# ----------------------------
+def _cache_key(currency):
+    return RATE_CACHE_KEY.format(currency=currency)
+
+
+def get_rate_snapshot(currency=None):
+    """
+    The rate the catalog's BTC prices were computed with, for request-path
+    use (orders record it next to the amount they were charged). Reads the
+    cache, then the latest repriced ExchangeRate, and never calls the
+    provider; rates stored with reprice=False don't count. Returns None if
+    the catalog was never repriced.
+    """
+    currency = currency or settings.BTC_RATE_CURRENCY
+    cache = caches[RATE_CACHE]
+    snapshot = cache.get(_cache_key(currency))
+    if snapshot is None:
+        latest = (
+            ExchangeRate.objects.filter(currency=currency, repriced_at__isnull=False).order_by('-fetched_at').first()
+        )
+        if latest is None:
+            return None
+        snapshot = RateSnapshot(currency, latest.fiat_per_btc, latest.fetched_at, latest.source)
+        cache.set(_cache_key(currency), snapshot, settings.BTC_RATE_TTL)
+    return snapshot
+
+
+def reprice_catalog(fiat_per_btc):
+    """Set price_sats = price / rate (rounded to the satoshi) for every fiat-priced product in one UPDATE."""
+    # Multiply by the inverse: SQLite would truncate integer-valued prices on division.
+    sats_per_fiat = Decimal(SATS_PER_BTC) / Decimal(fiat_per_btc)
+    price_sats = Cast(
+        Round(F('price') * Value(sats_per_fiat, output_field=DecimalField(max_digits=40, decimal_places=20))),
+        BigIntegerField(),
+    )
+    with transaction.atomic():
+        updated = Product.objects.filter(price__gt=0).update(price_sats=price_sats)
+        # Only once the new prices are visible, or workers would tag old pages with the new version
+        transaction.on_commit(bump_catalog_version)
+        # Every price changed, so every pre-rendered page did too
+        schedule_build()
+    return updated
+
+
+def refresh_rate(provider=None, currency=None, reprice=True):
+    """
+    Fetch a new rate (off the request path) and store it. With ``reprice``
+    the catalog is repriced and the rate becomes the one get_rate_snapshot()
+    returns, in the same transaction; without, it's only recorded.
+    """
+    provider = provider or get_provider()
+    currency = currency or settings.BTC_RATE_CURRENCY
+    fiat_per_btc = provider.fetch(currency)
+
+    with transaction.atomic():
+        rate = ExchangeRate.objects.create(currency=currency, fiat_per_btc=fiat_per_btc, source=provider.name)
+        repriced = 0
+        if reprice:
+            repriced = reprice_catalog(fiat_per_btc)
+            rate.repriced_at = timezone.now()
+            rate.save(update_fields=['repriced_at'])
+    snapshot = RateSnapshot(currency, rate.fiat_per_btc, rate.fetched_at, rate.source)
+    if reprice:
+        caches[RATE_CACHE].set(_cache_key(currency), snapshot, settings.BTC_RATE_TTL)
+    return snapshot, repriced
@@ -0,0 +1,101 @@
+# store/recommendations.py
+import heapq
+from itertools import permutations
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .events import upsert_increment
+from .models import OrderItem, ProductPairCount, ProductRecommendation
+from .versions import bump_version, get_version
+
+TOP_K = 8
+# Orders that reached payment (seeded history may have skipped the 'paid' event).
+# Both the rebuild and the incremental updates count exactly these orders.
+PURCHASED_STATUSES = ('paid', 'confirmed', 'shipped', 'delivered')
+RECOMMENDATIONS_VERSION_KEY = 'store:recommendations_version'
+
+
+def get_recommendations_version():
+    return get_version(RECOMMENDATIONS_VERSION_KEY)
+
+
+def bump_recommendations_version():
+    return bump_version(RECOMMENDATIONS_VERSION_KEY)
+
+
+def purchase_delta(from_status, to_status):
+    """+1 when an order enters PURCHASED_STATUSES, -1 when it leaves (e.g. cancelled), else 0."""
+    return (to_status in PURCHASED_STATUSES) - (from_status in PURCHASED_STATUSES)
+
+
+def refresh_top_k(product_ids):
+    """Rewrite the top-k rows of ``product_ids`` from the pair counts."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    neighbours = {pk: [] for pk in product_ids}
+    for product_id, other_id, count in ProductPairCount.objects.filter(product_id__in=product_ids).values_list(
+        'product_id', 'other_id', 'count'
+    ):
+        neighbours[product_id].append((count, -other_id))
+    ProductRecommendation.objects.filter(product_id__in=product_ids).delete()
+    ProductRecommendation.objects.bulk_create([
+        ProductRecommendation(product_id=product_id, recommended_id=-negative_id, rank=rank, score=count)
+        for product_id, pairs in neighbours.items()
+        for rank, (count, negative_id) in enumerate(heapq.nlargest(TOP_K, pairs), start=1)
+    ], batch_size=1000)
+
+
+def record_purchase(order_id, delta=1):
+    """
+    Add (``delta=1``) or take back (``delta=-1``) one order's products in the
+    matrix and refresh their top-k. Returns the products whose top-k changed.
+    """
+    product_ids = set(OrderItem.objects.filter(order_id=order_id).values_list('product_id', flat=True))
+    if len(product_ids) < 2:
+        return set()
+    with transaction.atomic():
+        if delta > 0:
+            for product_id, other_id in permutations(sorted(product_ids), 2):
+                upsert_increment(ProductPairCount, {'product_id': product_id, 'other_id': other_id}, count=1)
+        else:
+            pairs = ProductPairCount.objects.filter(product_id__in=product_ids, other_id__in=product_ids)
+            pairs.filter(count__lte=1).delete()
+            pairs.update(count=F('count') - 1)
+        refresh_top_k(product_ids)
+    bump_recommendations_version()
+    return product_ids
+
+
+def build_recommendations():
+    """
+    Rebuild the whole matrix in one grouped self-join: for every pair of
+    products sharing a purchased order, count the orders. The database does
+    the counting set-wise, so Python only sees the non-zero cells.
+    """
+    pairs = (
+        # One filter() call, so the status check and the pairing share one join
+        OrderItem.objects.filter(
+            Q(order__items__product_id__lt=F('product_id')) | Q(order__items__product_id__gt=F('product_id')),
+            order__status__in=PURCHASED_STATUSES,
+        )
+        .values('product_id', other_id=F('order__items__product_id'))
+        .annotate(count=Count('order_id', distinct=True))
+        .order_by()
+    )
+    with transaction.atomic():
+        ProductPairCount.objects.all().delete()
+        product_ids = set()
+        batch = []
+        for row in pairs.iterator(chunk_size=5000):
+            batch.append(ProductPairCount(product_id=row['product_id'], other_id=row['other_id'], count=row['count']))
+            product_ids.add(row['product_id'])
+            if len(batch) >= 5000:
+                ProductPairCount.objects.bulk_create(batch)
+                batch = []
+        ProductPairCount.objects.bulk_create(batch)
+        ProductRecommendation.objects.all().delete()
+        refresh_top_k(product_ids)
+    bump_recommendations_version()
+    return len(product_ids)
@@ -0,0 +1,144 @@
+# store/resolver.py
+import asyncio
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class ReverseDNSResolver:
+    """
+    Reverse DNS with a hard timeout, kept off the request thread. Lookups
+    run on a small bounded thread pool, and concurrent requests for the same
+    IP share one lookup. Answers are cached for ``ttl`` seconds and failures
+    (including timeouts) for ``negative_ttl``. A lookup that finishes after
+    its caller gave up still fills the cache for the next request.
+    """
+
+    def __init__(self, ttl=3600, negative_ttl=300, timeout=0.5, max_entries=10_000, max_workers=4, lookup=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.lookup = lookup or socket.gethostbyaddr
+        self._cache = OrderedDict()  # ip -> (hostname or None, expires_at)
+        self._pending = {}
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rdns')
+
+    def _cached(self, ip):
+        with self._lock:
+            entry = self._cache.get(ip)
+            if entry is None:
+                return False, None
+            hostname, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._cache[ip]
+                return False, None
+            self._cache.move_to_end(ip)
+            return True, hostname
+
+    def _store(self, ip, hostname):
+        ttl = self.ttl if hostname else self.negative_ttl
+        with self._lock:
+            self._cache[ip] = (hostname, time.monotonic() + ttl)
+            self._cache.move_to_end(ip)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _run_lookup(self, ip):
+        hostname = None
+        try:
+            hostname = self.lookup(ip)[0]
+        except (OSError, UnicodeError):
+            pass  # no PTR record, invalid address, ...
+        finally:
+            # Even when the lookup raised something else: a stale future left in
+            # _pending would be handed to every later caller for this IP
+            with self._lock:
+                self._store(ip, hostname)
+                self._pending.pop(ip, None)
+        return hostname
+
+    def _timed_out(self, ip):
+        # Negative-cache while the slow lookup is still running so later requests
+        # don't each wait out the timeout; its real answer replaces this entry.
+        with self._lock:
+            if ip in self._pending:
+                self._store(ip, None)
+
+    def _submit(self, ip):
+        with self._lock:
+            future = self._pending.get(ip)
+            if future is None:
+                future = self._executor.submit(self._run_lookup, ip)
+                self._pending[ip] = future
+            return future
+
+    def resolve(self, ip):
+        """Hostname for ``ip``, or None if unknown or not answered within the timeout."""
+        hit, hostname = self._cached(ip)
+        if hit:
+            return hostname
+        try:
+            return self._submit(ip).result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._timed_out(ip)
+            return None
+
+    async def aresolve(self, ip):
+        hit, hostname = self._cached(ip)
+        if hit:
+            return hostname
+        future = asyncio.wrap_future(self._submit(ip))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self._timed_out(ip)
+            return None
+
+
+class StubResolver:
+    """
+    Resolver for tests: answers from a fixed mapping, never touches DNS.
+    Select it with REVERSE_DNS_RESOLVER and pass the mapping through
+    REVERSE_DNS_OPTIONS = {'hosts': {'10.0.0.1': 'relay.tor.example'}}.
+    """
+
+    def __init__(self, hosts=None, **kwargs):
+        self.hosts = dict(hosts or {})
+
+    def resolve(self, ip):
+        return self.hosts.get(ip)
+
+    async def aresolve(self, ip):
+        return self.hosts.get(ip)
+
+
+_resolver = None
+
+
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        _resolver = import_string(settings.REVERSE_DNS_RESOLVER)(
+            ttl=settings.REVERSE_DNS_TTL,
+            negative_ttl=settings.REVERSE_DNS_NEGATIVE_TTL,
+            timeout=settings.REVERSE_DNS_TIMEOUT,
+            **settings.REVERSE_DNS_OPTIONS,
+        )
+    return _resolver
+
+
+@receiver(setting_changed)
+def reset_resolver(setting, **kwargs):
+    # override_settings(REVERSE_DNS_...) takes effect on the next get_resolver()
+    global _resolver
+    if setting.startswith('REVERSE_DNS_'):
+        _resolver = None
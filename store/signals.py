@@ -0,0 +1,43 @@
+# store/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .events import order_status_changed
+from .models import DeliveryStation, Product
+from .prerender import schedule_regeneration
+from .recommendations import purchase_delta, record_purchase
+from .stations import bump_stations_version
+
+
+# Bulk operations (imports, repricing) skip these; they bump the version and
+# schedule page regeneration once themselves.
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    # Once the change is visible, or a concurrent request could cache the old
+    # catalog under the new stamp until the next bump
+    transaction.on_commit(bump_catalog_version)
+    schedule_regeneration([instance.pk])
+
+
+@receiver(post_save, sender=DeliveryStation)
+@receiver(post_delete, sender=DeliveryStation)
+def station_changed(sender, **kwargs):
+    transaction.on_commit(bump_stations_version)
+
+
+def refresh_recommendations(order_id, delta):
+    product_ids = record_purchase(order_id, delta)
+    # Their detail pages show the refreshed top-k
+    schedule_regeneration(product_ids, listings=False)
+
+
+@receiver(order_status_changed)
+def update_recommendations(sender, order, from_status, **kwargs):
+    delta = purchase_delta(from_status, order.status)
+    if delta:
+        # After the payment commits, not inside it: a failure here (logged) can't
+        # roll the payment back, and build_recommendations repairs any drift
+        transaction.on_commit(lambda: refresh_recommendations(order.pk, delta), robust=True)
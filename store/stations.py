@@ -0,0 +1,133 @@
+# store/stations.py
+import heapq
+import math
+import threading
+
+from .models import DeliveryStation
+from .versions import bump_version, get_version
+
+STATIONS_VERSION_KEY = 'store:stations_version'
+EARTH_RADIUS_KM = 6371.0088
+LEAF_SIZE = 16
+
+
+def to_unit_vector(latitude, longitude):
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class StationIndex:
+    """
+    k-nearest lookup over station coordinates. Points are mapped onto the
+    unit sphere and kept in a k-d tree with small leaf buckets, so distances
+    are exact great-circle ones (no lat/lon distortion near the poles or the
+    antimeridian) and clustered stations don't degrade it the way a fixed
+    grid would. Immutable once built: changes build a new index.
+    """
+
+    def __init__(self, points):
+        # points: iterable of (key, latitude, longitude)
+        self.keys = []
+        self.vectors = []
+        for key, latitude, longitude in points:
+            self.keys.append(key)
+            self.vectors.append(to_unit_vector(latitude, longitude))
+        self.root = self._build(list(range(len(self.vectors)))) if self.vectors else None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _build(self, indices):
+        if len(indices) <= LEAF_SIZE:
+            return indices
+        vectors = self.vectors
+        spreads = []
+        for axis in range(3):
+            values = [vectors[i][axis] for i in indices]
+            spreads.append(max(values) - min(values))
+        axis = spreads.index(max(spreads))
+        indices.sort(key=lambda i: vectors[i][axis])
+        middle = len(indices) // 2
+        # Left holds coordinates <= split, right >= split
+        return (axis, vectors[indices[middle]][axis], self._build(indices[:middle]), self._build(indices[middle:]))
+
+    def nearest(self, latitude, longitude, k=5):
+        """[(key, distance_km)] for the ``k`` closest points, nearest first."""
+        if self.root is None or k < 1:
+            return []
+        query = to_unit_vector(latitude, longitude)
+        vectors = self.vectors
+        best = []  # max-heap of (-squared chord, index)
+
+        def search(node):
+            if isinstance(node, list):
+                qx, qy, qz = query
+                for i in node:
+                    x, y, z = vectors[i]
+                    d2 = (x - qx) ** 2 + (y - qy) ** 2 + (z - qz) ** 2
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2, i))
+                    elif d2 < -best[0][0]:
+                        heapq.heapreplace(best, (-d2, i))
+                return
+            axis, split, left, right = node
+            diff = query[axis] - split
+            near, far = (left, right) if diff < 0 else (right, left)
+            search(near)
+            if len(best) < k or diff * diff < -best[0][0]:
+                search(far)
+
+        search(self.root)
+        return [(self.keys[i], chord_to_km(math.sqrt(-d2))) for d2, i in sorted(best, reverse=True)]
+
+
+# ----------------------------
+# Process-wide index of active stations
+# ----------------------------
+def get_stations_version():
+    return get_version(STATIONS_VERSION_KEY)
+
+
+def bump_stations_version():
+    """Tell every process to rebuild its station index (call once per batch)."""
+    return bump_version(STATIONS_VERSION_KEY)
+
+
+_state = None  # (version, index, {pk: station}), swapped as one object
+_lock = threading.Lock()
+
+
+def get_station_index():
+    """
+    The index of active stations with coordinates, plus {pk: station}. It is
+    rebuilt at most once per change (any process notices through the
+    version stamp in the shared cache), never per request.
+    """
+    global _state
+    version = get_stations_version()
+    state = _state
+    if state is None or state[0] != version:
+        with _lock:
+            state = _state
+            if state is None or state[0] != version:
+                stations = {
+                    station.pk: station
+                    for station in DeliveryStation.objects.filter(
+                        is_active=True, latitude__isnull=False, longitude__isnull=False
+                    )
+                }
+                state = _state = (
+                    version, StationIndex((pk, s.latitude, s.longitude) for pk, s in stations.items()), stations
+                )
+    return state[1], state[2]
+
+
+def nearest_stations(latitude, longitude, k=5):
+    """[(station, distance_km)] for the k nearest active stations."""
+    index, stations = get_station_index()
+    return [(stations[pk], distance) for pk, distance in index.nearest(latitude, longitude, k)]
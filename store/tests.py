@@ -1,3 +1,1651 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import addresses, concurrency, prerender, qr, ratelimit
+from .backfill import Backfill, TransformBackfill
+from .catalog import CATALOG_VERSION_KEY, get_catalog_version
+from .imports import import_products, read_upload
+from .recommendations import RECOMMENDATIONS_VERSION_KEY, build_recommendations, get_recommendations_version
+from .rates import RateProvider, StubRateProvider, get_rate_snapshot, refresh_rate
+from .resolver import ReverseDNSResolver, get_resolver
+from .concurrency import AdaptiveLimiter
+from .dashboard import build_dashboard, get_dashboard
+from .events import apply_event, rebuild_rollups, record_status_change, save_order_status
+from .messaging import MessageCipher, MessageDecryptionError
+from .middleware import get_client_ip
+from .money import btc_to_sats, format_btc, sats_to_btc
+from .models import (
+    AnonymousClient, BackfillCheckpoint, EncryptedMessage, ExchangeRate, ReceivingAddress, Cart, CartItem, DeliveryStation, Order,
+    OrderEvent, OrderItem, OrderRollup, Product, ProductPairCount, ProductRecommendation, ProductSalesRollup,
+)
+from .stations import EARTH_RADIUS_KM, STATIONS_VERSION_KEY, StationIndex
+from .views import apply_mock_payment, cart_snapshot
+
+try:
+    import jinja2
+except ImportError:
+    jinja2 = None
+
+
+class ApiTestCase(TestCase):
+    """Starts every test with full rate-limit buckets (they live per process, not per test)."""
+
+    def setUp(self):
+        super().setUp()
+        ratelimit._buckets = None
+        self.addCleanup(setattr, ratelimit, '_buckets', None)
+
+
+class OrderAdminCursorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        product = Product.objects.create(name='Item', description='', price=1)
+        for i in range(250):
+            order = Order.objects.create(email=f'buyer{i}@example.com', status='shipped' if i % 2 else 'pending')
+            OrderItem.objects.create(order=order, product=product, price=1)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/admin/store/order/{query}')
+        self.assertEqual(response.status_code, 200)
+        counts = [q['sql'] for q in queries.captured_queries if 'COUNT(' in q['sql'] and 'store_order' in q['sql']]
+        return response.context['cl'], counts
+
+    def test_cursor_pages_walk_every_order_once(self):
+        seen = []
+        cl, _ = self.changelist()
+        seen += [order.pk for order in cl.result_list]
+        while cl.next_cursor:
+            cl, _ = self.changelist(f'?cursor={cl.next_cursor}')
+            seen += [order.pk for order in cl.result_list]
+        self.assertEqual(seen, sorted(Order.objects.values_list('pk', flat=True), reverse=True))
+
+    @mock.patch('store.paginators.estimated_row_count', return_value=5_000_000)
+    def test_deep_cursor_pages_use_the_estimate(self, estimate):
+        first, counts = self.changelist()
+        self.assertEqual((first.result_count, counts), (5_000_000, []))
+        deep, counts = self.changelist(f'?cursor={first.next_cursor}')
+        self.assertEqual((deep.result_count, counts), (5_000_000, []))
+        self.assertLess(deep.result_list[0].pk, first.next_cursor)
+
+    @mock.patch('store.paginators.estimated_row_count', return_value=5_000_000)
+    def test_filtered_pages_count_exactly(self, estimate):
+        first, counts = self.changelist('?status__exact=shipped')
+        self.assertEqual((first.result_count, len(counts)), (125, 1))
+        deep, counts = self.changelist(f'?status__exact=shipped&cursor={first.next_cursor}')
+        # Still the whole filtered set, not what's left below the cursor
+        self.assertEqual((deep.result_count, len(counts)), (125, 1))
+        self.assertTrue(all(order.status == 'shipped' for order in deep.result_list))
+
+
+class OrderExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Item, "quoted"', description='', price=2, price_sats=1_000)
+        for i in range(5):
+            order = Order.objects.create(email=f'buyer{i}@example.com', status='shipped' if i % 2 else 'pending')
+            OrderItem.objects.create(order=order, product=cls.product, price=2, price_sats=1_000, quantity=i + 1)
+        Order.objects.create(email='empty@example.com', status='shipped')
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_orders', *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv_has_a_row_per_item(self):
+        rows = list(csv.DictReader(StringIO(self.export('--status', 'shipped', '--chunk-size', '2'))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual([row['quantity'] for row in rows], ['2', '4', ''])
+        self.assertEqual(rows[0]['product_name'], 'Item, "quoted"')
+        self.assertEqual(rows[0]['price_btc'], '0.00001000')
+
+    def test_jsonl_round_trips_orders(self):
+        lines = [json.loads(line) for line in self.export('--format', 'jsonl', '--since', '2000-01-01').splitlines()]
+        self.assertEqual(len(lines), 6)
+        self.assertEqual([item['quantity'] for line in lines for item in line['items']], [1, 2, 3, 4, 5])
+        self.assertEqual(self.export('--format', 'jsonl', '--until', '2000-01-01'), '')
+
+    def test_invalid_date_is_a_usage_error(self):
+        with self.assertRaisesMessage(CommandError, "argument --since: invalid date: 'yesterday'"):
+            self.export('--since', 'yesterday')
+
+
+class ProductImportTests(TestCase):
+    def upload(self, content, import_format='csv', **kwargs):
+        return import_products(read_upload(SimpleUploadedFile('products', content), import_format), **kwargs)
+
+    def test_creates_then_updates_by_sku(self):
+        result = self.upload(b'sku,name,description,price,price_btc,is_available\n'
+                             b'A1,Alpha,,1.50,0.0001,true\nB2,Beta,,2,,no\n')
+        self.assertEqual((result.created, result.updated, result.errors), (2, 0, []))
+        self.assertEqual(Product.objects.get(sku='A1').price_sats, 10_000)
+        self.assertFalse(Product.objects.get(sku='B2').is_available)
+
+        result = self.upload(b'{"sku": "A1", "price": "9.99"}\n{"sku": "B2", "price": "2"}\n', 'jsonl')
+        self.assertEqual((result.created, result.updated, result.unchanged), (0, 1, 1))
+        self.assertEqual(Product.objects.get(sku='A1').price, Decimal('9.99'))
+        self.assertEqual(Product.objects.get(sku='A1').name, 'Alpha')
+
+    def test_bad_rows_are_reported_per_row(self):
+        content = '\n'.join([
+            '{"sku": "OK1", "name": "Fine", "price": "1"}',
+            '{"sku": 123, "name": "Numeric sku", "price": "1"}',
+            '{"sku": "BAD", "name": "Broken", "price": ',
+            '["not", "an", "object"]',
+            '{"sku": "OK1", "name": "Again", "price": "2"}',
+            '{"name": "No sku", "price": "1"}',
+            '{"sku": "NEW"}',
+            '{"sku": "PRICE", "name": "Bad price", "price": "abc"}',
+            '{"sku": "OK2", "name": "Fine too", "price": "3"}',
+        ]).encode() + b'\n{"sku": "LATIN1", "name": "Caf\xe9", "price": "1"}\n'
+        result = self.upload(content, 'jsonl', chunk_size=3)
+        errors = dict(result.errors)
+        self.assertEqual(sorted(errors), [2, 3, 4, 5, 6, 7, 8, 10])
+        self.assertEqual(errors[2], 'sku must be a string')
+        self.assertTrue(errors[3].startswith('invalid JSON'))
+        self.assertEqual(errors[4], 'expected an object')
+        self.assertEqual(errors[5], 'duplicate sku OK1 (first on line 1)')
+        self.assertEqual(errors[10], 'not valid UTF-8')
+        self.assertEqual(result.created, 2)
+        self.assertEqual(Product.objects.get(sku='OK1').name, 'Fine')
+        self.assertEqual(sorted(Product.objects.values_list('sku', flat=True)), ['OK1', 'OK2'])
+
+    def test_invalid_utf8_in_csv_only_fails_its_row(self):
+        result = self.upload(b'sku,name,price\nA,Caf\xe9,1\nB,Cafe,1\n')
+        self.assertEqual((result.created, result.errors), (1, [(1, 'not valid UTF-8')]))
+
+    def test_dry_run_writes_nothing(self):
+        result = self.upload(b'sku,name,price\nA,Alpha,1\n', dry_run=True)
+        self.assertEqual(result.created, 1)
+        self.assertFalse(Product.objects.exists())
+
+    def test_admin_upload(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.post('/admin/store/product/import/', {
+            'format': 'jsonl', 'file': SimpleUploadedFile('p.jsonl', b'{"sku": 1}\n{"sku": "J1", "name": "J", "price": "2"}'),
+        }, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([str(m) for m in response.context['messages']][0], 'Line 1: sku must be a string')
+        self.assertTrue(Product.objects.filter(sku='J1').exists())
+
+    def test_command_reads_files(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as fh:
+            fh.write(b'\xef\xbb\xbfsku,name,price\nA,Alpha,1\n')
+        self.addCleanup(os.remove, fh.name)
+        out = StringIO()
+        call_command('import_products', fh.name, stdout=out)
+        self.assertIn('1 created', out.getvalue())
+
+
+class SharedVersionTests(TestCase):
+    def test_bump_in_another_process_is_seen(self):
+        # A throwaway file cache both processes use, not the live var/cache
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        with override_settings(CACHES={**settings.CACHES, 'shared': shared}):
+            before = get_catalog_version()
+            subprocess.run(
+                [sys.executable, 'manage.py', 'shell', '-c',
+                 'from store.catalog import bump_catalog_version; bump_catalog_version()'],
+                cwd=settings.BASE_DIR, check=True, capture_output=True,
+                env={**os.environ, 'SHARED_CACHE_URL': f'filecache://{location}'},
+            )
+            self.assertNotEqual(get_catalog_version(), before)
+
+
+class BackfillTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Order.objects.bulk_create([Order(email=f'buyer{i}@example.com') for i in range(25)])
+        cls.kept = Order.objects.order_by('pk')[4]
+        Order.objects.filter(pk=cls.kept.pk).update(session_id='keep')
+
+    def fix(self, *args):
+        out = StringIO()
+        call_command('fix_order_relations', '--chunk-size', '10', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        self.assertIn('[dry run] 24 of 24 rows changed in 3 chunks', self.fix('--dry-run'))
+        self.assertEqual(Order.objects.filter(session_id='').count(), 24)
+        self.assertFalse(BackfillCheckpoint.objects.exists())
+
+    def test_resumes_from_checkpoint(self):
+        self.assertIn('10 of 10 rows changed in 1 chunks', self.fix('--max-chunks', '1'))
+        checkpoint = BackfillCheckpoint.objects.get(name='fix_order_relations')
+        self.assertIsNone(checkpoint.completed_at)
+        # Rows the first run covered aren't walked again on resume
+        Order.objects.filter(pk__lte=checkpoint.last_pk).exclude(pk=self.kept.pk).update(session_id='')
+        output = self.fix()
+        self.assertIn('14 of 14 rows changed in 2 chunks', output)
+        self.assertIn(f'(resumed after pk {checkpoint.last_pk})', output)
+        self.assertEqual(Order.objects.filter(session_id='').count(), 10)
+        checkpoint.refresh_from_db()
+        self.assertIsNotNone(checkpoint.completed_at)
+        # A finished checkpoint starts over on the next run
+        self.assertIn('10 of 10 rows changed in 1 chunks', self.fix())
+        self.assertEqual(Order.objects.get(pk=self.kept.pk).session_id, 'keep')
+        self.assertEqual(Order.objects.get(pk=1 + self.kept.pk).session_id, f'anon_{1 + self.kept.pk}')
+
+    def test_transform_backfill(self):
+        class Uppercase(TransformBackfill):
+            model = Order
+            update_fields = ['email']
+
+            def transform(self, order):
+                if order.email.isupper():
+                    return False
+                order.email = order.email.upper()
+                return True
+
+        result = Uppercase(chunk_size=7, checkpoint=False).run()
+        self.assertEqual((result.chunks, result.rows_changed), (4, 25))
+        self.assertEqual(Uppercase(checkpoint=False).run().rows_changed, 0)
+        self.assertEqual(Order.objects.get(pk=self.kept.pk).email, 'BUYER4@EXAMPLE.COM')
+
+    def test_base_class_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Backfill(model=Order)
+
+
+class RateTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['shared'].clear()
+        self.fiat = Product.objects.create(name='Fiat priced', description='', price=Decimal('65.00'))
+        self.btc_only = Product.objects.create(name='BTC priced', description='', price=0, price_sats=12_345)
+
+    def refresh(self, *rates, reprice=True):
+        return refresh_rate(StubRateProvider(*rates), currency='USD', reprice=reprice)
+
+    def test_base_provider_is_abstract(self):
+        with self.assertRaises(TypeError):
+            RateProvider()
+
+    def test_reprice_rounds_to_the_satoshi(self):
+        snapshot, repriced = self.refresh('65000')
+        self.assertEqual((snapshot.fiat_per_btc, repriced), (Decimal('65000'), 1))
+        self.fiat.refresh_from_db()
+        self.btc_only.refresh_from_db()
+        self.assertEqual(self.fiat.price_sats, 100_000)
+        self.assertEqual(self.btc_only.price_sats, 12_345)
+        self.refresh('70000.01')
+        self.fiat.refresh_from_db()
+        self.assertEqual(self.fiat.price_sats, 92_857)  # 92857.1415...
+
+    def test_snapshot_is_the_rate_prices_use(self):
+        self.assertIsNone(get_rate_snapshot('USD'))
+        self.refresh('65000')
+        self.refresh('80000', reprice=False)
+        self.assertEqual(ExchangeRate.objects.count(), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_rate_snapshot('USD').fiat_per_btc, Decimal('65000'))
+        caches['shared'].clear()
+        self.assertEqual(get_rate_snapshot('USD').fiat_per_btc, Decimal('65000'))
+        self.fiat.refresh_from_db()
+        self.assertEqual(self.fiat.price_sats, 100_000)
+
+    def test_order_records_the_pricing_rate(self):
+        self.refresh('65000')
+        self.refresh('1', reprice=False)
+        self.client.post('/store/api/add-to-cart/', {'product_id': self.fiat.pk, 'quantity': 2},
+                         content_type='application/json')
+        response = self.client.post('/store/api/create-order/', {}, content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        order = Order.objects.get()
+        self.assertEqual((order.btc_rate, order.amount_sats), (Decimal('65000'), 200_000))
+
+    def test_provider_errors_change_nothing(self):
+        provider = StubRateProvider(error='down')
+        with self.assertRaisesMessage(CommandError, 'down'), \
+                mock.patch('store.rates.get_provider', return_value=provider):
+            call_command('refresh_btc_rate', stdout=StringIO())
+        self.assertEqual(provider.calls, 1)
+        self.assertFalse(ExchangeRate.objects.exists())
+        self.fiat.refresh_from_db()
+        self.assertIsNone(self.fiat.price_sats)
+
+    def test_command(self):
+        out = StringIO()
+        with override_settings(BTC_RATE_STATIC='50000'):
+            call_command('refresh_btc_rate', '--provider', 'store.rates.StaticRateProvider', stdout=out)
+        self.assertIn('1 BTC = 50000 USD (static); repriced 1 products', out.getvalue())
+
+
+class QRCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.cache = qr._cache = qr.QRCache(directory, max_entries=3, evict_every=2)
+        self.addCleanup(setattr, qr, '_cache', None)
+        self.order = Order.objects.create(bitcoin_address='tb1qexample', bitcoin_amount=Decimal('0.001'))
+
+    def test_renders_once_and_serves_immutable(self):
+        url = self.order.generate_qr_code()
+        with mock.patch('store.qr.render_qr', side_effect=AssertionError('rendered twice')):
+            self.assertEqual(self.order.generate_qr_code(), url)
+            self.cache._memory.clear()
+            self.assertEqual(self.order.generate_qr_code(), url)
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get(url.replace('.svg', '.png')).status_code, 404)
+
+    def test_eviction_is_batched(self):
+        for i in range(6):
+            self.cache.ensure(f'bitcoin:address{i}?amount=1')
+            files = len(os.listdir(self.cache.directory))
+            # Scanned on every second write only, trimming back to max_entries
+            self.assertEqual(files, min(i + 1, 3) if i % 2 else min(i + 1, 4))
+
+    def test_render_failure_does_not_fail_the_order(self):
+        product = Product.objects.create(name='Item', description='', price=1, price_sats=1_000)
+        self.client.post('/store/api/add-to-cart/', {'product_id': product.pk}, content_type='application/json')
+        with mock.patch('store.qr.render_qr', side_effect=OSError('disk full')), \
+                self.assertLogs('store.views', 'ERROR'):
+            data = self.client.post('/store/api/create-order/', {}, content_type='application/json').json()
+            self.assertTrue(data['success'])
+            self.assertIsNone(data['qr_code'])
+            response = self.client.get(f"/store/order/{data['order_id']}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.filter(order_number=data['order_id']).count(), 1)
+
+
+# One testnet key, as a BIP84 vpub (P2WPKH addresses) and a BIP44 tpub (P2PKH)
+TEST_XPUB = (
+    'vpub5SLqN2bLY4WeZJ9SmNJHsyzqVKreTXD4ZnPC22MugDNcjhKX5xNX9QiQWcE4SSRzVWyHWUihpKRT7hckDGNzVc69wSX2JPcfGeNiT5c2XZy'
+)
+TEST_TPUB = (
+    'tpubD6NzVbkrYhZ4XgiXtGrdW5XDAPFCL9h7we1vwNCpn8tGbBcgfVYjXyhWo4E1xkh56hjod1RhGjxbaTLV3X4FyWuejifB9jusQ46QzG87VKp'
+)
+# BIP32 test vector 1, chain m
+BIP32_XPUB = (
+    'xpub661MyMwAqRbcFtXgS5sYJABqqG9YLmC4Q1Rdap9gSE8NqtwybGhePY2gZ29ESFjqJoCu1Rupje8YtGqsefD265TMg7usUDFdp6W1EGMcet8'
+)
+
+
+@override_settings(ADDRESS_POOL_XPUB=TEST_XPUB, ADDRESS_POOL_AUTO_REFILL=False, ADDRESS_POOL_LOW_WATER=2)
+class AddressPoolTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Item', description='', price=1, price_sats=1_000)
+
+    def checkout(self):
+        self.client.post('/store/api/add-to-cart/', {'product_id': self.product.pk}, content_type='application/json')
+        return self.client.post('/store/api/create-order/', {}, content_type='application/json').json()
+
+    def test_refill_counts_only_inserted_rows(self):
+        self.assertEqual(addresses.refill_pool(target=5, batch_size=2), 5)
+        self.assertEqual(addresses.refill_pool(target=5), 0)
+        self.assertEqual(
+            list(ReceivingAddress.objects.order_by('derivation_index').values_list('derivation_index', flat=True)),
+            [0, 1, 2, 3, 4],
+        )
+        self.assertTrue(all(address.startswith('tb1q') for address in ReceivingAddress.objects.values_list(
+            'address', flat=True)))
+        # The address of index 5 is already taken, so that insert is skipped
+        _, taken = next(addresses.derive_addresses(TEST_XPUB, 5, 1))
+        ReceivingAddress.objects.create(address=taken, chain='other', derivation_index=0,
+                                        status=ReceivingAddress.ASSIGNED)
+        self.assertEqual(addresses.refill_pool(target=7, batch_size=10), 2)
+        self.assertEqual(addresses.available_addresses().count(), 7)
+
+    def test_address_type_follows_the_key_version(self):
+        self.assertEqual(addresses.ExtendedPublicKey.from_string(BIP32_XPUB).address(), '15mKKb2eos1hWa6tisdPwwDC1a5J1y9nma')
+        (_, segwit), = addresses.derive_addresses(TEST_XPUB, 0, 1)
+        (_, legacy), = addresses.derive_addresses(TEST_TPUB, 0, 1)
+        self.assertTrue(segwit.startswith('tb1q'))
+        self.assertIn(legacy[0], 'mn')
+
+    def test_checkout_claims_and_links_an_address(self):
+        addresses.refill_pool(target=3)
+        first, second = self.checkout(), self.checkout()
+        self.assertNotEqual(first['bitcoin_address'], second['bitcoin_address'])
+        order = Order.objects.get(order_number=first['order_id'])
+        self.assertEqual(order.receiving_address.address, first['bitcoin_address'])
+        self.assertEqual(order.receiving_address.status, ReceivingAddress.ASSIGNED)
+
+    def test_failed_checkout_returns_the_address(self):
+        addresses.refill_pool(target=3)
+        with mock.patch('store.views.record_status_change', side_effect=RuntimeError('boom')):
+            self.assertFalse(self.checkout()['success'])
+        self.assertEqual(addresses.available_addresses().count(), 3)
+
+    def test_empty_pool_refuses_checkout_and_signals(self):
+        received = []
+        addresses.address_pool_low.connect(lambda **kwargs: received.append(kwargs['remaining']), weak=False)
+        self.addCleanup(addresses.address_pool_low.receivers.clear)
+        with self.assertLogs('store.addresses', 'WARNING'):
+            data = self.checkout()
+        self.assertEqual(data['error'], 'Payment addresses temporarily unavailable, try again shortly')
+        self.assertEqual(received, [0])
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(ADDRESS_POOL_XPUB='')
+    def test_no_xpub_skips_the_pool(self):
+        with self.assertNoLogs('store.addresses'):
+            data = self.checkout()
+        self.assertEqual(data['bitcoin_address'], 'tb1qexampletestnetaddress')
+        self.assertIsNone(Order.objects.get().receiving_address)
+
+    def test_background_refill_closes_its_connection(self):
+        with mock.patch('store.addresses.refill_pool') as refill, \
+                mock.patch('store.addresses.connections') as connections:
+            addresses._refill_in_background()
+            with addresses._refill_lock:  # released once the thread is done
+                pass
+        refill.assert_called_once_with()
+        connections.close_all.assert_called_once_with()
+
+
+class CartPricingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Item', description='', price=1, price_sats=1_000)
+        self.client.post('/store/api/add-to-cart/', {'product_id': self.product.pk, 'quantity': 2},
+                         content_type='application/json')
+        # Repriced after it went into the cart
+        Product.objects.filter(pk=self.product.pk).update(price_sats=1_500)
+
+    def test_cart_shows_the_price_checkout_charges(self):
+        self.assertContains(self.client.get('/store/cart/'), '0.00003000 BTC')
+        snapshot = cart_snapshot(Cart.objects.get(is_active=True))
+        self.assertEqual(snapshot['cart_total_sats'], 3_000)
+        self.assertEqual(snapshot['items'][0]['price_sats'], 1_500)
+
+        data = self.client.post('/store/api/create-order/', {}, content_type='application/json').json()
+        self.assertEqual(data['amount_sats'], 3_000)
+        order = Order.objects.get(order_number=data['order_id'])
+        self.assertEqual(list(order.items.values_list('price_sats', flat=True)), [1_500])
+
+    def test_checkout_retires_the_cart_once(self):
+        stale = Cart.objects.get(is_active=True)
+        self.assertTrue(self.client.post('/store/api/create-order/', {}, content_type='application/json').json()['success'])
+        stale.refresh_from_db()
+        self.assertEqual((stale.is_active, stale.item_count, stale.items.count()), (False, 0, 0))
+        # A resubmit is against the new, empty cart
+        data = self.client.post('/store/api/create-order/', {}, content_type='application/json').json()
+        self.assertEqual(data, {'success': False, 'error': 'Cart is empty'})
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Cart.objects.filter(is_active=True).count(), 1)  # the empty checkout rolled back
+
+
+class AsyncViewTests(ApiTestCase):
+    """The ASGI path: async middleware and views, driven through the async test client."""
+
+    async def test_cart_and_session_survive_across_requests(self):
+        product = await Product.objects.acreate(name='Item', description='', price=1, price_sats=1_000)
+        for quantity in (2, 1):
+            response = await self.async_client.post(
+                '/store/api/add-to-cart/', {'product_id': product.pk, 'quantity': quantity},
+                content_type='application/json',
+            )
+        self.assertEqual(response.json()['cart_count'], 1)
+        self.assertEqual(response.json()['cart_total_sats'], 3_000)
+        self.assertEqual(await AnonymousClient.objects.acount(), 1)
+        item = await CartItem.objects.aget()
+        self.assertEqual(item.quantity, 3)
+        response = await self.async_client.get('/store/api/cart/')
+        self.assertEqual(response.json(), {'cart_count': 1})
+
+    async def test_async_pages(self):
+        product = await Product.objects.acreate(name='Item', description='', price=1)
+        self.assertEqual((await self.async_client.get(f'/store/product/{product.pk}/')).status_code, 200)
+        self.assertEqual((await self.async_client.get('/store/product/999999/')).status_code, 404)
+        order = await Order.objects.acreate(bitcoin_address='tb1qexample', bitcoin_amount=Decimal('0.001'))
+        response = await self.async_client.get(f'/store/api/order-status/{order.order_number}/')
+        self.assertEqual(response.json()['status'], 'pending')
+        self.assertEqual((await self.async_client.get(f'/store/api/order-status/{uuid.uuid4()}/')).status_code, 404)
+
+
+class BatchApiTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.limited = Product.objects.create(name='Limited', description='', price=1, price_sats=1_000, max_per_order=5)
+        self.other = Product.objects.create(name='Other', description='', price=1, price_sats=2_000)
+        self.order = Order.objects.create(bitcoin_address='tb1qexample', bitcoin_amount=Decimal('0.001'))
+
+    def batch(self, operations):
+        response = self.client.post('/store/api/batch/', {'operations': operations}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_operations_apply_in_order(self):
+        data = self.batch([
+            {'op': 'add', 'product_id': self.limited.pk, 'quantity': 2},
+            {'op': 'add', 'product_id': str(self.other.pk)},
+            {'op': 'add', 'product_id': self.limited.pk, 'quantity': 4},
+            {'op': 'set', 'product_id': self.limited.pk, 'quantity': 3},
+            {'op': 'remove', 'product_id': self.other.pk},
+            {'op': 'remove', 'product_id': 999999},
+            {'op': 'order_status', 'order_id': str(self.order.order_number)},
+            {'op': 'order_status', 'order_id': 'not-a-uuid'},
+            {'op': 'refund'},
+        ])
+        self.assertEqual([r['success'] for r in data['results']],
+                         [True, True, False, True, True, False, True, False, False])
+        self.assertEqual(data['results'][2]['error'], 'Max 5 per order')
+        self.assertEqual(data['results'][6]['order']['status'], 'pending')
+        self.assertEqual(data['cart']['cart_count'], 1)
+        self.assertEqual(data['cart']['cart_total_sats'], 3_000)
+        self.assertEqual(Cart.objects.get(is_active=True).item_count, 1)
+
+    def test_malformed_operations_fail_on_their_own(self):
+        data = self.batch([
+            {'op': 'add', 'product_id': self.limited.pk, 'quantity': None},
+            {'op': 'add', 'product_id': self.limited.pk, 'quantity': [1]},
+            {'op': 'add', 'product_id': self.limited.pk, 'quantity': {'n': 1}},
+            {'op': 'add', 'product_id': self.limited.pk, 'quantity': 'two'},
+            {'op': 'add', 'product_id': [self.limited.pk]},
+            {'op': 'add', 'product_id': {'id': 1}},
+            {'op': 'add', 'product_id': str(self.limited.pk), 'quantity': '2'},
+        ])
+        self.assertEqual([r.get('error') for r in data['results']], [
+            'Quantity must be an integer', 'Quantity must be an integer', 'Quantity must be an integer',
+            'Quantity must be an integer', 'Product not found', 'Product not found', None,
+        ])
+        self.assertEqual(data['cart']['items'][0]['quantity'], 2)
+
+    def test_invalid_requests(self):
+        for body in ('[]', '{"operations": []}', '{"operations": [1]}', 'nope'):
+            response = self.client.post('/store/api/batch/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_query_count_does_not_grow_with_lookups(self):
+        operations = [{'op': 'order_status', 'order_id': str(self.order.order_number)}] * 20
+        self.batch(operations[:1])  # session, client and cart exist from here on
+        with CaptureQueriesContext(connection) as few:
+            self.batch(operations[:2])
+        with CaptureQueriesContext(connection) as many:
+            self.batch(operations)
+        # Each operation gets a savepoint, but no reads of its own
+        def reads(queries):
+            return [q['sql'] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(reads(few)), len(reads(many)))
+
+
+class ConditionalGetTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['shared'].clear()
+        self.product = Product.objects.create(name='Item', description='', price=Decimal('65.00'))
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code
+
+    def test_catalog_pages_revalidate(self):
+        for url in ('/store/products/', f'/store/product/{self.product.pk}/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(self.revalidate(url, response), 304)
+
+    def test_bump_from_another_process_invalidates(self):
+        response = self.client.get('/store/products/')
+        caches['shared'].set(CATALOG_VERSION_KEY, 'bumped elsewhere', None)
+        self.assertEqual(self.revalidate('/store/products/', response), 200)
+
+    def test_reprice_invalidates(self):
+        response = self.client.get('/store/products/')
+        with self.captureOnCommitCallbacks(execute=True):
+            refresh_rate(StubRateProvider('65000'), currency='USD')
+        second = self.client.get('/store/products/')
+        self.assertEqual(self.revalidate('/store/products/', response), 200)
+        self.assertContains(second, '100000')
+
+    def test_deploy_invalidates(self):
+        with override_settings(DEPLOY_VERSION='release-1'):
+            responses = [self.client.get(url) for url in ('/store/products/', f'/store/product/{self.product.pk}/')]
+        with override_settings(DEPLOY_VERSION='release-2'):
+            self.assertEqual(self.revalidate('/store/products/', responses[0]), 200)
+            self.assertEqual(self.revalidate(f'/store/product/{self.product.pk}/', responses[1]), 200)
+
+    def test_product_save_invalidates_after_commit(self):
+        response = self.client.get('/store/products/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+            self.assertEqual(self.revalidate('/store/products/', response), 304)
+        self.assertEqual(self.revalidate('/store/products/', response), 200)
+
+    def test_cart_changes_invalidate(self):
+        response = self.client.get('/store/products/')
+        self.client.post('/store/api/add-to-cart/', {'product_id': self.product.pk}, content_type='application/json')
+        self.assertEqual(self.revalidate('/store/products/', response), 200)
+
+    def test_order_status_revalidates_until_it_changes(self):
+        order = Order.objects.create(bitcoin_address='tb1qexample', bitcoin_amount=Decimal('0.001'))
+        url = f'/store/api/order-status/{order.order_number}/'
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response), 304)
+        order.status = 'shipped'
+        order.save()
+        self.assertEqual(self.revalidate(url, response), 200)
+
+
+class ResolverTests(SimpleTestCase):
+    def resolver(self, lookup, **kwargs):
+        resolver = ReverseDNSResolver(lookup=lookup, **kwargs)
+        self.addCleanup(resolver._executor.shutdown)
+        return resolver
+
+    def test_answers_and_failures_are_cached(self):
+        def gethostbyaddr(ip):
+            if ip != '10.0.0.1':
+                raise OSError('host not found')
+            return ('host.example', [], [ip])
+
+        lookup = mock.Mock(side_effect=gethostbyaddr)
+        resolver = self.resolver(lookup)
+        for _ in range(2):
+            self.assertEqual(resolver.resolve('10.0.0.1'), 'host.example')
+            self.assertIsNone(resolver.resolve('10.0.0.2'))
+        self.assertEqual(lookup.call_count, 2)
+
+    def test_expired_entries_are_looked_up_again(self):
+        lookup = mock.Mock(side_effect=OSError)
+        resolver = self.resolver(lookup, negative_ttl=60)
+        with mock.patch('store.resolver.time.monotonic', return_value=1000):
+            resolver.resolve('10.0.0.1')
+        with mock.patch('store.resolver.time.monotonic', return_value=1030):
+            resolver.resolve('10.0.0.1')
+        self.assertEqual(lookup.call_count, 1)
+        with mock.patch('store.resolver.time.monotonic', return_value=1061):
+            resolver.resolve('10.0.0.1')
+        self.assertEqual(lookup.call_count, 2)
+
+    def test_slow_lookup_times_out_then_fills_the_cache(self):
+        release = threading.Event()
+
+        def lookup(ip):
+            release.wait(5)
+            return ('slow.example', [], [ip])
+
+        resolver = self.resolver(lookup, timeout=0.01)
+        self.assertIsNone(resolver.resolve('10.0.0.1'))
+        self.assertIsNone(asyncio.run(resolver.aresolve('10.0.0.1')))  # negative-cached, no second wait
+        future = resolver._pending['10.0.0.1']
+        release.set()
+        future.result(5)
+        self.assertEqual(resolver.resolve('10.0.0.1'), 'slow.example')
+
+    def test_unexpected_error_does_not_leave_a_pending_lookup(self):
+        lookup = mock.Mock(side_effect=[RuntimeError('boom'), ('host.example', [], [])])
+        resolver = self.resolver(lookup, negative_ttl=0)
+        with self.assertRaises(RuntimeError):
+            resolver.resolve('10.0.0.1')
+        self.assertEqual(resolver._pending, {})
+        with mock.patch('store.resolver.time.monotonic', return_value=time.monotonic() + 1):
+            self.assertEqual(resolver.resolve('10.0.0.1'), 'host.example')
+
+    @override_settings(
+        REVERSE_DNS_RESOLVER='store.resolver.StubResolver',
+        REVERSE_DNS_OPTIONS={'hosts': {'127.0.0.1': 'exit-relay.tor.example'}},
+    )
+    def test_stub_resolver_from_settings(self):
+        self.assertEqual(get_resolver().resolve('127.0.0.1'), 'exit-relay.tor.example')
+
+
+@override_settings(
+    REVERSE_DNS_RESOLVER='store.resolver.StubResolver',
+    REVERSE_DNS_OPTIONS={'hosts': {'127.0.0.1': 'exit-relay.tor.example'}},
+)
+class ClientInfoTests(ApiTestCase):
+    def test_tor_hostname_is_flagged(self):
+        response = self.client.get('/store/api/client-info/')
+        self.assertEqual(response.json()['ip_address'], '127.0.0.1')
+        self.assertIs(response.json()['is_tor'], True)
+
+    def test_unknown_hostname(self):
+        with override_settings(REVERSE_DNS_OPTIONS={}):
+            self.assertIs(self.client.get('/store/api/client-info/').json()['is_tor'], False)
+
+
+class HomePageTests(ApiTestCase):
+    def test_sessions_sharing_an_address_get_their_own_client(self):
+        # Every Tor visitor arrives as 127.0.0.1
+        first, second = Client(), Client()
+        self.assertEqual(first.get('/').status_code, 200)
+        self.assertEqual(second.get('/').status_code, 200)
+        self.assertEqual(AnonymousClient.objects.count(), 2)
+        self.assertEqual(first.get('/').context['cart'], Cart.objects.get(client__session_id=first.session['client_session_id']))
+
+
+class CounterCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Item', description='', price=1, price_sats=1_000)
+
+    def add(self):
+        return self.client.post('/store/api/add-to-cart/', {'product_id': self.product.pk}, content_type='application/json')
+
+    def test_add_and_remove_keep_the_counter(self):
+        self.add()
+        self.add()
+        cart = Cart.objects.get()
+        self.assertEqual(cart.item_count, 1)
+        self.client.post('/store/api/remove-from-cart/', {'product_id': self.product.pk}, content_type='application/json')
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.items.count()), (0, 0))
+
+    def test_removing_a_missing_item_leaves_the_counter(self):
+        self.add()
+        # Already removed by a concurrent request
+        CartItem.objects.all().delete()
+        response = self.client.post('/store/api/remove-from-cart/', {'product_id': self.product.pk},
+                                    content_type='application/json')
+        self.assertEqual(response.json(), {'success': False, 'error': 'Item not in cart'})
+        self.assertEqual(Cart.objects.get().item_count, 1)  # left for reconcile_counters, not driven below
+
+    def test_failed_counter_update_rolls_back_the_item(self):
+        self.client.get('/store/api/cart/')  # creates the cart
+        with mock.patch.object(Cart, 'touch', side_effect=RuntimeError('boom')):
+            self.assertFalse(self.add().json()['success'])
+        self.assertFalse(CartItem.objects.exists())
+        self.add()
+        with mock.patch.object(Cart, 'touch', side_effect=RuntimeError('boom')):
+            self.client.post('/store/api/remove-from-cart/', {'product_id': self.product.pk}, content_type='application/json')
+        self.assertEqual(CartItem.objects.count(), 1)
+        self.assertEqual(Cart.objects.get().item_count, 1)
+
+    def test_reconcile_counters(self):
+        client = AnonymousClient.objects.create(ip_hash='a' * 64, order_count=7)
+        Order.objects.create(client=client)
+        drifted = Cart.objects.create(item_count=5)
+        CartItem.objects.create(cart=drifted, product=self.product, quantity=1)
+        correct = Cart.objects.create(item_count=0)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('item_count on Cart:', out.getvalue())
+        self.assertEqual(Cart.objects.get(pk=drifted.pk).item_count, 1)
+        self.assertEqual(Cart.objects.get(pk=correct.pk).item_count, 0)
+        self.assertEqual(AnonymousClient.objects.get(pk=client.pk).order_count, 1)
+        # Nothing left to fix
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertEqual(out.getvalue().count('0 of 0 rows changed'), 2)
+
+
+class RateLimiterTests(SimpleTestCase):
+    def test_buckets_refill_over_time(self):
+        buckets = ratelimit.InMemoryBuckets()
+        capacity, refill_rate = ratelimit.parse_rate('2/m')
+        self.assertEqual((capacity, refill_rate), (2, 2 / 60))
+        self.assertEqual([buckets.take(['a'], capacity, refill_rate, now=0) for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(buckets.take(['a'], capacity, refill_rate, now=0), 30)
+        self.assertAlmostEqual(buckets.take(['a'], capacity, refill_rate, now=20), 10)
+        self.assertEqual(buckets.take(['a'], capacity, refill_rate, now=30), 0)
+
+    def assert_all_or_nothing(self, buckets):
+        self.assertEqual(buckets.take(['session:1'], 1, 1, now=0), 0)
+        # The session bucket is empty, so the IP bucket must keep its token
+        self.assertAlmostEqual(buckets.take(['ip:x', 'session:1'], 1, 1, now=0.5), 0.5)
+        self.assertEqual(buckets.take(['ip:x'], 1, 1, now=0.5), 0)
+
+    def test_rejection_takes_no_tokens(self):
+        self.assert_all_or_nothing(ratelimit.InMemoryBuckets())
+
+    def test_cache_buckets(self):
+        caches['shared'].clear()
+        self.assert_all_or_nothing(ratelimit.CacheBuckets())
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        buckets = ratelimit.InMemoryBuckets(max_entries=2)
+        for key in 'abc':
+            buckets.take([key], 1, 1, now=0)
+        self.assertEqual(list(buckets._buckets), ['b', 'c'])
+
+    def test_client_ip_ignores_forwarded_for_by_default(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.9', HTTP_X_FORWARDED_FOR='1.2.3.4')
+        self.assertEqual(get_client_ip(request), '10.0.0.9')
+        with override_settings(TRUSTED_PROXY_HOPS=1):
+            self.assertEqual(get_client_ip(request), '1.2.3.4')
+            # Spoofed entries are left of the one our proxy appended
+            request.META['HTTP_X_FORWARDED_FOR'] = '6.6.6.6, 1.2.3.4'
+            self.assertEqual(get_client_ip(request), '1.2.3.4')
+        with override_settings(TRUSTED_PROXY_HOPS=2):
+            request.META['HTTP_X_FORWARDED_FOR'] = '6.6.6.6, 1.2.3.4, 10.0.0.2'
+            self.assertEqual(get_client_ip(request), '1.2.3.4')
+
+
+class RateLimitMiddlewareTests(ApiTestCase):
+    def create_order(self, **extra):
+        self.client.cookies.clear()  # the IP bucket alone
+        extra.setdefault('REMOTE_ADDR', '203.0.113.7')
+        return self.client.post('/store/api/create-order/', {}, content_type='application/json', **extra)
+
+    def test_loopback_visitors_are_limited_per_session_only(self):
+        # Behind a local Tor daemon everyone is 127.0.0.1: no site-wide bucket
+        for _ in range(6):
+            self.assertEqual(self.create_order(REMOTE_ADDR='127.0.0.1').status_code, 200)
+        post = lambda: self.client.post('/store/api/create-order/', {}, content_type='application/json')
+        self.assertEqual([post().status_code for _ in range(6)], [200] * 5 + [429])
+
+    def test_forwarded_for_does_not_bypass_the_limit(self):
+        responses = [self.create_order(HTTP_X_FORWARDED_FOR=f'10.1.0.{i}') for i in range(6)]
+        self.assertEqual([r.status_code for r in responses[:5]], [200] * 5)
+        self.assertEqual(responses[5].status_code, 429)
+        self.assertEqual(responses[5]['Retry-After'], '12')
+
+    @override_settings(TRUSTED_PROXY_HOPS=1)
+    def test_clients_behind_a_trusted_proxy_are_limited_separately(self):
+        for _ in range(5):
+            self.create_order(HTTP_X_FORWARDED_FOR='10.1.0.1')
+        self.assertEqual(self.create_order(HTTP_X_FORWARDED_FOR='10.1.0.1').status_code, 429)
+        self.assertEqual(self.create_order(HTTP_X_FORWARDED_FOR='10.1.0.2').status_code, 200)
+
+
+class PurgeSessionsTests(TestCase):
+    def test_deletes_only_expired_sessions_in_chunks(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(days=1)) for i in range(5)]
+            + [Session(session_key='live', session_data='', expire_date=now + timedelta(days=1))]
+        )
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('purge_sessions', '--chunk-size', '2', stdout=out)
+        self.assertIn('Deleted 5 expired sessions', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+        deletes = [q for q in queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 3)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_engines_without_a_table(self):
+        out = StringIO()
+        call_command('purge_sessions', stdout=out)
+        self.assertIn('keeps no session table', out.getvalue())
+
+
+class ProfileStartupTests(SimpleTestCase):
+    def test_reports_packages_and_modules(self):
+        out = StringIO()
+        call_command('profile_startup', '--target', 'setup', '--runs', '1', '--limit', '3', '--package', 'store', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertRegex(lines[0], r'^setup: median [\d.]+ ms over 1 cold starts')
+        header = next(i for i, line in enumerate(lines) if line.startswith('module'))
+        modules = lines[header + 1:]
+        self.assertEqual(len(modules), 3)
+        self.assertTrue(all(line.startswith('store') for line in modules))
+
+    def test_failed_start_is_a_command_error(self):
+        with mock.patch.dict('store.management.commands.profile_startup.TARGETS', {'setup': 'import no_such_module'}):
+            with self.assertRaisesMessage(CommandError, "No module named 'no_such_module'"):
+                call_command('profile_startup', '--target', 'setup', '--runs', '1', stdout=StringIO())
+
+
+class OrderHistoryTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.get('/store/api/orders/')  # creates the visitor's AnonymousClient
+        visitor = AnonymousClient.objects.get()
+        product = Product.objects.create(name='Item', description='', price=1, price_sats=1_000)
+        orders = Order.objects.bulk_create(
+            [Order(client=visitor, amount_sats=1_000 * i) for i in range(7)]
+            + [Order(client=AnonymousClient.objects.create(ip_hash='b' * 64), amount_sats=1)]
+        )
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=order, product=product, quantity=1, price=1, price_sats=1_000) for order in orders]
+        )
+        # Ties on created_at are broken by id
+        base = timezone.now()
+        for i, order in enumerate(orders):
+            Order.objects.filter(pk=order.pk).update(created_at=base - timedelta(minutes=i // 3))
+        self.visitor = visitor
+
+    def pages(self, limit):
+        url, seen, queries = f'/store/api/orders/?limit={limit}', [], []
+        while url:
+            with CaptureQueriesContext(connection) as captured:
+                body = self.client.get(url).json()
+            queries.append(len(captured))
+            seen.append([order['id'] for order in body['orders']])
+            url = body['next'] and f"/store/api/orders/?limit={limit}&cursor={body['next']}"
+        return seen, queries
+
+    def test_walks_every_order_once_newest_first(self):
+        expected = list(
+            Order.objects.filter(client=self.visitor).order_by('-created_at', '-pk').values_list('order_number', flat=True)
+        )
+        pages, queries = self.pages(limit=3)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), [str(number) for number in expected])
+        # Deep pages cost the same as the first
+        self.assertEqual(len(set(queries)), 1)
+
+    def test_items_are_included(self):
+        order = self.client.get('/store/api/orders/?limit=1').json()['orders'][0]
+        self.assertEqual(order['items'], [[Product.objects.get().pk, 'Item', 1, '0.00001000']])
+
+    def test_bad_parameters(self):
+        for query in ('limit=0', 'limit=x', 'cursor=not-a-cursor', 'cursor=%FF'):
+            self.assertEqual(self.client.get(f'/store/api/orders/?{query}').status_code, 400, query)
+
+
+class MessageCipherTests(SimpleTestCase):
+    def setUp(self):
+        self.cipher = MessageCipher(b'k' * 32)
+        self.order_number = uuid.uuid4()
+
+    def test_round_trip(self):
+        token = self.cipher.encrypt(self.order_number, 'order_update', 'Shipped today')
+        self.assertNotIn('Shipped', token)
+        self.assertEqual(self.cipher.decrypt(self.order_number, 'order_update', token), 'Shipped today')
+        # Fresh nonce per message
+        self.assertNotEqual(token, self.cipher.encrypt(self.order_number, 'order_update', 'Shipped today'))
+
+    def test_token_is_bound_to_order_type_and_key(self):
+        token = self.cipher.encrypt(self.order_number, 'order_update', 'hello')
+        for order_number, message_type, cipher in [
+            (uuid.uuid4(), 'order_update', self.cipher),
+            (self.order_number, 'dispute', self.cipher),
+            (self.order_number, 'order_update', MessageCipher(b'x' * 32)),
+        ]:
+            with self.assertRaises(MessageDecryptionError):
+                cipher.decrypt(order_number, message_type, token)
+        with self.assertRaises(MessageDecryptionError):
+            self.cipher.decrypt(self.order_number, 'order_update', 'not base64!')
+
+    def test_decrypt_many_skips_unreadable_rows(self):
+        token = self.cipher.encrypt(self.order_number, 'order_update', 'hello')
+        rows = [('order_update', 'v1', token), ('order_update', 'v0', token), ('order_update', 'v1', 'plain text')]
+        self.assertEqual(self.cipher.decrypt_many(self.order_number, rows), ['hello', None, None])
+
+    def test_derived_keys_are_cached(self):
+        cipher = MessageCipher(b'k' * 32, cache_size=1)
+        with mock.patch.object(cipher, '_derive', wraps=cipher._derive) as derive:
+            for order_number in (self.order_number, self.order_number, uuid.uuid4(), self.order_number):
+                cipher.for_order(order_number)
+        self.assertEqual(derive.call_count, 3)
+
+
+class OrderMessageTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.get('/store/api/orders/')  # creates the visitor's AnonymousClient
+        self.order = Order.objects.create(client=AnonymousClient.objects.get())
+
+    def send(self, content):
+        return self.client.post(
+            '/store/api/send-message/', {'order_id': str(self.order.order_number), 'content': content},
+            content_type='application/json',
+        ).json()
+
+    def inbox(self, query=''):
+        return self.client.get(f'/store/api/orders/{self.order.order_number}/messages/{query}').json()
+
+    def test_messages_are_stored_encrypted_and_read_back(self):
+        self.send('first')
+        self.send('second')
+        self.assertFalse(EncryptedMessage.objects.filter(encrypted_content__contains='first').exists())
+        page = self.inbox('?limit=1')
+        self.assertEqual([message['content'] for message in page['messages']], ['second'])
+        page = self.inbox(f"?limit=1&before={page['next']}")
+        self.assertEqual(([message['content'] for message in page['messages']], page['next']), (['first'], None))
+
+    def test_expiry_is_computed_per_message(self):
+        sent_at = timezone.now() + timedelta(days=30)
+        with mock.patch('store.models.timezone.now', return_value=sent_at):
+            expires_at = self.send('later')['expires_at']
+        self.assertEqual(expires_at, (sent_at + timedelta(days=7)).isoformat())
+
+    def test_expired_messages_are_hidden(self):
+        self.send('old')
+        EncryptedMessage.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.send('new')
+        self.assertEqual([message['content'] for message in self.inbox()['messages']], ['new'])
+
+    def test_other_visitors_cannot_read_or_write(self):
+        self.order.client = AnonymousClient.objects.create(ip_hash='c' * 64)
+        self.order.save()
+        self.assertEqual(self.send('hi')['error'], 'Not authorized')
+        response = self.client.get(f'/store/api/orders/{self.order.order_number}/messages/')
+        self.assertEqual(response.status_code, 403)
+
+
+class OrderEventTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Item', description='', price=1, price_sats=1_000)
+
+    def order(self, amount_sats=3_000, quantity=3, age=timedelta(minutes=3)):
+        order = Order.objects.create(bitcoin_address='tb1qexample', bitcoin_amount=Decimal('0.00003'), amount_sats=amount_sats)
+        OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price=1, price_sats=1_000)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - age)
+        return Order.objects.get(pk=order.pk)
+
+    def rollups(self):
+        return (
+            sorted(OrderRollup.objects.values_list('period', 'bucket', 'status', 'orders', 'revenue_sats')),
+            sorted(ProductSalesRollup.objects.values_list('period', 'bucket', 'product_id', 'units', 'revenue_sats')),
+        )
+
+    def test_concurrent_polls_record_one_payment(self):
+        order = self.order()
+        first, second = Order.objects.get(pk=order.pk), Order.objects.get(pk=order.pk)
+        self.assertTrue(apply_mock_payment(first))
+        self.assertFalse(apply_mock_payment(second))
+        self.assertEqual(second.status, 'paid')
+        self.assertEqual(list(OrderEvent.objects.values_list('from_status', 'to_status')), [('pending', 'paid')])
+        self.assertEqual(OrderRollup.objects.get(period='day').orders, 1)
+        self.assertEqual(ProductSalesRollup.objects.get(period='day').units, 3)
+
+    def test_order_status_poll_pays_once(self):
+        order = self.order()
+        url = f'/store/api/order-status/{order.order_number}/'
+        self.assertEqual([self.client.get(url).json()['status'] for _ in range(2)], ['paid', 'paid'])
+        self.assertEqual(OrderEvent.objects.filter(to_status='paid').count(), 1)
+        self.assertFalse(apply_mock_payment(self.order(age=timedelta(0))))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        now = timezone.now()
+        history = [
+            (self.order(1_000, 1), [('pending', now - timedelta(days=2)), ('paid', now - timedelta(days=2, minutes=-5))]),
+            (self.order(2_000, 2), [('pending', now - timedelta(hours=5)), ('paid', now - timedelta(hours=4))]),
+            (self.order(3_000, 3), [('pending', now - timedelta(hours=4)), ('cancelled', now)]),
+            (self.order(4_000, 4), [('pending', now)]),
+        ]
+        for order, changes in history:
+            from_status = ''
+            for to_status, when in changes:
+                apply_event(OrderEvent.objects.create(
+                    order=order, from_status=from_status, to_status=to_status,
+                    amount_sats=order.amount_sats, created_at=when,
+                ))
+                from_status = to_status
+        incremental = self.rollups()
+        self.assertEqual(OrderRollup.objects.filter(period='day', status='paid').count(), 2)
+
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+        # Drift in recent buckets is repaired without touching older ones
+        OrderRollup.objects.filter(bucket__gte=now - timedelta(hours=3)).update(orders=99)
+        OrderRollup.objects.filter(bucket__lt=now - timedelta(days=1)).delete()
+        rebuild_rollups(since=now - timedelta(hours=1))
+        self.assertFalse(OrderRollup.objects.filter(orders=99).exists())
+        self.assertFalse(OrderRollup.objects.filter(bucket__lt=now - timedelta(days=1)).exists())
+        call_command('rebuild_order_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.widget = Product.objects.create(name='Widget', description='', price=1, price_sats=1_000, stock_quantity=3)
+        self.gadget = Product.objects.create(name='Gadget', description='', price=1, price_sats=5_000, stock_quantity=50)
+        for product, quantity, status in [(self.widget, 4, 'paid'), (self.gadget, 1, 'paid'), (self.widget, 2, 'cancelled')]:
+            order = Order.objects.create(amount_sats=product.price_sats * quantity)
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=1, price_sats=product.price_sats)
+            order.status = status
+            record_status_change(order, 'pending')
+
+    def test_figures_come_from_the_rollups_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            dashboard = build_dashboard('7d')
+        self.assertFalse([q for q in queries if '"store_order"' in q['sql'] or '"store_orderitem"' in q['sql']])
+        self.assertEqual((dashboard['paid_orders'], dashboard['revenue_sats']), (2, 9_000))
+        self.assertEqual(dashboard['revenue_btc'], Decimal('0.00009'))
+        self.assertEqual(dashboard['orders_by_status'], [{'status': 'paid', 'orders': 2}, {'status': 'cancelled', 'orders': 1}])
+        self.assertEqual([(row['product__name'], row['units']) for row in dashboard['top_products']], [('Widget', 4), ('Gadget', 1)])
+        self.assertEqual(dashboard['low_stock'][0]['name'], 'Widget')
+
+    def test_old_buckets_fall_out_of_the_window(self):
+        OrderRollup.objects.update(bucket=F('bucket') - timedelta(days=8))
+        ProductSalesRollup.objects.update(bucket=F('bucket') - timedelta(days=8))
+        self.assertEqual(build_dashboard('7d')['paid_orders'], 0)
+        self.assertEqual(build_dashboard('30d')['paid_orders'], 2)
+
+    def test_cached_until_refreshed(self):
+        first = get_dashboard('7d')
+        order = Order.objects.create(amount_sats=1_000, status='paid')
+        record_status_change(order, 'pending', items=[])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard('7d'), first)
+        self.assertEqual(get_dashboard('7d', refresh=True)['paid_orders'], 3)
+
+    def test_admin_view(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.get('/admin/store/order/dashboard/?window=24h')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['dashboard']['window'], '24h')
+        self.assertEqual(self.client.get('/admin/store/order/dashboard/?window=bogus').context['dashboard']['window'], '7d')
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.a, self.b, self.c = (
+            Product.objects.create(name=name, description='', price=1, price_sats=1_000) for name in 'ABC'
+        )
+
+    def order(self, *products):
+        order = Order.objects.create(amount_sats=1_000 * len(products))
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, price=1, price_sats=1_000)
+        return order
+
+    def move(self, order, status):
+        from_status, order.status = order.status, status
+        with self.captureOnCommitCallbacks(execute=True):
+            save_order_status(order, from_status)
+
+    def matrix(self):
+        return (
+            sorted(ProductPairCount.objects.values_list('product__name', 'other__name', 'count')),
+            sorted(ProductRecommendation.objects.values_list('product__name', 'rank', 'recommended__name', 'score')),
+        )
+
+    def test_incremental_matches_rebuild(self):
+        first, second, third = self.order(self.a, self.b, self.c), self.order(self.a, self.b), self.order(self.b, self.c)
+        self.move(first, 'paid')
+        self.move(second, 'confirmed')  # confirmed by hand, never 'paid'
+        self.move(second, 'shipped')
+        self.move(third, 'paid')
+        self.move(third, 'cancelled')
+        incremental = self.matrix()
+        self.assertIn(('A', 'B', 2), incremental[0])
+        self.assertIn(('B', 1, 'A', 2), incremental[1])
+        self.assertIn(('C', 'B', 1), incremental[0])
+        build_recommendations()
+        self.assertEqual(self.matrix(), incremental)
+
+    def test_runs_after_the_payment_commits(self):
+        order = self.order(self.a, self.b)
+        version = get_recommendations_version()
+        order.status = 'paid'
+        with self.captureOnCommitCallbacks() as callbacks:
+            save_order_status(order, 'pending')
+        self.assertFalse(ProductPairCount.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(ProductPairCount.objects.count(), 2)
+        self.assertNotEqual(get_recommendations_version(), version)
+        self.assertEqual(caches['shared'].get(RECOMMENDATIONS_VERSION_KEY), get_recommendations_version())
+
+    def test_failure_does_not_undo_the_payment(self):
+        order = self.order(self.a, self.b)
+        with mock.patch('store.signals.record_purchase', side_effect=IntegrityError('rank taken')), \
+                self.assertLogs(level='ERROR'):
+            self.move(order, 'paid')
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'paid')
+        self.assertEqual(OrderEvent.objects.filter(to_status='paid').count(), 1)
+
+    def test_product_page_shows_top_k(self):
+        self.move(self.order(self.a, self.b), 'paid')
+        response = self.client.get(f'/store/product/{self.a.pk}/')
+        self.assertEqual(list(response.context['recommendations']), [self.b])
+
+
+class StaticSiteMixin:
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(STATIC_SITE_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.queue = prerender.RegenerationQueue()
+        for patcher in (
+            mock.patch.object(prerender, 'regeneration_queue', self.queue),
+            mock.patch('store.prerender.threading.Thread'),
+        ):
+            self.addCleanup(patcher.stop)
+            patcher.start()
+        self.site = prerender.get_static_site()
+        self.product = Product.objects.create(name='Widget', description='', price=Decimal('65.00'), price_sats=100_000)
+        self.site.build()
+
+    def page(self, url):
+        with open(self.site.path(url)) as fh:
+            return fh.read()
+
+
+class PrerenderTests(StaticSiteMixin, TestCase):
+    def test_saves_are_coalesced_off_the_request(self):
+        other = Product.objects.create(name='Gadget', description='', price=1, price_sats=1_000)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get('/store/products/')  # the request itself renders nothing
+            for name in ('Widget v2', 'Widget v3'):
+                self.product.name = name
+                self.product.save()
+        other.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            other.save()
+        prerender.threading.Thread.assert_called_once()
+        self.assertNotIn('Widget v3', self.page('/store/products/'))
+
+        with mock.patch.object(prerender.StaticSite, 'write_product_list', autospec=True,
+                               side_effect=prerender.StaticSite.write_product_list) as write_product_list:
+            changed = prerender.regenerate_pending()
+        self.assertEqual(write_product_list.call_count, 1)
+        self.assertIn(f'/store/product/{self.product.pk}/', changed)
+        self.assertIn('Widget v3', self.page(f'/store/product/{self.product.pk}/'))
+        self.assertFalse(os.path.exists(self.site.path(f'/store/product/{other.pk}/')))
+        self.assertEqual(prerender.regenerate_pending(), [])
+
+    def test_worker_drains_the_queue(self):
+        self.queue.add([self.product.pk])
+        run, passes = self.queue.run, []
+
+        def flaky_run():
+            passes.append(run())
+            if len(passes) == 1:
+                self.queue.add([self.product.pk])  # arrives during the first pass
+                raise RuntimeError('boom')
+
+        with mock.patch('store.prerender.time.sleep'), \
+                mock.patch('store.prerender.connections') as connections, \
+                mock.patch.object(self.queue, 'run', side_effect=flaky_run), \
+                self.assertLogs('store.prerender', 'ERROR'):
+            self.queue._work()
+        self.assertEqual(len(passes), 2)
+        connections.close_all.assert_called_once_with()
+        self.assertFalse(self.queue._worker_running)
+
+
+class PrerenderCommandTests(StaticSiteMixin, TransactionTestCase):
+    """Bulk writes skip the signals; the commands regenerate (after their commits) before exiting."""
+
+    def test_reprice_rebuilds_every_page(self):
+        call_command('refresh_btc_rate', '--provider', 'store.tests.FixedRateProvider', stdout=StringIO())
+        self.assertIn('130000', self.page('/store/products/'))
+        self.assertIn('130000', self.page(f'/store/product/{self.product.pk}/'))
+
+    def test_import_regenerates_imported_products(self):
+        path = os.path.join(self.site.directory, 'products.jsonl')
+        with open(path, 'w') as fh:
+            fh.write(json.dumps({'sku': 'NEW-1', 'name': 'Imported', 'price': '1.00', 'price_sats': 5_000}) + '\n')
+        call_command('import_products', path, stdout=StringIO())
+        imported = Product.objects.get(sku='NEW-1')
+        self.assertIn('Imported', self.page('/store/products/'))
+        self.assertIn('Imported', self.page(f'/store/product/{imported.pk}/'))
+
+
+class FixedRateProvider(StubRateProvider):
+    def __init__(self):
+        super().__init__('50000')
+
+
+class MoneyTests(SimpleTestCase):
+    def test_btc_to_sats_rounds_half_up(self):
+        self.assertEqual(btc_to_sats('0.00012345'), 12_345)
+        self.assertEqual(btc_to_sats(Decimal('0.000000005')), 1)
+        self.assertEqual(btc_to_sats(Decimal('0.000000004999')), 0)
+        self.assertEqual(btc_to_sats(21), 2_100_000_000)
+        self.assertEqual(btc_to_sats(0.1), 10_000_000)  # via str(), not the float's binary value
+        self.assertIsNone(btc_to_sats(None))
+
+    def test_sats_to_btc_keeps_eight_places(self):
+        self.assertEqual(str(sats_to_btc(12_000)), '0.00012000')
+        self.assertEqual(sats_to_btc(1), Decimal('0.00000001'))
+        self.assertIsNone(sats_to_btc(None))
+
+    def test_format_btc(self):
+        self.assertEqual(format_btc(12_000), '0.00012000')
+        self.assertEqual(format_btc(2_100_000_000_000_000), '21000000.00000000')
+        self.assertEqual(format_btc(-1), '-0.00000001')
+        self.assertIsNone(format_btc(None))
+
+    def test_round_trip(self):
+        for sats in (0, 1, 99_999_999, 100_000_001, 123_456_789_012):
+            self.assertEqual(btc_to_sats(sats_to_btc(sats)), sats)
+            self.assertEqual(btc_to_sats(format_btc(sats)), sats)
+
+
+class IntegerSatsMigrationTests(TransactionTestCase):
+    """0043 moves BTC decimals to integer sats; SQLite stores the decimals as REAL."""
+    before = [('store', '0042_product_recommendations')]
+    after = [('store', '0043_integer_sats')]
+    # Stored as REAL, several of these come back a hair under a whole number of sats
+    PRICES = ['0.00012345', '0.29', '1.00000001', '0.00000003', '9999999.99999999']
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        executor.loader.build_graph()
+        return executor.loader.project_state(targets).apps
+
+    def setUp(self):
+        self.addCleanup(call_command, 'migrate', verbosity=0)
+        apps = self.migrate(self.before)
+        Product = apps.get_model('store', 'Product')
+        self.products = [
+            Product.objects.create(name=price, description='', price=1, price_btc=Decimal(price)) for price in self.PRICES
+        ]
+        Product.objects.create(name='fiat only', description='', price=1)
+        order = apps.get_model('store', 'Order').objects.create()
+        cart = apps.get_model('store', 'Cart').objects.create()
+        for product in self.products:
+            apps.get_model('store', 'OrderItem').objects.create(order=order, product=product, price=1, price_btc=product.price_btc)
+            apps.get_model('store', 'CartItem').objects.create(cart=cart, product=product)
+
+    def test_forward_rounds_to_the_nearest_sat(self):
+        apps = self.migrate(self.after)
+        expected = {price: btc_to_sats(price) for price in self.PRICES}
+        Product = apps.get_model('store', 'Product')
+        self.assertEqual(dict(Product.objects.filter(name__in=self.PRICES).values_list('name', 'price_sats')), expected)
+        self.assertIsNone(Product.objects.get(name='fiat only').price_sats)
+        for model, field in (('OrderItem', 'price_sats'), ('CartItem', 'unit_price_sats')):
+            rows = apps.get_model('store', model).objects.values_list('product__name', field)
+            self.assertEqual(dict(rows), expected, model)
+
+    def test_reverse_restores_btc_amounts(self):
+        self.migrate(self.after)
+        apps = self.migrate(self.before)
+        expected = {price: Decimal(price) for price in self.PRICES}
+        self.assertEqual(dict(apps.get_model('store', 'Product').objects.filter(name__in=self.PRICES).values_list('name', 'price_btc')), expected)
+        self.assertEqual(dict(apps.get_model('store', 'OrderItem').objects.values_list('product__name', 'price_btc')), expected)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class StationIndexTests(SimpleTestCase):
+    STATIONS = 30_000
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = random.Random(420)
+        # Half spread over the globe, half clustered in one city (worst case for a grid)
+        cls.points = [(i, rng.uniform(-90, 90), rng.uniform(-180, 180)) for i in range(cls.STATIONS // 2)]
+        cls.points += [
+            (i, -1.29 + rng.gauss(0, 0.05), 36.82 + rng.gauss(0, 0.05))
+            for i in range(cls.STATIONS // 2, cls.STATIONS)
+        ]
+        cls.index = StationIndex(cls.points)
+        cls.queries = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(60)]
+        cls.queries += [(-1.29 + rng.gauss(0, 0.05), 36.82 + rng.gauss(0, 0.05)) for _ in range(20)]
+        cls.queries += [(90, 0), (-90, 0), (0, 180), (0, -179.999), (89.9, 45)]
+
+    def brute_force(self, latitude, longitude, k):
+        distances = sorted(haversine_km(latitude, longitude, lat, lon) for _, lat, lon in self.points)
+        return distances[:k]
+
+    def test_matches_brute_force(self):
+        for latitude, longitude in self.queries:
+            result = self.index.nearest(latitude, longitude, k=5)
+            expected = self.brute_force(latitude, longitude, 5)
+            self.assertEqual(len(result), 5)
+            for (_, distance), want in zip(result, expected):
+                self.assertAlmostEqual(distance, want, delta=1e-6)
+
+    def test_results_are_sorted_and_bounded_by_k(self):
+        result = self.index.nearest(-1.29, 36.82, k=20)
+        self.assertEqual(len(result), 20)
+        self.assertEqual([d for _, d in result], sorted(d for _, d in result))
+        self.assertEqual(len(StationIndex(self.points[:3]).nearest(0, 0, k=10)), 3)
+        self.assertEqual(StationIndex([]).nearest(0, 0), [])
+
+
+class NearestStationsApiTests(TestCase):
+    def setUp(self):
+        # Station saves bump the index version once their transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_stations()
+
+    def create_stations(self):
+        self.cbd = DeliveryStation.objects.create(name='CBD', location='Moi Ave', latitude=-1.2841, longitude=36.8250)
+        self.westlands = DeliveryStation.objects.create(
+            name='Westlands', location='Waiyaki Way', latitude=-1.2676, longitude=36.8108
+        )
+        self.mombasa = DeliveryStation.objects.create(
+            name='Mombasa', location='Moi Ave', latitude=-4.0435, longitude=39.6682
+        )
+        DeliveryStation.objects.create(name='No coordinates', location='?')
+
+    def nearest(self, **params):
+        response = self.client.get('/store/api/stations/nearest/', params)
+        self.assertEqual(response.status_code, 200)
+        return [station['name'] for station in response.json()['stations']]
+
+    def test_nearest_first(self):
+        self.assertEqual(self.nearest(lat=-1.2864, lon=36.8172, k=3), ['CBD', 'Westlands', 'Mombasa'])
+        self.assertEqual(self.nearest(lat=-4.05, lon=39.66, k=1), ['Mombasa'])
+
+    def test_index_follows_station_changes(self):
+        self.assertEqual(self.nearest(lat=-1.2864, lon=36.8172, k=1), ['CBD'])
+        self.cbd.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cbd.save()
+            # Not bumped until the save commits
+            self.assertEqual(self.nearest(lat=-1.2864, lon=36.8172, k=1), ['CBD'])
+        self.assertEqual(self.nearest(lat=-1.2864, lon=36.8172, k=1), ['Westlands'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.westlands.delete()
+        self.assertEqual(self.nearest(lat=-1.2864, lon=36.8172, k=5), ['Mombasa'])
+
+    def test_bump_from_another_process_rebuilds_the_index(self):
+        self.assertEqual(self.nearest(lat=-1.2864, lon=36.8172, k=1), ['CBD'])
+        # A bulk update skips the signals; its bump lands in the shared cache
+        DeliveryStation.objects.filter(pk=self.cbd.pk).update(is_active=False)
+        self.assertEqual(self.nearest(lat=-1.2864, lon=36.8172, k=1), ['CBD'])
+        caches['shared'].set(STATIONS_VERSION_KEY, 'bumped elsewhere', None)
+        self.assertEqual(self.nearest(lat=-1.2864, lon=36.8172, k=1), ['Westlands'])
+
+    def test_invalid_coordinates(self):
+        for params in ({}, {'lat': 'x', 'lon': 1}, {'lat': 91, 'lon': 0}):
+            response = self.client.get('/store/api/stations/nearest/', params)
+            self.assertEqual(response.status_code, 400)
+
+
+# The token is masked afresh on every render, so compare everything else
+CSRF_TOKEN = re.compile(r"('X-CSRFToken': ')[^']*'")
+
+
+def without_csrf(html):
+    return CSRF_TOKEN.sub(r"\1'", html)
+
+
+@skipUnless(jinja2, 'Jinja2 is not installed')
+@override_settings(TEMPLATES=[settings.TEMPLATES[0], settings.JINJA2_TEMPLATE_ENGINE])
+class StorefrontTemplateParityTests(TestCase):
+    """The jinja2/ storefront templates must render byte-for-byte like templates/."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            Product.objects.create(
+                name='Plain', description='One two three four five six seven eight nine ten eleven twelve '
+                'thirteen fourteen fifteen sixteen seventeen eighteen nineteen twenty twenty-one twenty-two',
+                price=10, price_sats=1,
+            ),
+            Product.objects.create(
+                name='Quotes "&" <b>tags</b>', description="It's <script>alert('x')</script>",
+                price=Decimal('12.50'), price_sats=125_000_000, max_per_order=2,
+            ),
+            Product.objects.create(name='No BTC price', description='', price=3, price_sats=None),
+        ]
+        ProductRecommendation.objects.create(product=cls.products[0], recommended=cls.products[1], rank=1, score=4)
+        cls.cart = Cart.objects.create()
+        for product in cls.products:
+            CartItem.objects.create(cart=cls.cart, product=product, quantity=2)
+        cls.order = Order.objects.create(bitcoin_address='tb1qexample', bitcoin_amount=Decimal('0.00012000'))
+
+    def assertSameOutput(self, template, context, request=None):
+        # Copies: the Jinja2 backend adds request and csrf_token to the dict it's given
+        django_html = render_to_string(template, dict(context), request, using='django')
+        jinja_html = render_to_string(template, dict(context), request, using='jinja2')
+        if request is not None:
+            django_html, jinja_html = without_csrf(django_html), without_csrf(jinja_html)
+        self.assertEqual(django_html, jinja_html, template)
+
+    def test_templates_render_identically(self):
+        request = RequestFactory().get('/')
+        products = Product.objects.all()
+        cases = [
+            ('core/about.html', {}),
+            ('core/home.html', {'featured_products': products[:3]}),
+            ('store/product_list.html', {'products': products, 'cart_count': 3}),
+            ('store/product_list.html', {'products': []}),
+            ('store/product_detail.html', {'product': self.products[0], 'recommendations': [self.products[1]]}),
+            ('store/product_detail.html', {'product': self.products[2], 'recommendations': [], 'static_page': True}),
+            ('store/cart.html', {
+                'cart_items': self.cart.items.select_related('product'), 'cart_total': self.cart.get_total_btc(),
+                'cart_count': self.cart.item_count,
+            }),
+            ('store/cart.html', {'cart_items': []}),
+            ('store/order_detail.html', {
+                'order': self.order, 'qr_code': '/store/qr/abc.svg', 'bitcoin_uri': self.order.payment_uri,
+            }),
+        ]
+        for template, context in cases:
+            with self.subTest(template=template):
+                self.assertSameOutput(template, context, request)
+                self.assertSameOutput(template, context)
+
+    def test_views_render_identically(self):
+        urls = ['/', '/about/', '/store/products/', f'/store/product/{self.products[0].pk}/', '/store/cart/']
+        for url in urls:
+            with self.subTest(url=url):
+                with override_settings(STOREFRONT_TEMPLATE_ENGINE='django'):
+                    django_html = self.client.get(url).content.decode()
+                with override_settings(STOREFRONT_TEMPLATE_ENGINE='jinja2'):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(without_csrf(django_html), without_csrf(response.content.decode()))
+
+
+class AdaptiveLimiterTests(SimpleTestCase):
+    def test_sheds_once_queue_is_full(self):
+        limiter = AdaptiveLimiter('test', limit=1, max_queue=0)
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+        limiter.release(0.01)
+        self.assertTrue(limiter.acquire())
+
+    def test_queued_thread_gets_released_slot(self):
+        limiter = AdaptiveLimiter('test', limit=1, queue_timeout=5)
+        self.assertTrue(limiter.acquire())
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+        waiter.start()
+        time.sleep(0.05)
+        limiter.release(0.01)
+        waiter.join()
+        self.assertEqual(results, [True])
+        self.assertEqual(limiter.in_flight, 1)
+
+    def test_queue_deadline(self):
+        limiter = AdaptiveLimiter('test', limit=1, queue_timeout=0.05)
+        limiter.acquire()
+        started = time.monotonic()
+        self.assertFalse(limiter.acquire())
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual((limiter.in_flight, limiter.queued), (1, 0))
+
+    def test_async_waiters_are_served_in_order(self):
+        limiter = AdaptiveLimiter('test', limit=1, queue_timeout=1, max_queue=2)
+
+        async def scenario():
+            self.assertTrue(await limiter.aacquire())
+            first = asyncio.ensure_future(limiter.aacquire())
+            second = asyncio.ensure_future(limiter.aacquire())
+            await asyncio.sleep(0.01)
+            self.assertFalse(await limiter.aacquire())  # queue full
+            limiter.release(0.01)
+            self.assertTrue(await first)
+            self.assertFalse(second.done())
+            limiter.release(0.01)
+            self.assertTrue(await second)
+
+        asyncio.run(scenario())
+        self.assertEqual((limiter.in_flight, limiter.queued), (1, 0))
+
+    def test_limit_follows_latency(self):
+        limiter = AdaptiveLimiter('test', limit=10, max_limit=20, target_latency=0.05)
+        with mock.patch('store.concurrency.time.monotonic', return_value=1000.0) as monotonic:
+            for _ in range(5):
+                limiter.acquire()
+                limiter.release(1.0)
+            self.assertEqual(int(limiter.limit), 9)  # one cut per latency window, not one per request
+            monotonic.return_value += 0.1  # next window
+            limiter.acquire()
+            limiter.release(1.0)
+        self.assertEqual(int(limiter.limit), 8)
+
+        limiter = AdaptiveLimiter('test', limit=4, max_limit=6, target_latency=1.0)
+        for _ in range(50):
+            while limiter.in_flight < int(limiter.limit):  # saturated
+                limiter.acquire()
+            limiter.release(0.01)
+        self.assertEqual(limiter.limit, 6)
+
+        idle = AdaptiveLimiter('test', limit=4, max_limit=8, target_latency=1.0)
+        for _ in range(20):
+            idle.acquire()
+            idle.release(0.01)
+        self.assertEqual(idle.limit, 4)  # never held anything back, so no growth
+
+
+class LoadSheddingMiddlewareTests(TestCase):
+    def setUp(self):
+        concurrency._limits = None
+        self.addCleanup(setattr, concurrency, '_limits', None)
+
+    @override_settings(CONCURRENCY_LIMITS={'browse': {'limit': 1, 'max_queue': 0}})
+    def test_sheds_with_retry_after(self):
+        limiter = concurrency.get_concurrency_limits().limiters['browse']
+        self.assertEqual(self.client.get('/about/').status_code, 200)
+        limiter.acquire()
+        response = self.client.get('/about/')
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+        self.assertContains(response, 'Server busy', status_code=503)
+        # Other classes are unaffected
+        self.assertEqual(self.client.get('/store/api/cart/').status_code, 200)
+        limiter.release()
+        self.assertEqual(self.client.get('/about/').status_code, 200)
+
+    @override_settings(CONCURRENCY_LIMITS={
+        'checkout': {'limit': 1, 'max_queue': 0}, 'poll': {'limit': 1, 'max_queue': 0},
+    })
+    def test_polls_do_not_queue_behind_checkout(self):
+        limiters = concurrency.get_concurrency_limits().limiters
+        order = Order.objects.create(bitcoin_address='tb1qexample', bitcoin_amount=Decimal('0.001'))
+        url = f'/store/api/order-status/{order.order_number}/'
+        limiters['checkout'].acquire()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        limiters['poll'].acquire()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['success'], False)
@@ -0,0 +1,59 @@
+# store/versions.py
+import functools
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+# Code and templates that shape the HTML, for the default deploy stamp
+DEPLOY_SOURCE_DIRS = ('templates', 'jinja2', 'core', 'store', 'marketplace_420')
+DEPLOY_SOURCE_SUFFIXES = ('.py', '.html')
+
+# Change stamps live in the 'shared' cache, so a bump from any process (a web
+# worker, a management command) reaches all the others.
+VERSION_CACHE = 'shared'
+
+
+def get_version(key):
+    """Opaque stamp for ``key`` that changes whenever it is bumped."""
+    version = caches[VERSION_CACHE].get(key)
+    if version is None:
+        version = bump_version(key)
+    return version
+
+
+def bump_version(key):
+    version = f"{timezone.now().timestamp():.6f}"
+    caches[VERSION_CACHE].set(key, version, None)
+    return version
+
+
+@functools.cache
+def get_deploy_version():
+    """
+    Stamp of the deployed code and templates, for ETags that must not outlive
+    a deploy: settings.DEPLOY_VERSION (say, the release's commit) if set, else
+    a hash of the source files' sizes and mtimes, read once per process.
+    """
+    if settings.DEPLOY_VERSION:
+        return settings.DEPLOY_VERSION
+    digest = hashlib.sha256()
+    for name in DEPLOY_SOURCE_DIRS:
+        for root, dirs, files in os.walk(settings.BASE_DIR / name):
+            dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+            for filename in sorted(files):
+                if filename.endswith(DEPLOY_SOURCE_SUFFIXES):
+                    stat = os.stat(os.path.join(root, filename))
+                    digest.update(f"{root}/{filename}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:12]
+
+
+@receiver(setting_changed)
+def reset_deploy_version(setting, **kwargs):
+    # override_settings(DEPLOY_VERSION=...) takes effect on the next get_deploy_version()
+    if setting == 'DEPLOY_VERSION':
+        get_deploy_version.cache_clear()
@@ -1,41 +1,91 @@
-from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from django.views.decorators.csrf import csrf_exempt
-from .models import Product, Order, OrderItem, Cart, CartItem, EncryptedMessage
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import condition
+from django.conf import settings
+from .addresses import AddressPoolEmpty, claim_address
+from .catalog import get_catalog_version
+from .events import record_status_change
+from .messaging import get_message_cipher
+from .money import format_btc, sats_to_btc
+from .models import Product, Order, OrderItem, Cart, CartItem, EncryptedMessage, ProductRecommendation
+from .qr import QR_FORMATS, get_qr_cache
+from .rates import get_rate_snapshot
+from .recommendations import get_recommendations_version
+from .stations import nearest_stations
+from .versions import get_deploy_version
+import base64
 import json
+import logging
+import uuid
+from django.db import transaction
 from django.utils import timezone
-from datetime import timedelta
-import socket
+from django.db.models import Prefetch, Q
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# Conditional GET helpers
+# ----------------------------
+def cart_stamp(request):
+    # The cart badge is the only per-visitor part of catalog pages
+    cart = getattr(request, 'cart', None)
+    return f"{cart.pk}.{cart.updated_at.timestamp():.6f}" if cart else 'nocart'
+
+def catalog_etag(request, *args, **kwargs):
+    # Shared-cache lookup only, no DB: safe to evaluate before async views too, and
+    # bumps from other processes (imports, repricing) show up straight away. The deploy
+    # stamp retires every ETag when code or templates change.
+    return f'W/"{get_deploy_version()}-{get_catalog_version()}-{cart_stamp(request)}"'
+
+def product_etag(request, *args, **kwargs):
+    # Detail pages also show recommendations, which change as orders are paid
+    return (f'W/"{get_deploy_version()}-{get_catalog_version()}-{get_recommendations_version()}-'
+            f'{cart_stamp(request)}"')
 
 # ----------------------------
 # Product Views
 # ----------------------------
+@condition(etag_func=catalog_etag)
 def product_list(request):
     products = Product.objects.filter(is_active=True)
     return render(request, 'store/product_list.html', {
         'products': products,
         'cart_count': request.cart.get_item_count() if hasattr(request, 'cart') else 0
-    })
-
-def product_detail(request, product_id):
-    product = get_object_or_404(Product, id=product_id, is_active=True)
+    }, using=settings.STOREFRONT_TEMPLATE_ENGINE)
+
+@condition(etag_func=product_etag)
+async def product_detail(request, product_id):
+    product = await aget_object_or_404(Product, id=product_id, is_active=True)
+    # One read of the precomputed top-k, via the (product, rank) unique index
+    recommendations = [
+        rec.recommended
+        async for rec in ProductRecommendation.objects.filter(product=product, recommended__is_active=True)
+        .select_related('recommended').order_by('rank')
+    ]
     return render(request, 'store/product_detail.html', {
         'product': product,
-        'cart_count': request.cart.get_item_count() if hasattr(request, 'cart') else 0
-    })
+        'recommendations': recommendations,
+        'cart_count': request.cart.item_count if hasattr(request, 'cart') else 0
+    }, using=settings.STOREFRONT_TEMPLATE_ENGINE)
 
 # ----------------------------
 # Cart Views
 # ----------------------------
 @csrf_exempt
-def add_to_cart(request):
+async def add_to_cart(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
             product_id = data.get('product_id')
             quantity = int(data.get('quantity', 1))
 
-            product = get_object_or_404(Product, id=product_id, is_active=True)
+            product = await aget_object_or_404(Product, id=product_id, is_active=True)
             cart = request.cart
 
             # Check stock and limits
@@ -44,34 +94,47 @@ def add_to_cart(request):
             if quantity > product.max_per_order:
                 return JsonResponse({'success': False, 'error': f'Max {product.max_per_order} per order'})
 
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
-
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
+            # Item and counter change together (transactions can't span awaits)
+            await sync_to_async(_add_cart_item)(cart, product, quantity)
 
+            total_sats = await cart.aget_total_sats()
             return JsonResponse({
                 'success': True,
                 'message': 'Added to cart',
-                'cart_count': cart.items.count(),
-                'cart_total': float(cart.get_total_btc())
+                'cart_count': cart.item_count,
+                'cart_total': float(sats_to_btc(total_sats)),
+                'cart_total_sats': total_sats,
             })
 
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
 
+def _add_cart_item(cart, product, quantity):
+    with transaction.atomic():
+        cart_item, created = CartItem.objects.get_or_create(
+            cart=cart,
+            product=product,
+            defaults={'quantity': quantity}
+        )
+
+        if not created:
+            cart_item.quantity += quantity
+            cart_item.save(update_fields=['quantity'])
+        cart.touch(item_delta=1 if created else 0)
+
+@never_cache
+async def cart_summary(request):
+    # Fills the cart badge on the pre-rendered catalog pages
+    return JsonResponse({'cart_count': request.cart.item_count})
+
 def cart_view(request):
     cart = request.cart
     return render(request, 'store/cart.html', {
         'cart': cart,
-        'cart_items': cart.items.all(),
+        'cart_items': cart.items.select_related('product'),
         'cart_total': cart.get_total_btc(),
         'cart_count': cart.get_item_count()
-    })
+    }, using=settings.STOREFRONT_TEMPLATE_ENGINE)
 
 @csrf_exempt
 def remove_from_cart(request):
@@ -81,14 +144,21 @@ def remove_from_cart(request):
             product_id = data.get('product_id')
 
             cart = request.cart
-            cart_item = get_object_or_404(CartItem, cart=cart, product_id=product_id)
-            cart_item.delete()
-
+            with transaction.atomic():
+                # The DELETE's row count decides: of two concurrent removes, only one decrements
+                deleted, _ = CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+                if deleted:
+                    cart.touch(item_delta=-1)
+            if not deleted:
+                return JsonResponse({'success': False, 'error': 'Item not in cart'})
+
+            total_sats = cart.get_total_sats()
             return JsonResponse({
                 'success': True,
                 'message': 'Removed from cart',
-                'cart_count': cart.items.count(),
-                'cart_total': float(cart.get_total_btc())
+                'cart_count': cart.item_count,
+                'cart_total': float(sats_to_btc(total_sats)),
+                'cart_total_sats': total_sats,
             })
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
@@ -96,6 +166,8 @@ def remove_from_cart(request):
 # ----------------------------
 # Order Views
 # ----------------------------
+PLACEHOLDER_ADDRESS = 'tb1qexampletestnetaddress'
+
 @csrf_exempt
 def create_order(request):
     if request.method == 'POST':
@@ -106,42 +178,61 @@ def create_order(request):
             cart = request.cart
             client = request.anonymous_client
 
-            if cart.items.count() == 0:
-                return JsonResponse({'success': False, 'error': 'Cart is empty'})
-
-            # Calculate totals
-            total_btc = cart.get_total_btc()
-            total_sats = int(total_btc * 100_000_000)
-
-            # Create order
-            order = Order.objects.create(
-                client=client,
-                bitcoin_address="tb1qexampletestnetaddress",
-                bitcoin_amount=total_btc,   # ✅ updated field
-                amount_sats=total_sats,
-                delivery_option=delivery_option,
-                status='pending',
-                ip_hash=client.ip_hash
-            )
-
-            # Add order items
-            for cart_item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    quantity=cart_item.quantity,
-                    price=cart_item.product.price,
-                    price_btc=cart_item.product.price_btc
-                )
-
-            # Clear cart and create new one
-            cart.items.all().delete()
-            cart.is_active = False
-            cart.save()
-            new_cart = Cart.objects.create(client=client)
-            request.cart = new_cart
+            # The rate the catalog is priced with, read before the prices it explains
+            rate = get_rate_snapshot()
 
-            qr_code = order.generate_qr_code() if hasattr(order, 'generate_qr_code') else None
+            with transaction.atomic():
+                # Retire the cart first: that UPDATE takes the write lock, so no item can slip in
+                # between reading the cart and clearing it, and a second submit finds no active cart
+                retired = Cart.objects.filter(pk=cart.pk, is_active=True).update(
+                    is_active=False, item_count=0, updated_at=timezone.now()
+                )
+                # The cart shows current catalog prices, so that's what is charged
+                cart_items = list(cart.items.select_related('product')) if retired else []
+                if not cart_items:
+                    transaction.set_rollback(True)
+                    return JsonResponse({'success': False, 'error': 'Cart is empty'})
+
+                total_sats = sum(item.price_sats * item.quantity for item in cart_items)
+
+                # Fresh pre-derived address per order, claimed in the order's transaction so a
+                # failed checkout returns it to the pool; the placeholder is for setups without an xpub
+                receiving_address = claim_address() if settings.ADDRESS_POOL_XPUB else None
+
+                # Create order
+                order = Order.objects.create(
+                    client=client,
+                    bitcoin_address=receiving_address.address if receiving_address else PLACEHOLDER_ADDRESS,
+                    receiving_address=receiving_address,
+                    bitcoin_amount=sats_to_btc(total_sats),
+                    amount_sats=total_sats,
+                    btc_rate=rate.fiat_per_btc if rate else None,
+                    delivery_option=delivery_option,
+                    status='pending',
+                    ip_hash=client.ip_hash
+                )
+                client.increment_order_count()
+                record_status_change(order, '')
+
+                # Add order items
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product=cart_item.product,
+                        quantity=cart_item.quantity,
+                        price=cart_item.product.price,
+                        price_sats=cart_item.price_sats
+                    )
+                    for cart_item in cart_items
+                ])
+
+                # Clear cart and create new one
+                cart.items.all().delete()
+                new_cart = Cart.objects.create(client=client)
+                request.cart = new_cart
+
+            # The order exists from here on: a QR failure must not report it as failed
+            qr_code = payment_qr_code(order)
 
             return JsonResponse({
                 'success': True,
@@ -154,21 +245,43 @@ def create_order(request):
                 'delivery_option': order.delivery_option
             })
 
+        except AddressPoolEmpty:
+            return JsonResponse({'success': False, 'error': 'Payment addresses temporarily unavailable, try again shortly'})
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
 
-def order_status(request, order_id):
-    order = get_object_or_404(Order, order_number=order_id)
-
-    # Mock payment check
+def payment_qr_code(order):
+    """URL of the order's payment QR code, or None when it can't be rendered (pages work without it)."""
+    try:
+        return order.generate_qr_code()
+    except Exception:
+        logger.exception('Rendering the payment QR code of order %s failed', order.order_number)
+        return None
+
+def apply_mock_payment(order):
+    """
+    Mark a pending order paid once the (mock) payment check passes, and
+    record the event. The UPDATE only matches while the order is still
+    pending, so when several polls race, exactly one records the payment.
+    """
     mock_paid = (timezone.now() - order.created_at) > timedelta(minutes=2)
-
-    if mock_paid and order.status == 'pending':
+    if not (mock_paid and order.status == 'pending'):
+        return False
+
+    with transaction.atomic():
+        now = timezone.now()
+        if not Order.objects.filter(pk=order.pk, status='pending').update(status='paid', updated_at=now):
+            # Another request got there first
+            order.refresh_from_db(fields=['status', 'updated_at'])
+            return False
         order.status = 'paid'
-        order.tx_hash = getattr(order, 'tx_hash', 'mock_tx_hash_12345')
-        order.save()
+        order.updated_at = now
+        record_status_change(order, 'pending')
+    order.tx_hash = getattr(order, 'tx_hash', 'mock_tx_hash_12345')
+    return True
 
-    return JsonResponse({
+def order_status_data(order):
+    return {
         'order_id': str(order.order_number),
         'status': order.status,
         'bitcoin_amount': float(order.bitcoin_amount),
@@ -176,34 +289,274 @@ def order_status(request, order_id):
         'tx_hash': getattr(order, 'tx_hash', ''),
         'expired': getattr(order, 'is_expired', lambda: False)(),
         'delivery_option': order.delivery_option
-    })
+    }
+
+async def order_status(request, order_id):
+    # Cheap stamp first: the status payload only changes with updated_at, or
+    # when a pending order becomes eligible for the (mock) payment check
+    stamp = await Order.objects.filter(order_number=_parse_uuid(order_id)).values_list(
+        'updated_at', 'status', 'created_at'
+    ).afirst()
+    if stamp is None:
+        raise Http404
+    updated_at, status, created_at = stamp
+    etag = quote_etag(f"{updated_at.timestamp():.6f}")
+    payment_due = status == 'pending' and (timezone.now() - created_at) > timedelta(minutes=2)
+    if not payment_due:
+        response = get_conditional_response(request, etag=etag, last_modified=int(updated_at.timestamp()))
+        if response is not None:
+            return response
+
+    order = await aget_object_or_404(Order, order_number=order_id)
+
+    await sync_to_async(apply_mock_payment)(order)
+
+    response = JsonResponse(order_status_data(order))
+    response['ETag'] = quote_etag(f"{order.updated_at.timestamp():.6f}")
+    response['Last-Modified'] = http_date(order.updated_at.timestamp())
+    return response
 
 def order_detail(request, order_id):
     order = get_object_or_404(Order, order_number=order_id)
-    qr_code = order.generate_qr_code() if hasattr(order, 'generate_qr_code') else None
+    qr_code = payment_qr_code(order)
 
     return render(request, 'store/order_detail.html', {
         'order': order,
         'qr_code': qr_code,
-        'bitcoin_uri': f"bitcoin:{order.bitcoin_address}?amount={order.bitcoin_amount}",
+        'bitcoin_uri': order.payment_uri,
         'cart_count': request.cart.get_item_count() if hasattr(request, 'cart') else 0
-    })
+    }, using=settings.STOREFRONT_TEMPLATE_ENGINE)
+
+# ----------------------------
+# Order history
+# ----------------------------
+ORDER_HISTORY_PAGE_SIZE = 20
+ORDER_HISTORY_MAX_PAGE_SIZE = 100
+
+def encode_order_cursor(order):
+    raw = f"{order.created_at.isoformat()}|{order.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_order_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split('|')
+        created_at = datetime.fromisoformat(created_at)
+        return created_at, int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def order_history(request):
+    """
+    The visitor's orders, newest first. Keyset-paginated on (created_at, id)
+    via the (client, created_at) index, so every page costs the same two
+    queries no matter how deep: the orders, then their items with products.
+    Pass the returned "next" value back as ?cursor= for the following page.
+    """
+    try:
+        limit = min(int(request.GET.get('limit', ORDER_HISTORY_PAGE_SIZE)), ORDER_HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid limit'}, status=400)
+    if limit < 1:
+        return JsonResponse({'success': False, 'error': 'Invalid limit'}, status=400)
+
+    orders = Order.objects.filter(client=request.anonymous_client)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        position = decode_order_cursor(cursor)
+        if position is None:
+            return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+        created_at, pk = position
+        orders = orders.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+    page = list(
+        orders.order_by('-created_at', '-pk')
+        .only('order_number', 'status', 'created_at', 'amount_sats', 'delivery_option')
+        .prefetch_related(Prefetch(
+            'items',
+            queryset=OrderItem.objects.select_related('product').only(
+                'order_id', 'quantity', 'price_sats', 'product__name'
+            ).order_by('pk'),
+        ))[:limit + 1]
+    )
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    return JsonResponse({
+        'orders': [
+            {
+                'id': str(order.order_number),
+                'status': order.status,
+                'created_at': order.created_at.isoformat(),
+                'btc': format_btc(order.amount_sats),
+                'sats': order.amount_sats,
+                'delivery': order.delivery_option,
+                # [product_id, name, quantity, unit price in BTC]
+                'items': [
+                    [item.product_id, item.product.name, item.quantity, format_btc(item.price_sats)]
+                    for item in order.items.all()
+                ],
+            }
+            for order in page
+        ],
+        'next': encode_order_cursor(page[-1]) if has_more else None,
+    }, json_dumps_params={'separators': (',', ':')})
+
+def order_qr(request, digest, fmt):
+    # Content-addressed: the URL changes whenever the payment URI does
+    if fmt not in QR_FORMATS:
+        raise Http404
+    content = get_qr_cache().get(digest, fmt)
+    if content is None:
+        raise Http404
+    response = HttpResponse(content, content_type=QR_FORMATS[fmt])
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['ETag'] = f'"{digest}"'
+    return response
+
+# ----------------------------
+# Batch API
+# ----------------------------
+MAX_BATCH_OPERATIONS = 50
+CART_OPERATIONS = ('add', 'set', 'remove')
+
+def cart_snapshot(cart):
+    items = [
+        {
+            'product_id': item.product_id,
+            'name': item.product.name,
+            'quantity': item.quantity,
+            'price_btc': float(item.unit_price_btc),
+            'total_btc': float(item.total_btc),
+            'price_sats': item.price_sats,
+            'total_sats': item.price_sats * item.quantity,
+        }
+        for item in cart.items.select_related('product').order_by('pk')
+    ]
+    total_sats = sum(item['total_sats'] for item in items)
+    return {
+        'cart_count': len(items),
+        'cart_total': float(sats_to_btc(total_sats)),
+        'cart_total_sats': total_sats,
+        'items': items,
+    }
+
+def _parse_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+def _parse_product_id(value):
+    # Same coercion add_to_cart gets from the ORM lookup: 5 and "5" both work
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _apply_cart_operation(cart, op, data, products, cart_items):
+    product = products.get(_parse_product_id(data.get('product_id')))
+    if product is None or not product.is_active:
+        raise ValueError('Product not found')
+    cart_item = cart_items.get(product.pk)
+
+    if op == 'remove':
+        if cart_item is None:
+            raise ValueError('Product not in cart')
+        cart_item.delete()
+        del cart_items[product.pk]
+        return -1
+
+    try:
+        quantity = int(data.get('quantity', 1))
+    except (TypeError, ValueError):
+        raise ValueError('Quantity must be an integer')
+    if quantity < 1:
+        raise ValueError('Quantity must be at least 1')
+    new_quantity = quantity + (cart_item.quantity if cart_item and op == 'add' else 0)
+    # Check stock and limits
+    if new_quantity > product.stock_quantity:
+        raise ValueError('Not enough stock')
+    if new_quantity > product.max_per_order:
+        raise ValueError(f'Max {product.max_per_order} per order')
+
+    if cart_item is None:
+        cart_items[product.pk] = CartItem.objects.create(cart=cart, product=product, quantity=new_quantity)
+        return 1
+    cart_item.quantity = new_quantity
+    cart_item.save(update_fields=['quantity'])
+    return 0
+
+@csrf_exempt
+def batch(request):
+    """
+    Run several cart operations and order-status lookups in one request and one
+    transaction. Body: {"operations": [{"op": "add"|"set"|"remove", "product_id": 1,
+    "quantity": 2}, {"op": "order_status", "order_id": "<uuid>"}, ...]}.
+    A failing operation is rolled back on its own and reported in "results".
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'POST required'}, status=405)
+    try:
+        operations = json.loads(request.body).get('operations')
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    if not isinstance(operations, list) or not operations:
+        return JsonResponse({'success': False, 'error': 'operations must be a non-empty list'}, status=400)
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return JsonResponse({'success': False, 'error': f'At most {MAX_BATCH_OPERATIONS} operations'}, status=400)
+    if not all(isinstance(data, dict) for data in operations):
+        return JsonResponse({'success': False, 'error': 'Each operation must be an object'}, status=400)
+
+    cart = request.cart
+    results = []
+    item_delta = 0
+    with transaction.atomic():
+        # One query each for every product, cart line and order the batch touches
+        product_ids = {_parse_product_id(data.get('product_id')) for data in operations if data.get('op') in CART_OPERATIONS}
+        products = Product.objects.in_bulk(product_ids - {None})
+        cart_items = {item.product_id: item for item in cart.items.filter(product_id__in=products)}
+        order_numbers = {_parse_uuid(data.get('order_id')) for data in operations if data.get('op') == 'order_status'}
+        orders = {o.order_number: o for o in Order.objects.filter(order_number__in=order_numbers - {None})}
+
+        for data in operations:
+            op = data.get('op')
+            try:
+                with transaction.atomic():
+                    if op in CART_OPERATIONS:
+                        item_delta += _apply_cart_operation(cart, op, data, products, cart_items)
+                        results.append({'op': op, 'success': True})
+                    elif op == 'order_status':
+                        order = orders.get(_parse_uuid(data.get('order_id')))
+                        if order is None:
+                            raise ValueError('Order not found')
+                        apply_mock_payment(order)
+                        results.append({'op': op, 'success': True, 'order': order_status_data(order)})
+                    else:
+                        raise ValueError(f'Unknown op: {op}')
+            except ValueError as e:
+                results.append({'op': op, 'success': False, 'error': str(e)})
+
+        if any(r['success'] and r['op'] in CART_OPERATIONS for r in results):
+            cart.touch(item_delta=item_delta)
+        snapshot = cart_snapshot(cart)
+
+    return JsonResponse({'success': True, 'results': results, 'cart': snapshot})
 
 # ----------------------------
 # Client Info
 # ----------------------------
-def client_info(request):
+async def client_info(request):
     client = request.anonymous_client
     ip_address = getattr(request, 'client_ip', None)
 
-    # Simple Tor detection
+    # Simple Tor detection (cached, time-boxed reverse DNS; never blocks the request)
     is_tor = False
     if ip_address:
-        try:
-            hostname = socket.gethostbyaddr(ip_address)[0]
-            is_tor = '.tor.' in hostname.lower()
-        except:
-            pass
+        from .resolver import get_resolver  # thread pool + socket: only this view needs them
+
+        hostname = await get_resolver().aresolve(ip_address)
+        is_tor = bool(hostname) and '.tor.' in hostname.lower()
 
     return JsonResponse({
         'client_id': client.get_anonymous_identifier(),
@@ -211,8 +564,8 @@ def client_info(request):
         'ip_hash': client.ip_hash[:8] + '••••••••' if client.ip_hash else "N/A",
         'is_tor': is_tor,
         'session_active': True,
-        'orders_count': Order.objects.filter(client=client).count(),
-        'cart_count': request.cart.get_item_count() if hasattr(request, 'cart') else 0
+        'orders_count': client.order_count,
+        'cart_count': request.cart.item_count if hasattr(request, 'cart') else 0
     })
 
 # ----------------------------
@@ -233,11 +586,8 @@ def send_message(request):
             if order.client != client:
                 return JsonResponse({'success': False, 'error': 'Not authorized'})
 
-            message = EncryptedMessage.objects.create(
-                order=order,
-                client=client,
-                message_type=message_type
-            )
+            # Encrypt before saving: one INSERT, plaintext never hits the table
+            message = EncryptedMessage(order=order, client=client, message_type=message_type)
             message.encrypt_message(content)
             message.save()
 
@@ -249,3 +599,75 @@ def send_message(request):
 
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
+
+# ----------------------------
+# Message inbox
+# ----------------------------
+INBOX_PAGE_SIZE = 50
+INBOX_MAX_PAGE_SIZE = 200
+
+def order_messages(request, order_id):
+    """
+    A page of an order's messages, newest first, decrypted in one batch with
+    the order's cached key. ?before=<message id> pages backwards.
+    """
+    order = get_object_or_404(Order.objects.only('pk', 'order_number', 'client_id'), order_number=_parse_uuid(order_id))
+    if order.client_id != request.anonymous_client.pk:
+        return JsonResponse({'success': False, 'error': 'Not authorized'}, status=403)
+    try:
+        limit = min(int(request.GET.get('limit', INBOX_PAGE_SIZE)), INBOX_MAX_PAGE_SIZE)
+        before = int(request.GET['before']) if request.GET.get('before') else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid paging parameters'}, status=400)
+    if limit < 1:
+        return JsonResponse({'success': False, 'error': 'Invalid paging parameters'}, status=400)
+
+    messages = EncryptedMessage.objects.filter(order=order, expires_at__gt=timezone.now())
+    if before is not None:
+        messages = messages.filter(pk__lt=before)
+    rows = list(messages.order_by('-pk').values_list(
+        'pk', 'message_type', 'encryption_key', 'encrypted_content', 'created_at'
+    )[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    contents = get_message_cipher().decrypt_many(
+        order.order_number, [(message_type, key_id, token) for _, message_type, key_id, token, _ in rows]
+    )
+    return JsonResponse({
+        'messages': [
+            {'id': pk, 'type': message_type, 'content': content, 'created_at': created_at.isoformat()}
+            for (pk, message_type, _, _, created_at), content in zip(rows, contents)
+        ],
+        'next': rows[-1][0] if has_more else None,
+    }, json_dumps_params={'separators': (',', ':')})
+
+# ----------------------------
+# Delivery stations
+# ----------------------------
+MAX_NEAREST_STATIONS = 50
+
+def nearest_stations_view(request):
+    """The k nearest active pickup stations to ?lat=&lon= (k defaults to 5)."""
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lon'])
+        k = min(int(request.GET.get('k', 5)), MAX_NEAREST_STATIONS)
+    except (KeyError, ValueError):
+        return JsonResponse({'success': False, 'error': 'lat and lon are required'}, status=400)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'success': False, 'error': 'Coordinates out of range'}, status=400)
+
+    return JsonResponse({
+        'stations': [
+            {
+                'id': station.pk,
+                'name': station.name,
+                'location': station.location,
+                'latitude': station.latitude,
+                'longitude': station.longitude,
+                'distance_km': round(distance, 3),
+            }
+            for station, distance in nearest_stations(latitude, longitude, k)
+        ],
+    }, json_dumps_params={'separators': (',', ':')})